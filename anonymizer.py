@@ -1,44 +1,707 @@
 #!/usr/bin/env python3
 
-import collections
+import argparse
+import array
+import collections.abc
+import concurrent.futures
 import contextlib
 import csv
 import datetime
+import hashlib
+import hmac
 import io
+import json
+import mmap
+import multiprocessing
 import os.path
-import random
+import pickle
+import posixpath
 import re
+import secrets
+import shutil
+import struct
 import sys
+import tempfile
+import threading
+import time
 import zipfile
+import zlib
 from abc import abstractmethod
 from enum import Enum, auto
+from multiprocessing import freeze_support
+from multiprocessing.managers import BaseManager
 from pathlib import Path
-from tempfile import NamedTemporaryFile
-from typing import Any, BinaryIO, Callable, ClassVar, Iterable, Iterator, NamedTuple, Optional, Type, TypeVar, Union
+from typing import (
+    TYPE_CHECKING, Any, BinaryIO, Callable, ClassVar, Container, ContextManager, IO, Iterable, Iterator,
+    MutableSequence, NamedTuple, Optional, Sequence, Type, TypeVar, Union,
+)
 
-import toml
-from openpyxl.reader.excel import load_workbook
-# Note: openpyxl was chosen as it's the pandas dependency for loading xlsx documents.
-from openpyxl.workbook import Workbook
-from openpyxl.worksheet.worksheet import Worksheet
-
-from gooey import Gooey, GooeyParser
+# GUI, openpyxl and toml take a good part of the start up time, they're imported only once they're needed.
+if TYPE_CHECKING:
+    # Note: openpyxl was chosen as it's the pandas dependency for loading xlsx documents.
+    from openpyxl.workbook import Workbook
+    from openpyxl.worksheet.worksheet import Worksheet
 
 ENCODED_DIGITS = 16
 ENC_PATTERN = re.compile(r"enc-\d{16}")  # make sure this matches ENCODED_DIGITS
+TOKEN_FORMAT = f'enc-%0{ENCODED_DIGITS}d'
 REPORT_PROGRESS = True
+# Progress is reported at most that often, in seconds.
+PROGRESS_INTERVAL = 1.0
+# Rates and the time left are estimated from that many last reports of progress.
+PROGRESS_RATE_WINDOW = 10
+COPY_CHUNK_SIZE = 1024 * 1024
+# Data files are read through a buffer of that size, reads of each filled buffer are counted for the progress.
+INPUT_BUFFER_SIZE = 64 * 1024
+# Decoding goes through the text in blocks of about that many characters.
+DECODE_BLOCK_SIZE = 1024 * 1024
+# New mappings are appended to the mapping file in batches of that many entries, and after each processed file.
+MAPPING_FLUSH_SIZE = 10000
+# With `--compression-threads`, output members are deflated in blocks of that size.
+DEFLATE_BLOCK_SIZE = 1024 * 1024
+# Compression methods of the output archive, by the name used by `--compression`.
+COMPRESSION_METHODS = {
+    'stored': zipfile.ZIP_STORED,
+    'deflated': zipfile.ZIP_DEFLATED,
+    'bzip2': zipfile.ZIP_BZIP2,
+    'lzma': zipfile.ZIP_LZMA,
+}
+# Levels each method accepts, see `ZipFile`.
+COMPRESSION_LEVELS = {zipfile.ZIP_DEFLATED: range(0, 10), zipfile.ZIP_BZIP2: range(1, 10)}
+# Defaults of `--shard-size` and `--shard-count`, see `OutputArchives`.
+SHARD_SIZE = 1024 ** 3
+SHARD_COUNT = 8
+# With `--jobs`, CSV files at least twice that big are split into parts of about that size, see `CSVConfig.split_file`.
+SPLIT_SIZE = 64 * 1024 * 1024
+# Files aren't split after a record longer than that, e.g. after a quote that isn't closed.
+MAX_SPLIT_RECORD_SIZE = 8 * 1024 * 1024
+SIZE_UNITS = {'': 1, 'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+# Workbooks from inside of archives bigger than that are copied to a temporary file instead of memory.
+XLSX_SPOOL_THRESHOLD = 32 * 1024 * 1024
+
+# Same as `openpyxl.xml.constants.SHEET_MAIN_NS`.
+SHEET_MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+
+# Escapes in expressions which stand for a single character.
+LITERAL_ESCAPES = {'t': '\t', 'n': '\n', 'r': '\r', 'f': '\f', 'v': '\v', 'a': '\a'}
 
 ConfigType = TypeVar('ConfigType', bound='BaseConfig')
 
 
-def random_digits():
-    return ''.join(str(random.randint(0, 9)) for _ in range(ENCODED_DIGITS))
+class TokenAllocator:
+    """
+    Issues random tokens that never collide, without looking them up: the n-th token is n put through a permutation
+    of all numbers of `ENCODED_DIGITS` digits, which is picked by a random key. The permutation is a Feistel network
+    over the two halves of the digits, with keyed BLAKE2 as its round function.
+
+    Only the key and the number of issued tokens are kept, in a file next to the mapping file (see `save`). When the
+    mapping file has tokens that weren't issued this way (from an older version, or with a token key), they are
+    avoided the old way, by looking up each new token (`check_taken`).
+    """
+    ROUNDS: ClassVar[int] = 4
+    HALF: ClassVar[int] = 10 ** (ENCODED_DIGITS // 2)
+
+    def __init__(self, key: Optional[bytes] = None, count: int = 0, check_taken: bool = False):
+        self.key = key if key is not None else secrets.token_bytes(16)
+        # Number of tokens issued with this key, the next token is the permutation of it.
+        self.count = count
+        self.check_taken = check_taken
+        self.round_hashes = [
+            hashlib.blake2b(key=self.key, digest_size=8, person=number.to_bytes(1, 'big'))
+            for number in range(self.ROUNDS)
+        ]
+        self.saved_state: Optional[dict[str, Any]] = None
+
+    def __reduce__(self):
+        # Hash objects can't be pickled, they're made again from the key.
+        return self.__class__, (self.key, self.count, self.check_taken)
+
+    def permute(self, number: int) -> int:
+        left, right = divmod(number, self.HALF)
+        for round_hash in self.round_hashes:
+            round_hash = round_hash.copy()
+            round_hash.update(right.to_bytes(4, 'big'))
+            left, right = right, (left + int.from_bytes(round_hash.digest(), 'big')) % self.HALF
+        return left * self.HALF + right
+
+    def count_of(self, encoded: str) -> int:
+        """Inverse of the permutation: the number of tokens that were issued before this one."""
+        left, right = divmod(int(encoded[4:]), self.HALF)
+        for round_hash in reversed(self.round_hashes):
+            round_hash = round_hash.copy()
+            round_hash.update(left.to_bytes(4, 'big'))
+            left, right = (right - int.from_bytes(round_hash.digest(), 'big')) % self.HALF, left
+        return left * self.HALF + right
+
+    def new_token(self, issued_tokens: Container[int]) -> str:
+        """
+        Issues a token. Digits of the tokens issued before, `issued_tokens`, are only looked at with `check_taken`.
+        """
+        while True:
+            number = self.permute(self.count)
+            self.count += 1
+            if not self.check_taken or number not in issued_tokens:
+                return TOKEN_FORMAT % number
+
+    def new_tokens(self, count: int, issued_tokens: Container[int]) -> list[str]:
+        """Issues `count` tokens at once, same as `new_token`."""
+        permute = self.permute
+        numbers = []
+        while len(numbers) < count:
+            start = self.count
+            self.count += count - len(numbers)
+            numbers.extend(permute(number) for number in range(start, self.count))
+            if self.check_taken:
+                numbers = [number for number in numbers if number not in issued_tokens]
+        return [TOKEN_FORMAT % number for number in numbers]
+
+    @staticmethod
+    def path_for(mapping_path: Path) -> Path:
+        return mapping_path.with_name(f'.{mapping_path.name}.allocator')
+
+    @classmethod
+    def load(cls, mapping_path: Path, encoded_mappings: 'MappingStore') -> 'TokenAllocator':
+        """Allocator that goes on after the tokens of the mapping file, which `encoded_mappings` were loaded from."""
+        try:
+            state = json.loads(cls.path_for(mapping_path).read_text(encoding='utf-8'))
+            allocator = cls(bytes.fromhex(state['key']), state['count'], state['check_taken'])
+        except (OSError, ValueError, KeyError, TypeError):
+            if not len(encoded_mappings):
+                return cls()
+            # Tokens of the mapping file weren't issued by an allocator, or its file is lost.
+            return cls(check_taken=True)
+
+        # Tokens added to the mapping file since, by anything else, don't come out of the permutation below the count.
+        last_token = encoded_mappings.last_token()
+        if last_token is not None and allocator.count_of(last_token) >= allocator.count:
+            allocator.check_taken = True
+        allocator.saved_state = state
+        return allocator
+
+    def save(self, mapping_path: Path) -> None:
+        """
+        Saves the key and the count, when they changed. It's saved before the new mappings are, so that the count is
+        never behind the tokens in the mapping file, even after a crash.
+        """
+        state = {'key': self.key.hex(), 'count': self.count, 'check_taken': self.check_taken}
+        if state == self.saved_state:
+            return
+        path = self.path_for(mapping_path)
+        temp_path = path.with_name(f'{path.name}.tmp')
+        try:
+            with open(temp_path, mode='w', encoding='utf-8') as f:
+                json.dump(state, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, path)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+        self.saved_state = state
+
+
+def keyed_token(token_key: bytes, value: Any, issued_tokens: Container[int]) -> str:
+    """
+    Derives the token from the value with HMAC, so that anyone holding the same key gets the same token.
+
+    When the token is already taken by another value (its digits are in `issued_tokens`), the next attempt is
+    derived in the same way, which keeps the result reproducible for the same set of mapped values.
+    """
+    message = str(value).encode('utf-8')
+    attempt = 0
+    while True:
+        digest = hmac.new(token_key, attempt.to_bytes(4, 'big') + message, hashlib.sha256).digest()
+        number = int.from_bytes(digest[:8], 'big') % 10 ** ENCODED_DIGITS
+        if number not in issued_tokens:
+            return TOKEN_FORMAT % number
+        attempt += 1
+
+
+class MappingStore(collections.abc.Mapping):
+    """
+    Original values and their tokens, in the order in which they were issued. Works like a dict of them, but the
+    only objects kept per entry are the values: tokens are the integers of their digits in an array, and entries
+    are found by open addressing over arrays of their positions. Tokens are looked up through `inverse`, or by
+    their digits through `issued_tokens`. Their table is built only once it's needed.
+    """
+    # Tables are never fuller than that.
+    MAX_LOAD: ClassVar[float] = 2 / 3
+    # Hashes of strings differ between processes unless they're forked, the table of values is built again then.
+    HASH_SAMPLE: ClassVar[str] = 'MappingStore'
+
+    class Inverse(collections.abc.Mapping):
+        """Token -> original value."""
+
+        def __init__(self, store: 'MappingStore'):
+            self.store = store
+
+        def __getitem__(self, encoded: str) -> Any:
+            position = self.store.token_position(int(encoded[4:]))
+            if position < 0:
+                raise KeyError(encoded)
+            return self.store.originals[position]
+
+        def __contains__(self, encoded: Any) -> bool:
+            return self.store.token_position(int(encoded[4:])) >= 0
+
+        def __len__(self) -> int:
+            return len(self.store)
+
+        def __iter__(self) -> Iterator[str]:
+            return self.store.values()
+
+    class IssuedTokens(collections.abc.Container):
+        """Digits of the issued tokens, new ones are checked against them without formatting them."""
+
+        def __init__(self, store: 'MappingStore'):
+            self.store = store
+
+        def __contains__(self, number: Any) -> bool:
+            return self.store.token_position(number) >= 0
+
+    def __init__(self, items: Iterable[tuple[Any, str]] = ()):
+        # Original values and digits of their tokens, by position.
+        self.originals: list[Any] = []
+        self.tokens = array.array('q')
+        # Positions + 1 (0 is an empty slot), by the hash of the value and by the token.
+        self.slots = self._empty_table(8)
+        self.token_slots: Optional[array.array] = None
+        self.inverse = self.Inverse(self)
+        self.issued_tokens = self.IssuedTokens(self)
+        for value, encoded in items:
+            self.add(value, encoded)
+
+    def __reduce__(self):
+        return self.__class__, (), {
+            'originals': self.originals, 'tokens': self.tokens, 'slots': self.slots, 'token_slots': self.token_slots,
+            'hash_sample': hash(self.HASH_SAMPLE),
+        }
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.originals, self.tokens, self.token_slots = state['originals'], state['tokens'], state['token_slots']
+        self.inverse = self.Inverse(self)
+        self.issued_tokens = self.IssuedTokens(self)
+        if state['hash_sample'] == hash(self.HASH_SAMPLE):
+            self.slots = state['slots']
+        else:
+            self.slots = self._build_table(self.originals, hash, len(state['slots']))
+
+    @staticmethod
+    def _empty_table(size: int) -> array.array:
+        return array.array('I', bytes(4 * size))
+
+    @staticmethod
+    def _insert(table: array.array, key_hash: int, position: int) -> None:
+        mask = len(table) - 1
+        # Same probing as `dict`, the higher bits of the hash are mixed in after each taken slot.
+        perturb = key_hash & 0xFFFFFFFFFFFFFFFF
+        index = perturb & mask
+        while table[index]:
+            perturb >>= 5
+            index = (5 * index + perturb + 1) & mask
+        table[index] = position
+
+    @classmethod
+    def _build_table(cls, keys: Sequence[Any], key_hash: Callable[[Any], int], size: int) -> array.array:
+        table = cls._empty_table(size)
+        mask = size - 1
+        # Same as `_insert`, without a call for each key.
+        for position, key in enumerate(keys, 1):
+            perturb = key_hash(key) & 0xFFFFFFFFFFFFFFFF
+            index = perturb & mask
+            while table[index]:
+                perturb >>= 5
+                index = (5 * index + perturb + 1) & mask
+            table[index] = position
+        return table
+
+    def position(self, value: Any) -> int:
+        """Position of the value, -1 when it doesn't have a token."""
+        slots, originals = self.slots, self.originals
+        mask = len(slots) - 1
+        perturb = hash(value) & 0xFFFFFFFFFFFFFFFF
+        index = perturb & mask
+        while slot := slots[index]:
+            if originals[slot - 1] == value:
+                return slot - 1
+            perturb >>= 5
+            index = (5 * index + perturb + 1) & mask
+        return -1
+
+    def token_position(self, number: int) -> int:
+        """Position of the token with these digits, -1 when it isn't issued."""
+        if self.token_slots is None:
+            self.token_slots = self._build_table(self.tokens, int, len(self.slots))
+        token_slots, tokens = self.token_slots, self.tokens
+        mask = len(token_slots) - 1
+        perturb = number
+        index = perturb & mask
+        while slot := token_slots[index]:
+            if tokens[slot - 1] == number:
+                return slot - 1
+            perturb >>= 5
+            index = (5 * index + perturb + 1) & mask
+        return -1
+
+    def __getitem__(self, value: Any) -> str:
+        # Same as `position`, it's called for every encoded value.
+        slots, originals = self.slots, self.originals
+        mask = len(slots) - 1
+        perturb = hash(value) & 0xFFFFFFFFFFFFFFFF
+        index = perturb & mask
+        while slot := slots[index]:
+            if originals[slot - 1] == value:
+                return TOKEN_FORMAT % self.tokens[slot - 1]
+            perturb >>= 5
+            index = (5 * index + perturb + 1) & mask
+        raise KeyError(value)
+
+    def get(self, value: Any, default: Any = None) -> Any:
+        position = self.position(value)
+        return default if position < 0 else TOKEN_FORMAT % self.tokens[position]
+
+    def __contains__(self, value: Any) -> bool:
+        return self.position(value) >= 0
+
+    def __len__(self) -> int:
+        return len(self.originals)
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self.originals)
+
+    def items(self) -> Iterator[tuple[Any, str]]:
+        return zip(self.originals, self.values())
+
+    def values(self) -> Iterator[str]:
+        return map(TOKEN_FORMAT.__mod__, self.tokens)
+
+    def last_token(self) -> Optional[str]:
+        return TOKEN_FORMAT % self.tokens[-1] if self.tokens else None
+
+    def add(self, value: Any, encoded: str) -> None:
+        """Adds a value with its token. A value that's already there gets the new token, same as in a dict."""
+        number = int(encoded[4:])
+        slots, originals = self.slots, self.originals
+        size = len(slots)
+        mask = size - 1
+        perturb = hash(value) & 0xFFFFFFFFFFFFFFFF
+        index = perturb & mask
+        while slot := slots[index]:
+            if originals[slot - 1] == value:
+                self.tokens[slot - 1] = number
+                # Table of the tokens still has the previous one.
+                self.token_slots = None
+                return
+            perturb >>= 5
+            index = (5 * index + perturb + 1) & mask
+        originals.append(value)
+        self.tokens.append(number)
+        position = len(originals)
+        slots[index] = position
+        if position > self.MAX_LOAD * size:
+            size *= 2
+            self.slots = self._build_table(originals, hash, size)
+            if self.token_slots is not None:
+                self.token_slots = self._build_table(self.tokens, int, size)
+        elif self.token_slots is not None:
+            self._insert(self.token_slots, number, position)
+
+    def copy(self) -> 'MappingStore':
+        store = MappingStore()
+        store.originals = self.originals.copy()
+        store.tokens = self.tokens[:]
+        store.slots = self.slots[:]
+        store.token_slots = None if self.token_slots is None else self.token_slots[:]
+        return store
+
+
+class MappingIndex(collections.abc.Mapping):
+    """
+    Token -> original value, read from a binary index of a mapping file instead of the file itself. The index is
+    memory-mapped, so Decode starts right away and reads only the entries of the tokens it meets.
+
+    The index is written next to the mapping file and records the size and modification time of the file it was
+    built from, it's built again whenever they change. All numbers are 8 bytes, in the byte order of the machine:
+
+    - header, see `HEADER`
+    - tokens: their digits, in the order of the mapping file
+    - ends: end of each value in the values section
+    - slots: positions of the tokens + 1 (0 is an empty slot), by open addressing on the token
+    - values: UTF-8 of the values, one after another
+    """
+    MAGIC: ClassVar[bytes] = b'BAMIDX01'
+    # Magic, byte order mark, size and modification time of the mapping file, number of entries and slots.
+    HEADER: ClassVar[struct.Struct] = struct.Struct('=8sQQQQQ')
+    BYTE_ORDER_MARK: ClassVar[int] = 0x0102030405060708
+    # Slots are never fuller than that.
+    MAX_LOAD: ClassVar[float] = 2 / 3
+
+    def __init__(self, path: Path):
+        self.path = path
+        with open(path, mode='rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, byte_order_mark, *_, self.count, slot_count = self.HEADER.unpack_from(self.map)
+        if magic != self.MAGIC or byte_order_mark != self.BYTE_ORDER_MARK:
+            self.map.close()
+            raise ValueError(f'{path} is not a mapping index')
+        view = memoryview(self.map)
+        start = self.HEADER.size
+        sections = []
+        for length in (self.count, self.count, slot_count):
+            sections.append(view[start:start + 8 * length].cast('Q'))
+            start += 8 * length
+        self.tokens, self.ends, self.slots = sections
+        self.values = view[start:]
+        view.release()
+
+    @staticmethod
+    def path_for(mapping_path: Path) -> Path:
+        return mapping_path.with_name(f'.{mapping_path.name}.index')
+
+    @classmethod
+    def source_signature(cls, mapping_path: Path) -> tuple[int, int]:
+        stat = mapping_path.stat()
+        return stat.st_size, stat.st_mtime_ns
+
+    @classmethod
+    def open(cls, mapping_path: Path) -> 'MappingIndex':
+        """Opens the index of the mapping file, which is built first when there's none or it's out of date."""
+        index_path = cls.path_for(mapping_path)
+        signature = cls.source_signature(mapping_path)
+        try:
+            with open(index_path, mode='rb') as f:
+                magic, byte_order_mark, *source, _, _ = cls.HEADER.unpack(f.read(cls.HEADER.size))
+            is_current = (magic, byte_order_mark, tuple(source)) == (cls.MAGIC, cls.BYTE_ORDER_MARK, signature)
+        except (OSError, struct.error):
+            is_current = False
+        if not is_current:
+            cls.build(mapping_path, index_path)
+        return cls(index_path)
+
+    @classmethod
+    def build(cls, mapping_path: Path, index_path: Path) -> None:
+        """Writes the index of the mapping file. It's written next to the old one and renamed over it."""
+        signature = cls.source_signature(mapping_path)
+        tokens, ends = array.array('Q'), array.array('Q')
+        temp_path = index_path.with_name(f'{index_path.name}.tmp')
+        try:
+            with tempfile.TemporaryFile(dir=index_path.parent) as values:
+                end = 0
+                # No matter other encodings, mappings are always saved as `utf-8`.
+                with open(mapping_path, mode='r', encoding='utf-8') as f:
+                    for row in csv.reader(f, dialect='excel-tab'):
+                        # An entry torn by a crash while it was appended to the journal is skipped.
+                        if len(row) == 2 and ENC_PATTERN.fullmatch(row[1]):
+                            end += values.write(row[0].encode('utf-8'))
+                            tokens.append(int(row[1][4:]))
+                            ends.append(end)
+
+                slot_count = 8
+                while len(tokens) > cls.MAX_LOAD * slot_count:
+                    slot_count *= 2
+                slots = array.array('Q', [0]) * slot_count
+                mask = slot_count - 1
+                for position, number in enumerate(tokens, 1):
+                    # Tokens are spread evenly already, their lowest bits are as good as a hash.
+                    slot = number & mask
+                    # A token that's there twice is taken from its last entry, like the mappings load it.
+                    while slots[slot] and tokens[slots[slot] - 1] != number:
+                        slot = (slot + 1) & mask
+                    slots[slot] = position
+
+                with open(temp_path, mode='wb') as f:
+                    f.write(cls.HEADER.pack(cls.MAGIC, cls.BYTE_ORDER_MARK, *signature, len(tokens), slot_count))
+                    for section in (tokens, ends, slots):
+                        section.tofile(f)
+                    values.seek(0)
+                    shutil.copyfileobj(values, f, COPY_CHUNK_SIZE)
+            os.replace(temp_path, index_path)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+
+    def position(self, encoded: str) -> int:
+        """Position of the token in the mapping file, -1 when it's not there."""
+        number = int(encoded[4:])
+        slots, tokens = self.slots, self.tokens
+        mask = len(slots) - 1
+        slot = number & mask
+        while position := slots[slot]:
+            if tokens[position - 1] == number:
+                return position - 1
+            slot = (slot + 1) & mask
+        return -1
+
+    def __getitem__(self, encoded: str) -> str:
+        position = self.position(encoded)
+        if position < 0:
+            raise KeyError(encoded)
+        start = self.ends[position - 1] if position else 0
+        return str(self.values[start:self.ends[position]], 'utf-8')
+
+    def __contains__(self, encoded: Any) -> bool:
+        return isinstance(encoded, str) and ENC_PATTERN.fullmatch(encoded) is not None and self.position(encoded) >= 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator[str]:
+        return map(TOKEN_FORMAT.__mod__, self.tokens)
+
+    def token_at(self, position: int) -> str:
+        return TOKEN_FORMAT % self.tokens[position]
+
+    def last_token(self) -> Optional[str]:
+        return self.token_at(-1) if self.count else None
+
+    def __reduce__(self):
+        # Pool processes map the file themselves.
+        return self.__class__, (self.path,)
+
+    def close(self) -> None:
+        for view in (self.tokens, self.ends, self.slots, self.values):
+            view.release()
+        self.map.close()
+
+
+class ByteRangeReader(io.RawIOBase):
+    """Reads at most `size` bytes of a stream, from where it's positioned."""
+
+    def __init__(self, stream: IO[bytes], size: int):
+        super().__init__()
+        self.stream = stream
+        self.remaining = size
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        view = memoryview(buffer)[:self.remaining]
+        count = self.stream.readinto(view) if view.nbytes else 0
+        self.remaining -= count
+        return count
+
+    def close(self) -> None:
+        if not self.closed:
+            self.stream.close()
+        super().close()
+
+
+class ZipMemberView(io.RawIOBase):
+    """
+    Reads a stored (not compressed) member straight from the file of its archive. Unlike `ZipFile.open`, seeking back
+    doesn't read the member again from its start.
+    """
+
+    def __init__(self, archive: zipfile.ZipFile, info: zipfile.ZipInfo):
+        super().__init__()
+        self.archive = archive
+        with archive._lock:  # noqa (shared with readers of other members)
+            archive.fp.seek(info.header_offset)
+            file_header = struct.unpack(zipfile.structFileHeader, archive.fp.read(zipfile.sizeFileHeader))
+        self.start = info.header_offset + zipfile.sizeFileHeader \
+            + file_header[zipfile._FH_FILENAME_LENGTH] + file_header[zipfile._FH_EXTRA_FIELD_LENGTH]  # noqa
+        self.size = info.file_size
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError(f'Negative seek position {offset}')
+        self.position = offset
+        return offset
+
+    def readinto(self, buffer) -> int:
+        size = max(0, min(len(buffer), self.size - self.position))
+        if size == 0:
+            return 0
+        with self.archive._lock:  # noqa
+            self.archive.fp.seek(self.start + self.position)
+            data = self.archive.fp.read(size)
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+class ZipHandlePool:
+    """
+    Archives open for reading, shared by listing, `stat` and `open` of their members, instead of opening an archive
+    and reading its central directory for each of them.
+
+    An archive is identified by its chain: the path of the outermost archive, followed by the names of the members
+    that hold the archives nested in it. Nested archives are read from their parent, a compressed one is decompressed
+    once into a spooled temporary file, as compressed data can't be read from the middle.
+    """
+
+    def __init__(self):
+        self.handles: dict[tuple[str, ...], zipfile.ZipFile] = {}
+        self.sources: list[IO[bytes]] = []
+
+    def get(self, chain: tuple[str, ...]) -> zipfile.ZipFile:
+        handle = self.handles.get(chain)
+        if handle is not None:
+            return handle
+
+        if len(chain) == 1:
+            handle = zipfile.ZipFile(chain[0])
+        else:
+            parent = self.get(chain[:-1])
+            info = parent.getinfo(chain[-1])
+            if info.compress_type == zipfile.ZIP_STORED:
+                source = io.BufferedReader(ZipMemberView(parent, info))
+            else:
+                source = tempfile.SpooledTemporaryFile(max_size=XLSX_SPOOL_THRESHOLD)
+                with parent.open(info) as member:
+                    shutil.copyfileobj(member, source, COPY_CHUNK_SIZE)
+                source.seek(0)
+            self.sources.append(source)
+            handle = zipfile.ZipFile(source)
+            # Members are shown as paths through all of the archives.
+            handle.filename = '/'.join(chain)
+        handle.archive_chain = chain
+        self.handles[chain] = handle
+        return handle
+
+    def release(self) -> None:
+        """
+        Forgets the open archives without closing them: `ZipPath`s that still refer to them go on reading them, and
+        each one is closed once nothing refers to it anymore. The next `get` opens an archive again.
+        """
+        self.handles = {}
+        self.sources = []
+
+    def close(self) -> None:
+        # Nested archives are read from their parents, so these are closed first.
+        for handle in reversed(self.handles.values()):
+            handle.close()
+        for source in self.sources:
+            source.close()
+        self.handles.clear()
+        self.sources.clear()
 
 
 class ZipPath(zipfile.Path):
     class FakeStat(NamedTuple):
         st_size: int
 
+    def __init__(self, root: Union[str, os.PathLike, zipfile.ZipFile], at: str = ''):
+        # Archives given by their path are shared by all of their members.
+        if not isinstance(root, zipfile.ZipFile):
+            root = ZIP_HANDLES.get((os.fspath(root),))
+        super().__init__(root, at)
+
     @property
     def stem(self) -> str:
         return Path(str(self)).stem
@@ -47,24 +710,400 @@ class ZipPath(zipfile.Path):
     def suffix(self) -> str:
         return Path(str(self)).suffix
 
+    @property
+    def archive_chain(self) -> tuple[str, ...]:
+        return getattr(self.root, 'archive_chain', (self.root.filename,))
+
     def iterdir(self) -> Iterator['ZipPath']:  # noqa (iterdir is not a word)
-        for entry in super().iterdir():
-            yield ZipPath.from_zip_path(entry)
+        if not self.is_dir():
+            raise ValueError("Can't listdir a file")
+        # Same children in the same order as `zipfile.Path.iterdir`, which goes through all members for each directory.
+        children = getattr(self.root, 'member_children', None)
+        if children is None:
+            children = self.root.member_children = collections.defaultdict(list)
+            for name in self.root.namelist():
+                children[posixpath.dirname(name.rstrip('/'))].append(name)
+        for name in children.get(self.at.rstrip('/'), ()):
+            yield ZipPath(self.root, name)
+
+    def open_archive(self) -> 'ZipPath':
+        """Root of the archive stored in this member."""
+        return ZipPath(ZIP_HANDLES.get(self.archive_chain + (self.at,)))
 
     @classmethod
     def from_zip_path(cls, entry: zipfile.Path) -> 'ZipPath':
-        return cls(
-            entry.root.filename,  # noqa (root.filename is like a private interface)
-            at=entry.at,  # noqa (at is like a private interface)
-        )
+        return cls(entry.root, at=entry.at)  # noqa (at is like a private interface)
+
+    @classmethod
+    def from_archive_chain(cls, chain: tuple[str, ...], at: str) -> 'ZipPath':
+        return cls(ZIP_HANDLES.get(chain), at)
 
     def stat(self):  # The result has to look like this object -> os.stat_result:
         # Only size is filled from this class.
         size = self.root.getinfo(self.at).file_size  # noqa (all fields are available)
         return self.FakeStat(size)
 
+    def __reduce__(self):
+        # Open archive handle can't be sent to a pool process, it's reopened there instead.
+        return self.from_archive_chain, (self.archive_chain, self.at)  # noqa (at is like a private interface)
+
+
+# Archives opened by `ZipPath`, a process can read each of them through a single handle.
+ZIP_HANDLES = ZipHandlePool()
+
+
+class FileRange:
+    """
+    Part of a data file, from `start` to `end` in bytes, which stands in for the file while the part is transformed
+    by a separate job (see `CSVConfig.split_file`).
+    """
+
+    def __init__(self, path: Path, start: int, end: int):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.name = path.name
+        self.parent = path.parent
+
+    @property
+    def is_first(self) -> bool:
+        return self.start == 0
+
+    def stat(self):  # The result has to look like this object -> os.stat_result:
+        return ZipPath.FakeStat(self.end - self.start)
 
-FilePath = Union[Path, ZipPath]
+    def open(self, mode: str = 'r', encoding: Optional[str] = None) -> IO:
+        stream = open(self.path, mode='rb', buffering=0)
+        stream.seek(self.start)
+        source = io.BufferedReader(ByteRangeReader(stream, self.end - self.start), INPUT_BUFFER_SIZE)
+        if 'b' in mode:
+            return source
+        return io.TextIOWrapper(source, encoding=encoding)
+
+    def __str__(self) -> str:
+        return f'{self.path} [{self.start}:{self.end}]'
+
+
+FilePath = Union[Path, ZipPath, FileRange]
+# Maps a row of a table in place, see `CSVConfig.compile_row_plan`.
+RowPlan = Callable[[list[Any]], list[Any]]
+
+
+def file_digest(path: 'FilePath') -> str:
+    digest = hashlib.sha256()
+    with path.open(mode='rb') as f:  # noqa (mode is supported)
+        while chunk := f.read(COPY_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_size(text: str) -> int:
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)\s*([KMG]?B?)', text.strip().upper())
+    if match is None:
+        raise argparse.ArgumentTypeError(f'Invalid size {text!r}, use e.g. 500MB or 2GB')
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+
+class RawZipMember:
+    """
+    Member of an archive written from data the caller provides as it's stored, e.g. already compressed.
+
+    `ZipFile` has no public interface for that, so this does what `ZipFile.open(mode='w')` does internally. The
+    internals of `ZipFile` aren't touched anywhere else when writing archives.
+    """
+
+    def __init__(self, zip_file: zipfile.ZipFile, zinfo: zipfile.ZipInfo, zip64: Optional[bool] = None):
+        self.zip_file = zip_file
+        self.zinfo = zinfo
+        self.zip64 = zip64
+        self.finished = False
+        with zip_file._lock:  # noqa
+            if zip_file._writing:  # noqa
+                raise ValueError(f"Can't write {zinfo.filename} while another member is being written")
+            zip_file._writecheck(zinfo)  # noqa
+            zip_file._didModify = True  # noqa
+            zip_file.fp.seek(zip_file.start_dir)
+            zinfo.header_offset = zip_file.fp.tell()
+            zip_file.fp.write(zinfo.FileHeader(zip64))
+            zip_file._writing = True  # noqa
+        # Data of the member goes here, right after the local header.
+        self.fp: IO[bytes] = zip_file.fp
+
+    def finish(self, rewrite_header: bool = False) -> None:
+        """Adds the member to the central directory, with its local header written again for the final sizes."""
+        with self.zip_file._lock:  # noqa
+            self.zip_file.start_dir = self.fp.tell()
+            if rewrite_header:
+                self.fp.seek(self.zinfo.header_offset)
+                self.fp.write(self.zinfo.FileHeader(self.zip64))
+                self.fp.seek(self.zip_file.start_dir)
+            self.zip_file.filelist.append(self.zinfo)
+            self.zip_file.NameToInfo[self.zinfo.filename] = self.zinfo
+            self.zip_file._writing = False  # noqa
+        self.finished = True
+
+    def abort(self) -> None:
+        """
+        Leaves the member out of the archive, finished or not, and cuts off what was written of it. It has to be the
+        last member of the archive.
+        """
+        with self.zip_file._lock:  # noqa
+            if self.finished:
+                self.zip_file.filelist.remove(self.zinfo)
+                del self.zip_file.NameToInfo[self.zinfo.filename]
+            self.zip_file.start_dir = self.zinfo.header_offset
+            # `ZipFile` doesn't truncate what's left after the central directory.
+            self.fp.seek(self.zinfo.header_offset)
+            self.fp.truncate()
+            self.zip_file._writing = False  # noqa
+        self.finished = False
+
+    @classmethod
+    def added(cls, zip_file: zipfile.ZipFile, zinfo: zipfile.ZipInfo) -> 'RawZipMember':
+        """Member that's already in the archive, e.g. written through `ZipFile.open`, so that it can be aborted."""
+        member = cls.__new__(cls)
+        member.zip_file, member.zinfo, member.zip64, member.fp = zip_file, zinfo, None, zip_file.fp
+        member.finished = True
+        return member
+
+    @staticmethod
+    def new_info(name: str, compress_type: int, compresslevel: Optional[int] = None) -> zipfile.ZipInfo:
+        """Info of a new member, same as `ZipFile.writestr` makes it."""
+        zinfo = zipfile.ZipInfo(name, date_time=time.localtime(time.time())[:6])
+        zinfo.compress_type = compress_type
+        zinfo._compresslevel = compresslevel  # noqa
+        zinfo.external_attr = 0o600 << 16
+        return zinfo
+
+    @staticmethod
+    def end_offset(zip_file: zipfile.ZipFile) -> int:
+        """Size of the members written to an archive so far."""
+        return zip_file.start_dir
+
+
+@contextlib.contextmanager
+def open_zip_member(zip_file: zipfile.ZipFile, name: str) -> Iterator[IO[bytes]]:
+    """Writes a new member of an archive, which is left out of it when writing fails halfway."""
+    zinfo = RawZipMember.new_info(name, zip_file.compression, zip_file.compresslevel)
+    # Size of the output isn't known up front, so every member has to allow zip64.
+    stream = zip_file.open(zinfo, mode='w', force_zip64=True)
+    try:
+        yield stream
+    except BaseException:
+        stream.close()
+        RawZipMember.added(zip_file, zinfo).abort()
+        raise
+    stream.close()
+
+
+def copy_zip_member(source: zipfile.ZipFile, info: zipfile.ZipInfo, target: zipfile.ZipFile) -> None:
+    """Copies a member between archives as it is stored, without decompressing and compressing it again."""
+    copy_stored_member(source.fp, info, target)
+
+
+def copy_stored_member(source: IO[bytes], info: zipfile.ZipInfo, target: zipfile.ZipFile) -> None:
+    """
+    Same as `copy_zip_member`, from the file of an archive. Only the local header of the member is read, so it works
+    on an archive without the central directory, too.
+    """
+    source.seek(info.header_offset)
+    file_header = struct.unpack(zipfile.structFileHeader, source.read(zipfile.sizeFileHeader))
+    name_length = file_header[zipfile._FH_FILENAME_LENGTH]  # noqa
+    extra_length = file_header[zipfile._FH_EXTRA_FIELD_LENGTH]  # noqa
+    source.seek(name_length + extra_length, os.SEEK_CUR)
+
+    zinfo = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+    zinfo.compress_type = info.compress_type
+    zinfo.external_attr = info.external_attr
+    zinfo.CRC = info.CRC
+    zinfo.compress_size = info.compress_size
+    zinfo.file_size = info.file_size
+    # Sizes are known, so there won't be a data descriptor after the data.
+    zinfo.flag_bits = info.flag_bits & ~0x08
+
+    member = RawZipMember(target, zinfo)
+    try:
+        remaining = info.compress_size
+        while remaining > 0:
+            chunk = source.read(min(remaining, COPY_CHUNK_SIZE))
+            if not chunk:
+                raise zipfile.BadZipFile(f'Unexpected end of data in {info.filename}')
+            member.fp.write(chunk)
+            remaining -= len(chunk)
+    except BaseException:
+        member.abort()
+        raise
+    member.finish()
+
+
+def _deflate_block(block: bytes, dictionary: bytes, level: int, last: bool) -> bytes:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=dictionary) if dictionary \
+        else zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    # Blocks other than the last one end on a byte boundary without ending the stream, so they can be concatenated.
+    return compressor.compress(block) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+class ParallelDeflateMember(io.RawIOBase):
+    """
+    Writes a deflated archive member, with blocks of it compressed on a thread pool, as zlib releases the GIL while
+    it compresses. Each block is primed with the end of the previous one, so together they make a single deflate
+    stream which compresses about as well as the one `ZipFile` makes (same as pigz does). Compressed blocks are
+    written in order as they're finished.
+    """
+
+    def __init__(
+        self,
+        zip_file: zipfile.ZipFile,
+        name: str,
+        executor: concurrent.futures.Executor,
+        level: Optional[int],
+        max_pending: int,
+    ):
+        super().__init__()
+        self.executor = executor
+        self.level = zlib.Z_DEFAULT_COMPRESSION if level is None else level
+        self.max_pending = max_pending
+        self.pending: collections.deque[concurrent.futures.Future] = collections.deque()
+        self.buffer = bytearray()
+        self.dictionary = b''
+        self.crc = 0
+        self.file_size = 0
+        self.compress_size = 0
+
+        zinfo = RawZipMember.new_info(name, zipfile.ZIP_DEFLATED)
+        zinfo.file_size = zinfo.compress_size = zinfo.CRC = 0
+        # Sizes are written once they're known, the header has room for zip64 ones.
+        self.member = RawZipMember(zip_file, zinfo, zip64=True)
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        count = memoryview(data).nbytes
+        self.buffer += data
+        if len(self.buffer) >= DEFLATE_BLOCK_SIZE:
+            self._submit(last=False)
+        return count
+
+    def _submit(self, last: bool) -> None:
+        block = bytes(self.buffer)
+        self.buffer.clear()
+        self.crc = zlib.crc32(block, self.crc)
+        self.file_size += len(block)
+        self.pending.append(self.executor.submit(_deflate_block, block, self.dictionary, self.level, last))
+        # Window of deflate is 32 KiB, nothing before that is referenced.
+        self.dictionary = block[-32 * 1024:]
+        while self.pending and (len(self.pending) >= self.max_pending or self.pending[0].done()):
+            self._write_compressed(self.pending.popleft().result())
+
+    def _write_compressed(self, data: bytes) -> None:
+        self.member.fp.write(data)
+        self.compress_size += len(data)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            self._submit(last=True)
+            while self.pending:
+                self._write_compressed(self.pending.popleft().result())
+
+            zinfo = self.member.zinfo
+            zinfo.CRC = self.crc
+            zinfo.file_size = self.file_size
+            zinfo.compress_size = self.compress_size
+            self.member.finish(rewrite_header=True)
+        except BaseException:
+            self.member.abort()
+            raise
+        finally:
+            for future in self.pending:
+                future.cancel()
+            super().close()
+
+    def abort(self) -> None:
+        """Leaves the member out of the archive, instead of adding what was written of it."""
+        if self.closed:
+            return
+        for future in self.pending:
+            future.cancel()
+        self.pending.clear()
+        self.member.abort()
+        super().close()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        # Same as `open_zip_member`, a member isn't added when writing it failed.
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+def csv_record_pattern(quotechar: bytes, delimiter: bytes) -> 're.Pattern[bytes]':
+    """
+    Matches a CSV record up to its line break, quoted the same as the `csv` module reads it: a quote starts a quoted
+    field only at the start of a field, elsewhere it's kept as it is. Quotes have to be escaped by doubling them.
+    """
+    quote, delimiter = re.escape(quotechar), re.escape(delimiter)
+    # Pieces of the pattern can't overlap, so it doesn't backtrack much when a record isn't complete.
+    quoted_field = b'(?<![^%s\r\n])%s[^%s]*(?:%s%s[^%s]*)*%s(?!%s)' % (
+        delimiter, quote, quote, quote, quote, quote, quote, quote,
+    )
+    other_quote = b'(?<=[^%s\r\n])%s' % (delimiter, quote)
+    return re.compile(b'[^%s\n]*(?:(?:%s|%s)[^%s\n]*)*\n' % (quote, quoted_field, other_quote, quote))
+
+
+def record_boundaries(source: BinaryIO, start: int, part_size: int, quotechar: bytes, delimiter: bytes) -> list[int]:
+    """
+    Offsets in a CSV file where parts of about `part_size` bytes can start: right after a record, see
+    `csv_record_pattern`. Records are read from `start`, which must be at the start of one.
+    """
+    record = csv_record_pattern(quotechar, delimiter)
+    records = re.compile(b'(?:%s)*' % record.pattern)
+    boundaries = []
+    source.seek(start)
+    buffer = b''
+    # Offset of the start of `buffer`, which is always the start of a record.
+    buffer_start = start
+    target = start + part_size
+    while block := source.read(COPY_CHUNK_SIZE):
+        buffer += block
+        position = 0
+        while True:
+            # Records which end before the target are skipped, the one after them ends the part.
+            position = records.match(buffer, position, max(target - buffer_start, position)).end()
+            match = record.match(buffer, position)
+            if match is None:
+                break
+            position = match.end()
+            boundaries.append(buffer_start + position)
+            target = buffer_start + position + part_size
+        buffer = buffer[position:]
+        buffer_start += position
+        if len(buffer) > MAX_SPLIT_RECORD_SIZE:
+            break
+    return boundaries
+
+
+def read_text_blocks(source: IO[str], quotechar: Optional[str] = None) -> Iterator[str]:
+    """
+    Reads the text in blocks of whole lines.
+
+    With a quote character, a block also ends outside of quotes, so that it holds whole CSV records. That needs
+    quotes to be escaped by doubling them.
+    """
+    rest = ''
+    while data := source.read(DECODE_BLOCK_SIZE):
+        data = rest + data
+        end = data.rfind('\n') + 1
+        if quotechar is not None:
+            while end and data.count(quotechar, 0, end) % 2:
+                end = data.rfind('\n', 0, end - 1) + 1
+        if end:
+            yield data[:end]
+        rest = data[end:]
+    if rest:
+        yield rest
 
 
 class Operation(Enum):
@@ -78,17 +1117,44 @@ class QueueItem:
         self.config = config
         self.operation = operation
 
-    def process(self, worker: 'Worker'):
-        destination_buffer = self.config.make_destination_buffer()
-        if self.operation == Operation.ENCODE:
-            self.config.encode_file(self.path, worker, destination_buffer)
-        else:
-            self.config.decode_file(self.path, worker, destination_buffer)
-        buffer_data = self.config.make_buffer_binary(destination_buffer)
-        worker.save_output(self.output_name(), buffer_data)
+    def process(self, worker: 'Worker', file_profile: Optional['FileProfile'] = None) -> str:
+        output_name = worker.unique_output_name(self.output_name())
+        shard = worker.outputs.shard_for(self, output_name)
+        with worker.open_output_member(shard, output_name) as output_stream:
+            self.transform(worker, output_stream, file_profile)
 
-        supporting_files = self.config.get_supporting_files(self.path)
-        worker.save_supporting_files(supporting_files)
+        with profile_stage(file_profile, 'supporting'):
+            supporting_files = self.config.get_supporting_files(self.path)
+            worker.save_supporting_files(supporting_files, shard)
+        return output_name
+
+    def transform(
+        self,
+        worker: Union['Worker', 'PoolWorker', 'ValueCollector'],
+        output_stream: BinaryIO,
+        file_profile: Optional['FileProfile'] = None,
+    ) -> None:
+        with contextlib.ExitStack() as stack:
+            if file_profile is not None:
+                worker, output_stream = stack.enter_context(file_profile.instrument(worker, output_stream))
+            with self.config.open_destination(output_stream) as destination:
+                if self.operation == Operation.ENCODE:
+                    self.config.encode_file(self.path, worker, destination)
+                else:
+                    self.config.decode_file(self.path, worker, destination)
+
+    def collect_values(self) -> list[Any]:
+        """Values that encoding the file encodes, in the order in which it finds them. The output is discarded."""
+        collector = ValueCollector()
+        with open(os.devnull, mode='wb') as output_stream:
+            self.transform(collector, output_stream)
+        return list(collector.values)
+
+    def split(self, part_size: int) -> list['QueueItem']:
+        """Parts of the file that can be encoded separately, see `BaseConfig.split_file`."""
+        if self.operation != Operation.ENCODE:
+            return [self]
+        return [QueueItem(path, self.config, self.operation) for path in self.config.split_file(self.path, part_size)]
 
     def output_name(self) -> str:
         return self.path.name
@@ -97,51 +1163,934 @@ class QueueItem:
         return f'{self.path}'
 
 
+class RunManifest:
+    """
+    Journal of the files completed by a run, kept next to the output archive. Each entry tells what an output member
+    was made from (input content, config and mappings) and where it is stored in the archive. Entries are appended
+    only once the member and the mappings it needs are on disk, so an archive torn by a crash still has them.
+
+    It's kept by `--resume` runs only. Such a run moves the archives of the previous one aside and copies the members
+    it can reuse from there, before anything else is processed. Inputs are hashed while they're read (see
+    `DigestStream`), only files that weren't read in order are read again for their digest.
+    """
+    FILE_NAME: ClassVar[str] = 'manifest.jsonl'
+    MEMBER_FIELDS: ClassVar[tuple[str, ...]] = (
+        'header_offset', 'CRC', 'compress_size', 'file_size', 'compress_type', 'flag_bits', 'external_attr',
+    )
+
+    def __init__(self, output_directory: Path, archive_path: Path):
+        self.path = output_directory / self.FILE_NAME
+        # Entries written before outputs could be sharded don't name their archive.
+        self.archive_name = archive_path.name
+        self.previous_entries: dict[tuple[str, str, str], dict[str, Any]] = {}
+        self.previous_archives: dict[str, IO[bytes]] = {}
+        # Path -> (signature, digest), inputs that didn't change since the previous run aren't read again.
+        self.known_digests: dict[str, tuple[list, str]] = {}
+        # Path -> digest of the inputs hashed while they were read by this run.
+        self.streamed_digests: dict[str, str] = {}
+        # Shards are written by their own threads.
+        self.lock = threading.Lock()
+
+        self._load_previous()
+        temp_path = self.path.with_name(f'.{self.FILE_NAME}.tmp')
+        temp_path.write_bytes(b'')
+        os.replace(temp_path, self.path)
+        self.journal = open(self.path, mode='a', encoding='utf-8')
+
+    @classmethod
+    def discard(cls, output_directory: Path) -> None:
+        """
+        Removes the manifest of a previous run, for a run that doesn't keep one: its entries would be about archives
+        that this run overwrites.
+        """
+        (output_directory / cls.FILE_NAME).unlink(missing_ok=True)
+        cls._remove_previous_archives(output_directory)
+
+    def previous_archive_path(self, name: str) -> Path:
+        return self.path.with_name(f'.{name}.previous')
+
+    @staticmethod
+    def _remove_previous_archives(output_directory: Path) -> None:
+        for path in output_directory.glob('.*.previous'):
+            path.unlink()
+
+    def _load_previous(self) -> None:
+        try:
+            with open(self.path, mode='r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            lines = []
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Entry torn by a crash.
+                continue
+            self.previous_entries[entry['digest'], entry['config'], entry['operation']] = entry
+            self.known_digests[entry['path']] = entry['signature'], entry['digest']
+
+        for name in {entry.get('archive', self.archive_name) for entry in self.previous_entries.values()}:
+            archive_path, previous_path = self.path.with_name(name), self.previous_archive_path(name)
+            # Archive is missing when a crash came right after it was moved aside, the entries are still about that one.
+            if archive_path.exists():
+                os.replace(archive_path, previous_path)
+            if previous_path.exists():
+                self.previous_archives[name] = open(previous_path, mode='rb')
+
+    @staticmethod
+    def input_signature(path: FilePath) -> list:
+        if isinstance(path, ZipPath):
+            info = path.root.getinfo(path.at)  # noqa (at is like a private interface)
+            return [info.file_size, info.CRC, list(info.date_time)]
+        stat = path.stat()
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def input_digest(self, path: FilePath) -> str:
+        signature = self.input_signature(path)
+        known_signature, digest = self.known_digests.get(str(path), (None, None))
+        if known_signature != signature:
+            digest = self.streamed_digests.pop(str(path), None) or file_digest(path)
+            self.known_digests[str(path)] = signature, digest
+        return digest
+
+    def find(self, path: FilePath, config: 'BaseConfig', operation: Operation) -> Optional[dict[str, Any]]:
+        if not self.previous_archives or config.identity is None:
+            return None
+        return self.previous_entries.get((self.input_digest(path), config.identity, operation.name))
+
+    def copy_member(self, entry: dict[str, Any], output_name: str, target: zipfile.ZipFile) -> bool:
+        """Copies the member of the entry from the previous archive, returns `False` if it isn't there."""
+        member = entry['member']
+        previous_archive = self.previous_archives.get(entry.get('archive', self.archive_name))
+        if previous_archive is None:
+            return False
+        previous_archive.seek(member['header_offset'])
+        header = previous_archive.read(zipfile.sizeFileHeader)
+        if len(header) != zipfile.sizeFileHeader or not header.startswith(zipfile.stringFileHeader):
+            return False
+        file_header = struct.unpack(zipfile.structFileHeader, header)
+        flag_bits = file_header[zipfile._FH_GENERAL_PURPOSE_FLAG_BITS]  # noqa
+        name_length = file_header[zipfile._FH_FILENAME_LENGTH]  # noqa
+        name = previous_archive.read(name_length).decode('utf-8' if flag_bits & 0x800 else 'cp437')
+        if name != member['name']:
+            return False
+
+        info = zipfile.ZipInfo(output_name, date_time=tuple(member['date_time']))
+        for field in self.MEMBER_FIELDS:
+            setattr(info, field, member[field])
+        # Previous archive can be torn, so it isn't opened as `ZipFile`.
+        copy_stored_member(previous_archive, info, target)
+        return True
+
+    def record(
+        self,
+        path: FilePath,
+        digest: str,
+        config: 'BaseConfig',
+        operation: Operation,
+        mapping_version: dict[str, Any],
+        info: zipfile.ZipInfo,
+        archive_name: str,
+    ) -> None:
+        if config.identity is None:
+            return
+        member = {field: getattr(info, field) for field in self.MEMBER_FIELDS}
+        member.update(name=info.filename, date_time=list(info.date_time))
+        entry = {
+            'path': str(path),
+            'signature': self.input_signature(path),
+            'digest': digest,
+            'config': config.identity,
+            'operation': operation.name,
+            'mapping': mapping_version,
+            'archive': archive_name,
+            'member': member,
+        }
+        with self.lock:
+            self.journal.write(json.dumps(entry) + '\n')
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+
+    def _close_previous_archives(self) -> None:
+        for previous_archive in self.previous_archives.values():
+            previous_archive.close()
+        self.previous_archives = {}
+
+    def finish_reuse(self) -> None:
+        """Everything reusable was copied, the previous archives aren't needed anymore."""
+        self._close_previous_archives()
+        self.previous_entries = {}
+        self._remove_previous_archives(self.path.parent)
+
+    def close(self) -> None:
+        self._close_previous_archives()
+        self.journal.close()
+
+
+class OutputShard:
+    """One archive of the output, with its own handle and writer thread."""
+
+    def __init__(self, path: Path, compression: int, compresslevel: Optional[int]):
+        self.path = path
+        self.name = path.name
+        self.zip_file = zipfile.ZipFile(path, mode='w', compression=compression, compresslevel=compresslevel)
+        # Bytes of the outputs put into this shard that aren't necessarily written yet.
+        self.assigned = 0
+        # Output names of the supporting files saved into this shard, by their path and by their content.
+        self.supporting_paths: dict[str, str] = {}
+        self.supporting_digests: dict[tuple[str, str], str] = {}
+        self.supporting_names: set[str] = set()
+        self.writer: Optional[concurrent.futures.ThreadPoolExecutor] = None
+
+    @property
+    def size(self) -> int:
+        return max(RawZipMember.end_offset(self.zip_file), self.assigned)
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> concurrent.futures.Future:
+        """Runs a write into this shard, after the ones submitted before it."""
+        if self.writer is None:
+            self.writer = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix=self.name)
+        return self.writer.submit(fn, *args)
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.shutdown()
+        self.zip_file.close()
+
+
+class OutputArchives:
+    """
+    Archives the outputs are written to: a single one, or with `shard_by`, a set of shards. Each shard is a separate
+    archive with its own writer, so outputs of a `--jobs` run are copied into different shards at the same time.
+
+    Outputs are put into shards by size (a new shard is started once the current one holds `shard_size` bytes), by
+    the carrier of their config, or by a hash of their name into `shard_count` shards. Supporting files are saved
+    into every shard that holds data files they belong to, under their own name where possible. Names of the outputs
+    of data files are unique across all shards.
+
+    The index file next to the shards tells which shard holds which member, `Decode` accepts it in place of them.
+    """
+    INDEX_SUFFIX: ClassVar[str] = '.index.json'
+    SHARD_POLICIES: ClassVar[tuple[str, ...]] = ('size', 'carrier', 'hash')
+
+    def __init__(
+        self,
+        output_directory: Path,
+        zipname: str,
+        compression: int = zipfile.ZIP_DEFLATED,
+        compresslevel: Optional[int] = None,
+        shard_by: Optional[str] = None,
+        shard_size: int = SHARD_SIZE,
+        shard_count: int = SHARD_COUNT,
+    ):
+        if shard_by is not None and shard_by not in self.SHARD_POLICIES:
+            raise ValueError(f'Unknown shard policy {shard_by}, use one of {", ".join(self.SHARD_POLICIES)}')
+        self.path = output_directory / zipname
+        self.index_path = self.path.with_name(f'{self.path.stem}{self.INDEX_SUFFIX}')
+        self.compression = compression
+        self.compresslevel = compresslevel
+        self.shard_by = shard_by
+        self.shard_size = shard_size
+        self.shard_count = shard_count
+        self.shards: dict[str, OutputShard] = {}
+        # Output name -> the shard that holds it, for outputs of data files.
+        self.members: dict[str, OutputShard] = {}
+        self.size_shard: Optional[OutputShard] = None
+
+        self._remove_previous()
+        if shard_by is None:
+            self._get_shard(self.path.name)
+
+    def _remove_previous(self) -> None:
+        """Shards of the previous run into the same directory would be mistaken for those of this one."""
+        if self.index_path.exists():
+            for name in json.loads(self.index_path.read_text(encoding='utf-8'))['shards']:
+                self.path.with_name(name).unlink(missing_ok=True)
+            self.index_path.unlink()
+        if self.shard_by is not None:
+            self.path.unlink(missing_ok=True)
+
+    def _get_shard(self, name: str) -> OutputShard:
+        shard = self.shards.get(name)
+        if shard is None:
+            shard = OutputShard(self.path.with_name(name), self.compression, self.compresslevel)
+            self.shards[name] = shard
+        return shard
+
+    def shard_name(self, suffix: str) -> str:
+        return f'{self.path.stem}-{suffix}{self.path.suffix}'
+
+    def shard_for(self, queue_item: QueueItem, output_name: str, size: int = 0) -> OutputShard:
+        """Picks the shard for the output of a file, `size` is how big the output is, when it's already known."""
+        if self.shard_by is None:
+            shard = self.shards[self.path.name]
+        elif self.shard_by == 'carrier':
+            shard = self._get_shard(self.shard_name(re.sub(r'[^\w-]+', '_', queue_item.config.carrier)))
+        elif self.shard_by == 'hash':
+            number = zlib.crc32(queue_item.output_name().encode('utf-8')) % self.shard_count
+            shard = self._get_shard(self.shard_name(f'{number:0{len(str(self.shard_count - 1))}d}'))
+        else:
+            if self.size_shard is None or self.size_shard.size >= self.shard_size:
+                self.size_shard = self._get_shard(self.shard_name(f'{len(self.shards) + 1:03d}'))
+            shard = self.size_shard
+        shard.assigned += size
+        self.members[output_name] = shard
+        return shard
+
+    def discard(self, output_name: str) -> None:
+        self.members.pop(output_name, None)
+
+    def close(self) -> None:
+        for shard in self.shards.values():
+            shard.close()
+        if self.shard_by is None:
+            return
+        members: dict[str, list[str]] = {}
+        for shard in self.shards.values():
+            for name in shard.zip_file.namelist():
+                members.setdefault(name, []).append(shard.name)
+        index = {'shards': list(self.shards), 'members': members}
+        temp_path = self.index_path.with_name(f'.{self.index_path.name}.tmp')
+        temp_path.write_text(json.dumps(index, indent=2), encoding='utf-8')
+        os.replace(temp_path, self.index_path)
+
+    @classmethod
+    def read_index(cls, path: FilePath) -> list[FilePath]:
+        """Paths of the shards listed in an index file."""
+        with path.open(mode='r', encoding='utf-8') as f:  # noqa (encoding is supported)
+            index = json.load(f)
+        return [path.parent / name for name in index['shards']]
+
+
+class TimedStream(io.RawIOBase):
+    """
+    Passes reads or writes through to a stream, and adds the time spent in them and the bytes to a stage of
+    a `FileProfile`.
+    """
+
+    def __init__(self, stream: IO[bytes], file_profile: 'FileProfile', stage: str, close_stream: bool):
+        super().__init__()
+        self.stream = stream
+        self.file_profile = file_profile
+        self.stage = stage
+        self.close_stream = close_stream
+
+    def readable(self) -> bool:
+        return self.stream.readable()
+
+    def writable(self) -> bool:
+        return self.stream.writable()
+
+    def seekable(self) -> bool:
+        return self.stream.seekable()
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        return self.stream.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self.stream.tell()
+
+    def readinto(self, buffer) -> int:
+        start = time.perf_counter()
+        count = self.stream.readinto(buffer)
+        self.file_profile.add(self.stage, time.perf_counter() - start, count or 0)
+        return count
+
+    def write(self, data) -> int:
+        start = time.perf_counter()
+        self.stream.write(data)
+        count = memoryview(data).nbytes
+        self.file_profile.add(self.stage, time.perf_counter() - start, count)
+        return count
+
+    def close(self) -> None:
+        if not self.closed and self.close_stream:
+            self.stream.close()
+        super().close()
+
+
+class ProfilingWorker:
+    """Stands in for the worker while a file is profiled, times and counts the values that are mapped."""
+
+    def __init__(self, worker: Union['Worker', 'PoolWorker'], file_profile: 'FileProfile'):
+        self.worker = worker
+        self.file_profile = file_profile
+
+    def encode_value(self, value: str) -> str:
+        start = time.perf_counter()
+        encoded = self.worker.encode_value(value)
+        self.file_profile.add('encode', time.perf_counter() - start, 1)
+        return encoded
+
+    def encoded_replace(self, match: re.Match):
+        start = time.perf_counter()
+        value = self.worker.encoded_replace(match)
+        self.file_profile.add('decode', time.perf_counter() - start, 1)
+        return value
+
+
+class RowCounter:
+    """Counts the rows of a file as they're read, keeps `line_num` of the reader for `DictReader`."""
+
+    def __init__(self, rows: Iterator[Any], file_profile: 'FileProfile'):
+        self.rows = rows
+        self.file_profile = file_profile
+        file_profile.rows = 0
+
+    @property
+    def line_num(self) -> int:
+        return self.rows.line_num
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = next(self.rows)
+        self.file_profile.rows += 1
+        return row
+
+
+class FileProfile:
+    """
+    Timings and counters of a single file, for `--profile`. Stages of the transform are measured where the file
+    is transformed, which is a pool process with `--jobs`, the other ones where the output is saved.
+
+    - read: reading (and decompressing) the input
+    - parse: the rest of the transform, i.e. parsing and writing of rows and lines
+    - encode, decode: inside `encode_value` and `encoded_replace`
+    - write: writing (and compressing) the output
+    - copy: copying the output of a pool process to the archive
+    - supporting, mappings, checkpoint: saving supporting files, saving mappings, recording the file as completed
+    """
+    TRANSFORM_STAGES: ClassVar[tuple[str, ...]] = ('read', 'encode', 'decode', 'write')
+    STAGES: ClassVar[tuple[str, ...]] = (
+        'read', 'parse', 'encode', 'decode', 'write', 'copy', 'supporting', 'mappings', 'checkpoint',
+    )
+    # Counters of the stages, besides their time.
+    STAGE_COUNTERS: ClassVar[dict[str, str]] = {
+        'read': 'bytes_in', 'write': 'bytes_out', 'encode': 'values_encoded', 'decode': 'values_decoded',
+    }
+
+    def __init__(self, queue_item: QueueItem):
+        config = queue_item.config
+        self.path = str(queue_item.path)
+        self.config = config.identity.partition(':')[0] if config.identity is not None else str(config)
+        self.operation = queue_item.operation.name
+        self.stages: dict[str, float] = dict.fromkeys(self.STAGES, 0.0)
+        self.counters: dict[str, int] = dict.fromkeys(self.STAGE_COUNTERS.values(), 0)
+        # Rows are counted only where they're parsed, decoding mostly goes through blocks of text instead.
+        self.rows: Optional[int] = None
+        self.new_mappings = 0
+        self.compressed_bytes_out: Optional[int] = None
+
+    def add(self, stage: str, seconds: float, count: int) -> None:
+        self.stages[stage] += seconds
+        self.counters[self.STAGE_COUNTERS[stage]] += count
+
+    def merge(self, other: 'FileProfile') -> None:
+        """Adds the profile of a part of the file."""
+        for stage, seconds in other.stages.items():
+            self.stages[stage] += seconds
+        for counter, count in other.counters.items():
+            self.counters[counter] += count
+        if other.rows is not None:
+            self.rows = (self.rows or 0) + other.rows
+        self.new_mappings += other.new_mappings
+
+    @contextlib.contextmanager
+    def stage(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[stage] += time.perf_counter() - start
+
+    @contextlib.contextmanager
+    def instrument(
+        self,
+        worker: Union['Worker', 'PoolWorker'],
+        output_stream: BinaryIO,
+    ) -> Iterator[tuple[ProfilingWorker, BinaryIO]]:
+        """Measures the transform of the file, which gets the worker and output stream given by this."""
+        global _FILE_PROFILE
+        mapping_count = len(worker.encoded_mappings)
+        measured = sum(self.stages[stage] for stage in self.TRANSFORM_STAGES)
+        _FILE_PROFILE = self
+        start = time.perf_counter()
+        try:
+            yield ProfilingWorker(worker, self), TimedStream(output_stream, self, 'write', close_stream=False)
+        finally:
+            elapsed = time.perf_counter() - start
+            _FILE_PROFILE = None
+            self.stages['parse'] += elapsed - (sum(self.stages[stage] for stage in self.TRANSFORM_STAGES) - measured)
+            self.new_mappings += len(worker.encoded_mappings) - mapping_count
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            'path': self.path,
+            'config': self.config,
+            'operation': self.operation,
+            **{key: value for key, value in summarize_profiles([self]).items() if key != 'files'},
+        }
+
+
+def summarize_profiles(file_profiles: list[FileProfile]) -> dict[str, Any]:
+    """Sums of the stages and counters of the files."""
+    stages = {stage: sum(profile.stages[stage] for profile in file_profiles) for stage in FileProfile.STAGES}
+    counters = {
+        counter: sum(profile.counters[counter] for profile in file_profiles)
+        for counter in FileProfile.STAGE_COUNTERS.values()
+    }
+    counted_rows = [profile.rows for profile in file_profiles if profile.rows is not None]
+    compressed = [profile.compressed_bytes_out for profile in file_profiles if profile.compressed_bytes_out is not None]
+    new_mappings = sum(profile.new_mappings for profile in file_profiles)
+    # Values found in `encoded_mappings` of the worker that encoded them. In pool processes, values issued by
+    # the other processes count as new too.
+    hit_ratio = None
+    if counters['values_encoded']:
+        hit_ratio = round(1 - new_mappings / counters['values_encoded'], 6)
+    return {
+        'files': len(file_profiles),
+        'seconds': round(sum(stages.values()), 6),
+        'stages': {stage: round(seconds, 6) for stage, seconds in stages.items()},
+        'rows': sum(counted_rows) if counted_rows else None,
+        **counters,
+        'new_mappings': new_mappings,
+        'cache_hit_ratio': hit_ratio,
+        'compressed_bytes_out': sum(compressed) if compressed else None,
+    }
+
+
+class RunProfile:
+    """Collects the profiles of the files of a run with `--profile`, and writes them as a report."""
+    FILE_NAME: ClassVar[str] = 'profile.json'
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages: dict[str, float] = collections.defaultdict(float)
+        self.files: list[FileProfile] = []
+        self.jobs = 1
+
+    @contextlib.contextmanager
+    def stage(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[stage] += time.perf_counter() - start
+
+    def report(self) -> dict[str, Any]:
+        by_config: dict[str, list[FileProfile]] = collections.defaultdict(list)
+        for file_profile in self.files:
+            by_config[file_profile.config].append(file_profile)
+        return {
+            'seconds': round(time.perf_counter() - self.start, 6),
+            'jobs': self.jobs,
+            'stages': {stage: round(seconds, 6) for stage, seconds in self.stages.items()},
+            'total': summarize_profiles(self.files),
+            'configs': {config: summarize_profiles(file_profiles) for config, file_profiles in by_config.items()},
+            'files': [file_profile.as_dict() for file_profile in self.files],
+        }
+
+    def save(self, output_directory: Path) -> Path:
+        path = output_directory / self.FILE_NAME
+        path.write_text(json.dumps(self.report(), indent=2), encoding='utf-8')
+        return path
+
+
+class FileProgress:
+    """
+    Progress of a file that's being transformed: bytes read from it and rows parsed so far. They're kept in a slot
+    of counters for all files of the queue, which are shared with the main process in a `--jobs` run.
+    """
+
+    def __init__(self, counters: MutableSequence[int], index: int, reporter: Optional['ProgressReporter'] = None):
+        self.counters = counters
+        self.index = index
+        self.reporter = reporter
+        # Reader of the file, with the count of the rows it parsed (`line_num`).
+        self.rows_source: Optional[Any] = None
+
+    def add(self, count: int) -> None:
+        slot = 2 * self.index
+        self.counters[slot] += count
+        if self.rows_source is not None:
+            self.counters[slot + 1] = self.rows_source.line_num
+        if self.reporter is not None:
+            self.reporter.maybe_report()
+
+    def __enter__(self) -> 'FileProgress':
+        global _FILE_PROGRESS
+        _FILE_PROGRESS = self
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        global _FILE_PROGRESS
+        _FILE_PROGRESS = None
+        # Rows parsed after the last read.
+        if self.rows_source is not None:
+            self.counters[2 * self.index + 1] = self.rows_source.line_num
+
+
+class ProgressStream(io.RawIOBase):
+    """Passes reads through to a stream and adds them to the progress of the file."""
+
+    def __init__(self, stream: IO[bytes], file_progress: FileProgress):
+        super().__init__()
+        self.stream = stream
+        self.file_progress = file_progress
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return self.stream.seekable()
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        return self.stream.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self.stream.tell()
+
+    def readinto(self, buffer) -> int:
+        count = self.stream.readinto(buffer)
+        if count:
+            self.file_progress.add(count)
+        return count
+
+    def close(self) -> None:
+        if not self.closed:
+            self.stream.close()
+        super().close()
+
+
+class DigestStream(io.RawIOBase):
+    """
+    Passes reads through to a stream and hashes them, like `file_digest` does. The digest is recorded in `digests`
+    once the stream is read to its end in order, a seek elsewhere (as a workbook does) leaves it out.
+    """
+
+    def __init__(self, stream: IO[bytes], path: str, digests: dict[str, str]):
+        super().__init__()
+        self.stream = stream
+        self.path = path
+        self.digests = digests
+        self.digest: Optional['hashlib._Hash'] = hashlib.sha256()
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return self.stream.seekable()
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        position = self.stream.seek(offset, whence)
+        if position != self.position:
+            self.digest = None
+        return position
+
+    def tell(self) -> int:
+        return self.stream.tell()
+
+    def readinto(self, buffer) -> int:
+        count = self.stream.readinto(buffer)
+        if self.digest is not None:
+            if count:
+                self.digest.update(memoryview(buffer)[:count])
+                self.position += count
+            elif count == 0 and len(buffer):
+                self.digests[self.path] = self.digest.hexdigest()
+                self.digest = None
+        return count
+
+    def close(self) -> None:
+        if not self.closed:
+            self.stream.close()
+        super().close()
+
+
+class ProgressReporter:
+    """
+    Reports progress of the queue from the bytes read from its files, rather than once a file is finished, with
+    the rate and the estimated time left, both over the last `PROGRESS_RATE_WINDOW` reports. It's printed as
+    the `Progress` line, which the GUI shows as its progress bar, and emitted as an event, at most once per
+    `PROGRESS_INTERVAL`.
+
+    Bytes read from a file are counted up to its size: workbooks are read in parts, some of them more than once.
+    Parts of a split file are counted in slots of their own, listed in `part_slots`.
+    """
+
+    def __init__(
+        self,
+        filesizes: list[int],
+        emit_event: Callable[..., None],
+        counters: Optional[MutableSequence[int]] = None,
+        part_slots: Optional[dict[int, list[int]]] = None,
+    ):
+        self.filesizes = filesizes
+        self.total_bytes = sum(filesizes)
+        self.emit_event = emit_event
+        # Bytes read and rows parsed of each file, see `FileProgress`.
+        self.counters = counters if counters is not None else [0] * (2 * len(filesizes))
+        self.part_slots = part_slots or {}
+        self.unfinished: set[int] = set(range(len(filesizes)))
+        self.finished_bytes = 0
+        self.finished_rows = 0
+        self.start = time.perf_counter()
+        self.next_report = self.start + PROGRESS_INTERVAL
+        self.reported_files = -1
+        # (time, bytes, rows) of the last reports.
+        self.window: collections.deque[tuple[float, int, int]] = collections.deque(
+            [(self.start, 0, 0)], maxlen=PROGRESS_RATE_WINDOW,
+        )
+
+    def file(self, index: int) -> FileProgress:
+        return FileProgress(self.counters, index, self)
+
+    def slots(self, index: int) -> list[int]:
+        return self.part_slots.get(index, [index])
+
+    def finish_file(self, index: int, queue_item: QueueItem, output_name: str) -> None:
+        self.unfinished.discard(index)
+        self.finished_bytes += self.filesizes[index]
+        self.finished_rows += sum(self.counters[2 * slot + 1] for slot in self.slots(index))
+        self.emit_event('file', path=str(queue_item.path), output=output_name, bytes=self.filesizes[index])
+        self.maybe_report()
+
+    def seconds_to_report(self) -> float:
+        return max(0.0, self.next_report - time.perf_counter())
+
+    def maybe_report(self) -> None:
+        if time.perf_counter() >= self.next_report:
+            self.report()
+
+    def finish(self) -> None:
+        # Short runs are reported at least once, at their end.
+        if self.reported_files != len(self.filesizes):
+            self.report()
+
+    def report(self) -> None:
+        now = time.perf_counter()
+        self.next_report = now + PROGRESS_INTERVAL
+        elapsed = now - self.start
+        done_bytes = self.finished_bytes + sum(
+            min(sum(self.counters[2 * slot] for slot in self.slots(index)), self.filesizes[index])
+            for index in self.unfinished
+        )
+        rows = self.finished_rows + sum(
+            self.counters[2 * slot + 1] for index in self.unfinished for slot in self.slots(index)
+        )
+        window_start, window_bytes, window_rows = self.window[0]
+        self.window.append((now, done_bytes, rows))
+        window_seconds = now - window_start
+        bytes_per_second = (done_bytes - window_bytes) / window_seconds if window_seconds > 0 else 0.0
+        rows_per_second = (rows - window_rows) / window_seconds if window_seconds > 0 else 0.0
+        eta = (self.total_bytes - done_bytes) / bytes_per_second if bytes_per_second > 0 else None
+        percent = int(done_bytes * 100 / self.total_bytes) if self.total_bytes else 100
+        self.reported_files = len(self.filesizes) - len(self.unfinished)
+
+        if REPORT_PROGRESS:
+            rates = [f'{bytes_per_second / 1024 ** 2:.1f} MB/s']
+            if rows_per_second:
+                rates.append(f'{rows_per_second:.0f} rows/s')
+            if eta is not None:
+                rates.append(f'ETA {datetime.timedelta(seconds=round(eta))}')
+            print(f'Progress {percent}% ({", ".join(rates)})')
+        self.emit_event(
+            'progress',
+            percent=percent,
+            bytes=done_bytes,
+            total_bytes=self.total_bytes,
+            files=self.reported_files,
+            total_files=len(self.filesizes),
+            rows=rows,
+            elapsed=round(elapsed, 3),
+            bytes_per_second=round(bytes_per_second),
+            rows_per_second=round(rows_per_second),
+            eta=round(eta, 1) if eta is not None else None,
+        )
+
+
+# Progress of the file that's being transformed by this process.
+_FILE_PROGRESS: Optional[FileProgress] = None
+
+# Profile of the file that's being transformed by this process, if it's profiled.
+_FILE_PROFILE: Optional[FileProfile] = None
+
+# Digests of the data files read in full by this process, while the run keeps a manifest (see `RunManifest`).
+_INPUT_DIGESTS: Optional[dict[str, str]] = None
+
+
+def counted_rows(rows: Iterator[Any], worker: Union['Worker', 'PoolWorker', ProfilingWorker]) -> Iterator[Any]:
+    """
+    Rows of the data file, counted when it's profiled. Progress takes the count from the reader, if it has one
+    (`line_num`).
+    """
+    if _FILE_PROGRESS is not None and hasattr(rows, 'line_num'):
+        _FILE_PROGRESS.rows_source = rows
+    if isinstance(worker, ProfilingWorker):
+        return RowCounter(rows, worker.file_profile)
+    return rows
+
+
+def profile_stage(file_profile: Optional[FileProfile], stage: str) -> ContextManager[None]:
+    return file_profile.stage(stage) if file_profile is not None else contextlib.nullcontext()
+
+
+def open_input(path: FilePath, mode: str = 'r', encoding: Optional[str] = None) -> IO:
+    """
+    Opens the data file that's being transformed. Its reads are counted for the progress of the run, timed when
+    it's profiled, and hashed when the run keeps a manifest, which then doesn't need to read the file again.
+    """
+    digests = _INPUT_DIGESTS if not isinstance(path, FileRange) else None
+    if _FILE_PROFILE is None and _FILE_PROGRESS is None and digests is None:
+        if 'b' in mode:
+            return path.open(mode=mode)  # noqa (mode is supported)
+        return path.open(mode=mode, encoding=encoding)  # noqa (encoding is supported)
+
+    stream = path.open(mode='rb')  # noqa (mode is supported)
+    if digests is not None:
+        stream = DigestStream(stream, str(path), digests)
+    if _FILE_PROFILE is not None:
+        stream = TimedStream(stream, _FILE_PROFILE, 'read', close_stream=True)
+    if _FILE_PROGRESS is not None:
+        stream = ProgressStream(stream, _FILE_PROGRESS)
+    stream = io.BufferedReader(stream, INPUT_BUFFER_SIZE)
+    if 'b' in mode:
+        return stream
+    return io.TextIOWrapper(stream, encoding=encoding)
+
+
 class Worker:
     MAPPING_FILE_NAME = 'mapping.tsv'
 
-    def __init__(self, output_directory: str, output_zipname: Optional[str] = None, should_save_mappings: bool = True):
+    def __init__(
+        self,
+        output_directory: str,
+        output_zipname: Optional[str] = None,
+        should_save_mappings: bool = True,
+        token_key: Optional[bytes] = None,
+        resume: bool = False,
+        profile: bool = False,
+        events_path: Optional[str] = None,
+        compression: int = zipfile.ZIP_DEFLATED,
+        compresslevel: Optional[int] = None,
+        compression_threads: int = 1,
+        shard_by: Optional[str] = None,
+        shard_size: int = SHARD_SIZE,
+        shard_count: int = SHARD_COUNT,
+        split_size: int = SPLIT_SIZE,
+        two_pass: bool = False,
+    ):
         self.output_directory: Path = Path(output_directory)
         self.output_directory.mkdir(parents=True, exist_ok=True)
 
-        self.encoded_mappings: dict[str, str] = {}
-        self.encoded_values: set[str] = set()
-        self.input_zipfiles: dict[Path, zipfile.ZipFile] = {}
+        # Original value -> token, and the other way through its `inverse`.
+        self.encoded_mappings = MappingStore()
+        # Token -> original value for Decode, read from the index of the mapping file instead of loading it.
+        self.mapping_index: Optional[MappingIndex] = None
         self.filesizes: list[int] = []
         self.queue: list[QueueItem] = []
+        self.routing_report = RoutingReport()
         self.output_names: set[str] = set()
+        # Names of the supporting files in any of the shards. Each one is saved only once into each shard, although
+        # it's shared by many data files.
+        self.supporting_names: set[str] = set()
+        # Guards the names of outputs while shards are written by their threads.
+        self.output_lock = threading.Lock()
         output_zipname = output_zipname or 'output.zip'  # TODO: timestamped name by default?
-        self.output_zipfile: zipfile.ZipFile = \
-            zipfile.ZipFile(self.output_directory / output_zipname, mode="w", compression=zipfile.ZIP_DEFLATED)
+        # With `resume`, outputs of files that are the same as in the previous run are copied from its archives, and
+        # the files completed by this run are recorded for the next one.
+        self.manifest: Optional[RunManifest] = None
+        if resume:
+            self.manifest = RunManifest(self.output_directory, self.output_directory / output_zipname)
+        else:
+            RunManifest.discard(self.output_directory)
+        self.outputs = OutputArchives(
+            self.output_directory, output_zipname, compression, compresslevel, shard_by, shard_size, shard_count,
+        )
+        # Deflate is what takes most of the time of writing the output, it can use more threads.
+        self.compression_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        if compression_threads > 1 and compression == zipfile.ZIP_DEFLATED:
+            self.compression_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=compression_threads, thread_name_prefix='deflate',
+            )
+        self.compression_threads = compression_threads
         self.should_save_mappings = should_save_mappings
+        # The mapping file is a journal: new mappings are appended to it as they're issued, so that a crash doesn't
+        # lose them. It's rewritten as a whole only when it doesn't match `encoded_mappings` (see `compact_mappings`).
+        self.mapping_path: Path = self.output_directory / self.MAPPING_FILE_NAME
+        self.pending_mappings: list[tuple[str, str]] = []
+        self.mapping_file_synced = False
+        self.mapping_journal: Optional[IO[str]] = None
+        # With a key, tokens are derived from the values instead of being random (see `keyed_token`).
+        self.token_key = token_key
+        # Random tokens are issued by the allocator, or by the registry while jobs run (see `_process_files_in_pool`).
+        self.token_allocator = TokenAllocator()
+        self.mapping_registry: Optional[MappingRegistry] = None
         self.processed_count: int = 0
+        # With `--jobs`, big files are split into parts of about that size (see `BaseConfig.split_file`).
+        self.split_size = split_size
+        # With `two_pass`, values of all files are collected first and their tokens allocated at once, so that
+        # the files are then encoded with a mapping that doesn't change (see `allocate_tokens`).
+        self.two_pass = two_pass
+        # With `profile`, stages of each file are timed and written to `RunProfile.FILE_NAME` at the end.
+        self.profiler: Optional[RunProfile] = RunProfile() if profile else None
+        # Events of the run, for whatever runs it, as JSON lines.
+        self.events: Optional[IO[str]] = open(events_path, mode='w', encoding='utf-8') if events_path else None
+
+    def unique_output_name(self, name: str, shard: Optional[OutputShard] = None) -> str:
+        """
+        Names of data files are unique across all shards. A supporting file (saved into `shard`) only needs a name
+        that no data file and no other supporting file in its shard has, as data files look for it in their shard.
+        """
+        other_names = self.supporting_names if shard is None else shard.supporting_names
+        unique_name, suffix = name, 2
+        while unique_name in self.output_names or unique_name in other_names:
+            unique_name, suffix = f'{name}.{suffix}', suffix + 1
+        if shard is None:
+            self.output_names.add(unique_name)
+        else:
+            shard.supporting_names.add(unique_name)
+            self.supporting_names.add(unique_name)
+        return unique_name
 
-    def unique_output_name(self, name: str):
-        if name in self.output_names:
-            suffix = 2
-            while f'{name}.{suffix}' in self.output_names:
-                suffix += 1
-            name = f'{name}.{suffix}'
-        self.output_names.add(name)
-        return name
+    @property
+    def decoded_mappings(self) -> Union[MappingStore.Inverse, MappingIndex]:
+        if self.mapping_index is not None:
+            return self.mapping_index
+        return self.encoded_mappings.inverse
 
     def encoded_replace(self, match: re.Match):
-        return self.encoded_mappings[match.group()]
+        return self.decoded_mappings[match.group()]
 
-    def save_supporting_files(self, in_files: list[FilePath]) -> None:
-        # TODO: optimize
-        #  This is far from being "ok". It assumes that the whole file is held in memory,
-        #  it can change the output file name etc.
+    def save_supporting_files(self, in_files: list[FilePath], shard: OutputShard) -> None:
         for file_path in in_files:
-            output_name = self.unique_output_name(file_path.name)
-            with file_path.open(mode='rb') as f:  # noqa (mode is supported)
-                self.output_zipfile.writestr(output_name, f.read())
+            if str(file_path) in shard.supporting_paths:
+                continue
 
-    def save_output(self, path: str, content: bytes) -> None:
-        output_name = self.unique_output_name(path)
-        # writestr tries to encode string into UTF-8, so we pass bytes instead.
-        assert isinstance(content, bytes)
-        self.output_zipfile.writestr(output_name, content)
+            # Files are matched by name too, as data files look for them by name. Different files with the same
+            # name in a shard still end up under a changed name, there's no other place for them in a flat archive.
+            content_key = (file_path.name, file_digest(file_path))
+            output_name = shard.supporting_digests.get(content_key)
+            if output_name is None:
+                with self.output_lock:
+                    output_name = self.unique_output_name(file_path.name, shard)
+                with file_path.open(mode='rb') as source:  # noqa (mode is supported)
+                    with self.open_output_member(shard, output_name) as destination:
+                        shutil.copyfileobj(source, destination, COPY_CHUNK_SIZE)
+                shard.supporting_digests[content_key] = output_name
+            shard.supporting_paths[str(file_path)] = output_name
+
+    def open_output_member(self, shard: OutputShard, output_name: str) -> ContextManager[IO[bytes]]:
+        """Member of the output, left out of the archive when writing it fails."""
+        if self.compression_executor is not None:
+            return ParallelDeflateMember(
+                shard.zip_file, output_name, self.compression_executor, self.outputs.compresslevel,
+                max_pending=2 * self.compression_threads,
+            )
+        return open_zip_member(shard.zip_file, output_name)
 
     def _list_files(self, paths: Iterable[str]) -> list[FilePath]:
         """
@@ -151,6 +2100,8 @@ class Worker:
         """
         paths: collections.deque[FilePath] = collections.deque(Path(x) for x in paths)
         all_files = []
+        # Shards of an output are listed by its index, and found in its directory too.
+        listed_archives = set()
         while paths:
             path = paths.popleft()
             if not path.exists():
@@ -161,72 +2112,717 @@ class Worker:
                 paths.extend(path.iterdir())
                 continue
 
+            if path.name.endswith(OutputArchives.INDEX_SUFFIX):
+                # Shards of an output are listed in its index.
+                paths.extend(OutputArchives.read_index(path))
+                continue
+
             if path.suffix.lower().endswith('.zip'):
-                paths.extend(ZipPath(path, '').iterdir())
+                archive_key = str(path) if isinstance(path, ZipPath) else str(path.resolve())
+                if archive_key in listed_archives:
+                    continue
+                listed_archives.add(archive_key)
+                # Archives nested in archives are read from their parent.
+                archive = path.open_archive() if isinstance(path, ZipPath) else ZipPath(path)
+                paths.extend(archive.iterdir())
                 continue
 
             all_files.append(path)
         return all_files
 
     def find_files(self, paths: list, for_encode: bool) -> None:
-        list_of_files = self._list_files(paths)
+        with self.run_stage('list'):
+            list_of_files = self._list_files(paths)
         print(f'Listed {len(list_of_files)} files.')
-        for file_path in list_of_files:
-            config = ConfigFactory.get_config(file_path.name)
-            if config is None:
-                continue
+        with self.run_stage('route'):
+            for file_path in list_of_files:
+                configs = ConfigFactory.get_configs(file_path.name)
+                if not configs:
+                    self.routing_report.add(str(file_path), configs)
+                    continue
 
-            self.queue.append(QueueItem(file_path, config, Operation.ENCODE if for_encode else Operation.DECODE))
-            self.filesizes.append(file_path.stat().st_size)
+                config = configs[0]
+                supporting_files = config.get_supporting_files(file_path)
+                self.routing_report.add(str(file_path), configs, [str(path) for path in supporting_files])
+                self.queue.append(QueueItem(file_path, config, Operation.ENCODE if for_encode else Operation.DECODE))
+                self.filesizes.append(file_path.stat().st_size)
+        for line in self.routing_report.summary():
+            print(line)
 
     def encode_value(self, value: str) -> str:
         # When working with XLSX we can have integers in some of the fields that we want to cover.
         try:
             return self.encoded_mappings[value]
         except KeyError:
-            while True:
-                encoded = 'enc-' + random_digits()
-                if encoded not in self.encoded_values:
-                    self.encoded_values.add(encoded)
-                    break
-            self.encoded_mappings[value] = encoded
+            if self.token_key is None:
+                encoded = self.token_allocator.new_token(self.encoded_mappings.issued_tokens)
+            else:
+                encoded = keyed_token(self.token_key, value, self.encoded_mappings.issued_tokens)
+            self.encoded_mappings.add(value, encoded)
+            self._record_mapping(value, encoded)
             return encoded
 
-    def process_files(self):
+    def _record_mapping(self, value: str, encoded: str) -> None:
+        if not self.should_save_mappings:
+            return
+        self.pending_mappings.append((value, encoded))
+        if len(self.pending_mappings) >= MAPPING_FLUSH_SIZE:
+            self.save_mappings()
+
+    def emit_event(self, event: str, **fields: Any) -> None:
+        if self.events is None:
+            return
+        self.events.write(json.dumps({'event': event, 'time': round(time.time(), 3), **fields}) + '\n')
+        self.events.flush()
+
+    def run_stage(self, stage: str) -> ContextManager[None]:
+        return self.profiler.stage(stage) if self.profiler is not None else contextlib.nullcontext()
+
+    def start_profile(self, queue_item: QueueItem) -> Optional[FileProfile]:
+        return FileProfile(queue_item) if self.profiler is not None else None
+
+    def finish_profile(self, file_profile: Optional[FileProfile], output_name: str) -> None:
+        if file_profile is None:
+            return
+        shard = self.outputs.members[output_name]
+        file_profile.compressed_bytes_out = shard.zip_file.getinfo(output_name).compress_size
+        self.profiler.files.append(file_profile)
+
+    def process_files(self, jobs: int = 1):
+        if self.profiler is not None:
+            self.profiler.jobs = jobs
+        with self.run_stage('reuse'):
+            self._reuse_outputs()
+        if self.two_pass:
+            with self.run_stage('collect'):
+                self._collect_values(jobs)
+        self.emit_event('start', files=len(self.queue), bytes=sum(self.filesizes), jobs=jobs)
+        with self.run_stage('process'), self.hashing_inputs():
+            if jobs > 1:
+                self._process_files_in_pool(jobs)
+            else:
+                self._process_files()
+        self.emit_event('finish', files=self.processed_count)
+
+    @contextlib.contextmanager
+    def hashing_inputs(self) -> Iterator[None]:
+        """Inputs read by this process are hashed for the manifest while it's kept, see `DigestStream`."""
+        global _INPUT_DIGESTS
+        if self.manifest is None:
+            yield
+            return
+        _INPUT_DIGESTS = self.manifest.streamed_digests
+        try:
+            yield
+        finally:
+            _INPUT_DIGESTS = None
+
+    def _collect_values(self, jobs: int) -> None:
+        """
+        First pass of `two_pass`: finds the values the queued files encode and allocates their tokens. Values are
+        taken in the order of the queue, so that the mapping doesn't depend on the number of jobs.
+        """
+        items = [queue_item for queue_item in self.queue if queue_item.operation == Operation.ENCODE]
+        if not items:
+            return
+        with contextlib.ExitStack() as stack:
+            if jobs > 1:
+                executor = stack.enter_context(concurrent.futures.ProcessPoolExecutor(
+                    max_workers=jobs, initializer=_reopen_archives_in_pool,
+                ))
+                parts = [part for queue_item in items for part in queue_item.split(self.split_size)]
+                found = executor.map(_collect_in_pool, parts)
+            else:
+                found = (queue_item.collect_values() for queue_item in items)
+            count = self.allocate_tokens(value for values in found for value in values)
+        print(f'Allocated {count} new tokens for the values of {len(items)} files')
+
+    def allocate_tokens(self, values: Iterable[Any]) -> int:
+        """Issues tokens for all values that don't have one yet, at once. Returns how many there were."""
+        new_values = [value for value in dict.fromkeys(values) if value not in self.encoded_mappings]
+        if self.token_key is None:
+            tokens = self.token_allocator.new_tokens(len(new_values), self.encoded_mappings.issued_tokens)
+        else:
+            tokens = (keyed_token(self.token_key, value, self.encoded_mappings.issued_tokens) for value in new_values)
+        # Keyed tokens are derived one by one, each of them can't take the token of the previous ones.
+        for value, encoded in zip(new_values, tokens):
+            self.encoded_mappings.add(value, encoded)
+            self._record_mapping(value, encoded)
+        if self.should_save_mappings:
+            self.save_mappings()
+        return len(new_values)
+
+    def _process_files(self) -> None:
         total = len(self.queue)
-        total_file_size = sum(self.filesizes)
-        processed_bytes = 0
-        for queue_item, filesize in zip(self.queue, self.filesizes):
+        progress = ProgressReporter(self.filesizes, self.emit_event)
+        for index, queue_item in enumerate(self.queue):
             self.processed_count += 1
             print(f'Processing file {queue_item} ({self.processed_count}/{total})')
-            queue_item.process(self)
-            processed_bytes += filesize
-            if REPORT_PROGRESS:
-                print(f'Progress {int((processed_bytes * 100) / total_file_size)}%')
+            file_profile = self.start_profile(queue_item)
+            with progress.file(index):
+                output_name = queue_item.process(self, file_profile)
+            with profile_stage(file_profile, 'mappings'):
+                if self.should_save_mappings:
+                    self.save_mappings()
+            with profile_stage(file_profile, 'checkpoint'):
+                self.checkpoint(queue_item, output_name)
+            self.finish_profile(file_profile, output_name)
+            progress.finish_file(index, queue_item, output_name)
+        progress.finish()
+        print(f'Successfully processed {self.processed_count} data files')
+
+    def _process_files_in_pool(self, jobs: int) -> None:
+        """
+        Spreads the queue over a pool of processes.
+
+        Random tokens are handed out by a single `MappingRegistry`, so a value gets the same token no matter which
+        process encodes it. Keyed tokens don't need it, each process derives them on its own.
+        Outputs are written to the archives by this process only, each shard by its own thread. Pool processes count
+        what they read in counters shared with this process, which reports the progress while it waits for them.
+        Big files are split into parts (see `BaseConfig.split_file`), whose outputs are joined once all are done.
+        """
+        total = len(self.queue)
+        # Big files are split into parts that are transformed by separate jobs, see `BaseConfig.split_file`.
+        # Progress of the first part is counted in the slot of its file, of the other ones in slots after all files.
+        parts = {index: self.queue[index].split(self.split_size) for index in range(total)}
+        part_slots: dict[int, list[int]] = {}
+        slot_count = total
+        for index, items in parts.items():
+            if len(items) > 1:
+                part_slots[index] = [index, *range(slot_count, slot_count + len(items) - 1)]
+                slot_count += len(items) - 1
+        progress = ProgressReporter(
+            self.filesizes, self.emit_event, multiprocessing.RawArray('q', max(1, 2 * slot_count)), part_slots,
+        )
+
+        # Largest files are scheduled first, so that a big file doesn't start last while other processes are idle.
+        order = sorted(range(total), key=lambda index: self.filesizes[index], reverse=True)
+        # Names are reserved up front, so that they don't depend on the order in which files are finished.
+        output_names = {index: self.unique_output_name(self.queue[index].output_name()) for index in order}
+
+        with contextlib.ExitStack() as stack:
+            # Each file is written by its pool process to a separate archive, and copied from there.
+            parts_directory = Path(stack.enter_context(
+                tempfile.TemporaryDirectory(prefix='.parts-', dir=self.output_directory)
+            ))
+            registry = None
+            # With `two_pass`, all tokens are allocated by now, processes only read them.
+            if self.token_key is None and not self.two_pass:
+                manager = stack.enter_context(MappingManager())
+                registry = manager.MappingRegistry(self.encoded_mappings, self.token_allocator)  # noqa (registered)
+                self.mapping_registry = registry
+                # Tokens issued by the registry are counted before the manager is shut down.
+                stack.callback(self._detach_registry)
+            executor = stack.enter_context(concurrent.futures.ProcessPoolExecutor(
+                max_workers=jobs,
+                initializer=_init_pool_process,
+                initargs=(
+                    registry, self.token_key, self.encoded_mappings, self.mapping_index, progress.counters,
+                    self.manifest is not None,
+                ),
+            ))
+            # Index of the file of each job, with the number of the part for parts of split files.
+            futures: dict[concurrent.futures.Future, tuple[int, Optional[int]]] = {}
+            for index in order:
+                if len(parts[index]) == 1:
+                    future = executor.submit(
+                        _process_in_pool, self.queue[index], index, output_names[index],
+                        parts_directory / f'{index}.zip', self.outputs.compression,
+                        self.outputs.compresslevel, self.profiler is not None,
+                    )
+                    futures[future] = index, None
+                    continue
+                for number, part in enumerate(parts[index]):
+                    future = executor.submit(
+                        _process_part_in_pool, part, part_slots[index][number],
+                        parts_directory / f'{index}-{number}.part', self.profiler is not None,
+                    )
+                    futures[future] = index, number
+            # Results of the parts of split files that are finished, until all of them are.
+            part_results: dict[int, dict[int, tuple[list[tuple[str, str]], Optional[FileProfile]]]] = {}
+            # Outputs being copied into their shards, with the index of the file and its profile.
+            writes: dict[concurrent.futures.Future, tuple[int, Optional[FileProfile]]] = {}
+            pending = set(futures)
+            try:
+                while pending:
+                    done, pending = concurrent.futures.wait(
+                        pending, timeout=progress.seconds_to_report(), return_when=concurrent.futures.FIRST_COMPLETED,
+                    )
+                    for future in sorted(done.intersection(futures), key=futures.get):
+                        index, number = futures[future]
+                        queue_item = self.queue[index]
+                        if number is None:
+                            new_mappings, file_profile, digest = future.result()
+                            if digest is not None:
+                                self.manifest.streamed_digests[str(queue_item.path)] = digest
+                            part_path = parts_directory / f'{index}.zip'
+                            write_args = part_path, queue_item, output_names[index], file_profile
+                            write_output, size = self._write_part, part_path.stat().st_size
+                        else:
+                            results = part_results.setdefault(index, {})
+                            results[number] = future.result()
+                            if len(results) < len(parts[index]):
+                                continue
+                            # Mappings are added in the order of the parts, like they would be by a single job.
+                            new_mappings = [mapping for part in sorted(results) for mapping in results[part][0]]
+                            file_profile = self.start_profile(queue_item)
+                            if file_profile is not None:
+                                for _, part_profile in results.values():
+                                    file_profile.merge(part_profile)
+                            part_paths = [parts_directory / f'{index}-{part}.part' for part in sorted(results)]
+                            write_args = part_paths, queue_item, output_names[index], file_profile
+                            write_output, size = self._write_parts, sum(path.stat().st_size for path in part_paths)
+                            del part_results[index]
+                        # Mappings the output needs are saved before the shard records it as complete.
+                        with profile_stage(file_profile, 'mappings'):
+                            self.add_mappings(new_mappings)
+                            if self.should_save_mappings:
+                                self.save_mappings()
+                        shard = self.outputs.shard_for(queue_item, output_names[index], size)
+                        write = shard.submit(write_output, shard, *write_args, self.mapping_version())
+                        writes[write] = index, file_profile
+                        pending.add(write)
+
+                    for future in sorted(done.intersection(writes), key=lambda write: writes[write][0]):
+                        index, file_profile = writes.pop(future)
+                        future.result()
+                        self.finish_profile(file_profile, output_names[index])
+                        self.processed_count += 1
+                        print(f'Processed file {self.queue[index]} ({self.processed_count}/{total})')
+                        progress.finish_file(index, self.queue[index], output_names[index])
+                    progress.maybe_report()
+            except BaseException:
+                executor.shutdown(cancel_futures=True)
+                # Parts are removed once this exits, shards can't be copying them anymore.
+                concurrent.futures.wait(writes)
+                raise
+        progress.finish()
         print(f'Successfully processed {self.processed_count} data files')
 
+    def _detach_registry(self) -> None:
+        self.token_allocator.count = self.mapping_registry.token_count()
+        self.mapping_registry = None
+
+    def _write_part(
+        self,
+        shard: OutputShard,
+        part_path: Path,
+        queue_item: QueueItem,
+        output_name: str,
+        file_profile: Optional[FileProfile],
+        mapping_version: dict[str, Any],
+    ) -> None:
+        """Copies the output of a pool process into its shard, with its supporting files. Runs in the shard's thread."""
+        with profile_stage(file_profile, 'copy'):
+            with zipfile.ZipFile(part_path) as part_zipfile:
+                copy_zip_member(part_zipfile, part_zipfile.getinfo(output_name), shard.zip_file)
+            part_path.unlink()
+        self._finish_output(shard, queue_item, output_name, file_profile, mapping_version)
+
+    def _write_parts(
+        self,
+        shard: OutputShard,
+        part_paths: list[Path],
+        queue_item: QueueItem,
+        output_name: str,
+        file_profile: Optional[FileProfile],
+        mapping_version: dict[str, Any],
+    ) -> None:
+        """Like `_write_part`, for a split file. Outputs of its parts are concatenated and compressed in order."""
+        with profile_stage(file_profile, 'copy'):
+            with self.open_output_member(shard, output_name) as output_stream:
+                for part_path in part_paths:
+                    with part_path.open(mode='rb') as part:
+                        shutil.copyfileobj(part, output_stream, COPY_CHUNK_SIZE)
+                    part_path.unlink()
+        self._finish_output(shard, queue_item, output_name, file_profile, mapping_version)
+
+    def _finish_output(
+        self,
+        shard: OutputShard,
+        queue_item: QueueItem,
+        output_name: str,
+        file_profile: Optional[FileProfile],
+        mapping_version: dict[str, Any],
+    ) -> None:
+        with profile_stage(file_profile, 'supporting'):
+            self.save_supporting_files(queue_item.config.get_supporting_files(queue_item.path), shard)
+        with profile_stage(file_profile, 'checkpoint'):
+            self.checkpoint(queue_item, output_name, mapping_version)
+
+    def _reuse_outputs(self) -> None:
+        """
+        Copies the outputs of files completed by the previous run, and leaves only the other ones in the queue.
+        """
+        if self.manifest is None:
+            return
+        queue, filesizes = [], []
+        tokens = None
+        for queue_item, filesize in zip(self.queue, self.filesizes):
+            entry = self.manifest.find(queue_item.path, queue_item.config, queue_item.operation)
+            if entry is not None:
+                if tokens is None:
+                    tokens = (
+                        self.mapping_index if self.mapping_index is not None else list(self.encoded_mappings.values())
+                    )
+                if not self._has_mapping_version(entry['mapping'], tokens) \
+                        or entry['member']['compress_type'] != self.outputs.compression:
+                    entry = None
+            if entry is not None:
+                output_name = self.unique_output_name(queue_item.output_name())
+                shard = self.outputs.shard_for(queue_item, output_name, entry['member']['compress_size'])
+                if self.manifest.copy_member(entry, output_name, shard.zip_file):
+                    self.save_supporting_files(queue_item.config.get_supporting_files(queue_item.path), shard)
+                    self.checkpoint(queue_item, output_name)
+                    print(f'Reused output of file {queue_item}')
+                    continue
+                self.output_names.discard(output_name)
+                self.outputs.discard(output_name)
+            queue.append(queue_item)
+            filesizes.append(filesize)
+
+        if len(queue) < len(self.queue):
+            print(f'Reused outputs of {len(self.queue) - len(queue)} files from the previous run')
+        self.queue, self.filesizes = queue, filesizes
+        self.manifest.finish_reuse()
+
+    def mapping_version(self) -> dict[str, Any]:
+        """
+        Identifies the mappings an output was made with. Mappings only grow, so later ones still have the same
+        entries at the start. With a key, a fingerprint of it is included, as it decides the tokens too.
+        """
+        key = None
+        if self.token_key is not None:
+            key = hmac.new(self.token_key, b'mapping-version', hashlib.sha256).hexdigest()[:16]
+        mappings = self.encoded_mappings if self.mapping_index is None else self.mapping_index
+        return {'key': key, 'count': len(mappings), 'last': mappings.last_token()}
+
+    def _has_mapping_version(self, version: dict[str, Any], tokens: Union[list[str], MappingIndex]) -> bool:
+        if version['key'] != self.mapping_version()['key']:
+            return False
+        count = version['count']
+        if isinstance(tokens, MappingIndex):
+            return count == 0 or (count <= len(tokens) and tokens.token_at(count - 1) == version['last'])
+        return count == 0 or (count <= len(tokens) and tokens[count - 1] == version['last'])
+
+    def checkpoint(
+        self,
+        queue_item: QueueItem,
+        output_name: str,
+        mapping_version: Optional[dict[str, Any]] = None,
+    ) -> None:
+        """
+        Records that the output of the file is complete. Mappings are saved by then, the output is flushed to disk
+        before the entry is written.
+        """
+        if self.manifest is None or queue_item.config.identity is None:
+            return
+        shard = self.outputs.members[output_name]
+        shard.zip_file.fp.flush()
+        os.fsync(shard.zip_file.fp.fileno())
+        self.manifest.record(
+            queue_item.path,
+            self.manifest.input_digest(queue_item.path),
+            queue_item.config,
+            queue_item.operation,
+            mapping_version or self.mapping_version(),
+            shard.zip_file.getinfo(output_name),
+            shard.name,
+        )
+
+    def add_mappings(self, mappings: Iterable[tuple[str, str]]) -> None:
+        for value, encoded in mappings:
+            known = self.encoded_mappings.get(value)
+            if known == encoded:
+                continue
+            if known is not None or encoded in self.encoded_mappings.inverse:
+                # Only possible with keyed tokens derived in separate processes, which can't see each other.
+                raise ValueError(f'Token {encoded} was issued for different values, run again without --jobs')
+            self.encoded_mappings.add(value, encoded)
+            self._record_mapping(value, encoded)
+
     def save_mappings(self):
-        # TODO: write to temp and rename?
-        with open(self.output_directory / self.MAPPING_FILE_NAME, mode="w", encoding='utf-8') as f:
-            writer = csv.writer(f, dialect='excel-tab')
-            writer.writerows(self.encoded_mappings.items())
+        """
+        Appends the pending mappings to the mapping file.
+        """
+        if not self.mapping_file_synced:
+            self.compact_mappings()
+            return
+        if not self.pending_mappings:
+            return
+
+        self._save_token_allocator()
+        if self.mapping_journal is None:
+            # No matter other encodings, mappings are always saved as `utf-8`.
+            self.mapping_journal = open(self.mapping_path, mode='a', encoding='utf-8')
+        writer = csv.writer(self.mapping_journal, dialect='excel-tab')
+        writer.writerows(self.pending_mappings)
+        self.mapping_journal.flush()
+        os.fsync(self.mapping_journal.fileno())
+        self.pending_mappings.clear()
+
+    def compact_mappings(self):
+        """
+        Rewrites the mapping file with exactly the current mappings.
+
+        The file is written next to the old one and renamed over it, so a crash leaves either of them complete.
+        """
+        self._close_mapping_journal()
+        self._save_token_allocator()
+        temp_path = self.mapping_path.with_name(f'.{self.MAPPING_FILE_NAME}.tmp')
+        try:
+            with open(temp_path, mode='w', encoding='utf-8') as f:
+                writer = csv.writer(f, dialect='excel-tab')
+                writer.writerows(self.encoded_mappings.items())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.mapping_path)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+        self.pending_mappings.clear()
+        self.mapping_file_synced = True
+
+    def _save_token_allocator(self) -> None:
+        if self.token_key is not None:
+            return
+        if self.mapping_registry is not None:
+            # Mappings that are saved now may come from the registry, its count is ahead.
+            self.token_allocator.count = self.mapping_registry.token_count()
+        self.token_allocator.save(self.mapping_path)
+
+    def _close_mapping_journal(self):
+        if self.mapping_journal is not None:
+            self.mapping_journal.close()
+            self.mapping_journal = None
 
     def load_mappings(self, path):
+        path = Path(path)
+        row_count = 0
+
+        def entries(rows: Iterable[list[str]]) -> Iterator[tuple[str, str]]:
+            nonlocal row_count
+            for row in rows:
+                row_count += 1
+                # An entry torn by a crash while it was appended to the journal is skipped.
+                if len(row) == 2 and ENC_PATTERN.fullmatch(row[1]):
+                    yield row[0], row[1]
+
         # No matter other encodings, mappings are always saved as `utf-8`.
         with open(path, mode="r", encoding='utf-8') as f:
-            reader = csv.reader(f, dialect='excel-tab')
-            self.encoded_mappings = dict((x[1], x[0]) for x in reader if len(x) == 2)
-            self.encoded_values = set(self.encoded_mappings.values())
+            # Rows are added as they're read, without keeping all of them.
+            self.encoded_mappings = MappingStore(entries(csv.reader(f, dialect='excel-tab')))
+        self.token_allocator = TokenAllocator.load(path, self.encoded_mappings)
+
+        # Appending can go on only to the journal itself, when nothing in it was skipped and its last entry is
+        # complete. Otherwise, it's compacted on the next save.
+        self.pending_mappings.clear()
+        self.mapping_file_synced = (
+            self.mapping_path.exists() and path.samefile(self.mapping_path)
+            and row_count == len(self.encoded_mappings) and self._ends_with_newline(path)
+        )
+
+    def open_mapping_index(self, path) -> None:
+        """
+        For Decode, looks tokens up in the index of the mapping file (see `MappingIndex`), which is built first when
+        it's missing or out of date. When the index can't be written, the mappings are loaded instead.
+        """
+        path = Path(path)
+        try:
+            self.mapping_index = MappingIndex.open(path)
+        except OSError as e:
+            if not path.exists():
+                raise
+            print(f'Could not use an index of {path} ({e}), loading it instead')
+            self.load_mappings(path)
+
+    @staticmethod
+    def _ends_with_newline(path: Path) -> bool:
+        with open(path, mode='rb') as f:
+            if f.seek(0, os.SEEK_END) == 0:
+                return True
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.output_zipfile.close()
-        for f in self.input_zipfiles.values():
-            f.close()
-        if self.should_save_mappings:
-            self.save_mappings()
+        with self.run_stage('close'):
+            self.outputs.close()
+            if self.compression_executor is not None:
+                self.compression_executor.shutdown()
+            # Archives the worker listed may be shared with other code still reading them.
+            ZIP_HANDLES.release()
+            if self.manifest is not None:
+                self.manifest.close()
+            if self.should_save_mappings:
+                self.save_mappings()
+            self._close_mapping_journal()
+            if self.mapping_index is not None:
+                self.mapping_index.close()
+        if self.profiler is not None:
+            print(f'Profile saved to {self.profiler.save(self.output_directory)}')
+        if self.events is not None:
+            if exc_type is not None:
+                self.emit_event('error', message=f'{exc_type.__name__}: {exc_val}')
+            self.events.close()
+
+
+class MappingRegistry:
+    """
+    Hands out tokens for all processes of a `--jobs` run. It lives in a manager process and is used through a proxy.
+    """
+
+    def __init__(self, encoded_mappings: MappingStore, token_allocator: TokenAllocator):
+        self.encoded_mappings = encoded_mappings.copy()
+        self.token_allocator = token_allocator
+        # Manager serves each connection in a separate thread.
+        self.lock = threading.Lock()
+
+    def encode_value(self, value: str) -> str:
+        with self.lock:
+            try:
+                return self.encoded_mappings[value]
+            except KeyError:
+                encoded = self.token_allocator.new_token(self.encoded_mappings.issued_tokens)
+                self.encoded_mappings.add(value, encoded)
+                return encoded
+
+    def token_count(self) -> int:
+        with self.lock:
+            return self.token_allocator.count
+
+
+class MappingManager(BaseManager):
+    pass
+
+
+MappingManager.register('MappingRegistry', MappingRegistry)
+
+
+class PoolWorker:
+    """
+    Stands in for the `Worker` inside a pool process. Random tokens that aren't known yet are requested from
+    the registry, keyed tokens are derived locally. New mappings are sent back with the output of each file.
+    """
+
+    def __init__(
+        self,
+        registry: Optional[MappingRegistry],
+        token_key: Optional[bytes],
+        encoded_mappings: MappingStore,
+        mapping_index: Optional[MappingIndex] = None,
+    ):
+        self.registry = registry
+        self.token_key = token_key
+        self.encoded_mappings = encoded_mappings
+        self.mapping_index = mapping_index
+        self.new_mappings: list[tuple[str, str]] = []
+
+    def encode_value(self, value: str) -> str:
+        try:
+            return self.encoded_mappings[value]
+        except KeyError:
+            if self.token_key is None:
+                encoded = self.registry.encode_value(value)
+            else:
+                encoded = keyed_token(self.token_key, value, self.encoded_mappings.issued_tokens)
+            self.encoded_mappings.add(value, encoded)
+            self.new_mappings.append((value, encoded))
+            return encoded
+
+    def pop_new_mappings(self) -> list[tuple[str, str]]:
+        new_mappings, self.new_mappings = self.new_mappings, []
+        return new_mappings
+
+    def encoded_replace(self, match: re.Match):
+        if self.mapping_index is not None:
+            return self.mapping_index[match.group()]
+        return self.encoded_mappings.inverse[match.group()]
+
+
+class ValueCollector:
+    """
+    Stands in for the `Worker` in the first pass of `--two-pass`. Values are recorded instead of being encoded, so
+    that their tokens can be allocated all at once before the second pass (see `Worker.allocate_tokens`).
+    """
+
+    def __init__(self):
+        # Values in the order in which they're found, without duplicates.
+        self.values: dict[Any, None] = {}
+
+    def encode_value(self, value: str) -> str:
+        self.values[value] = None
+        return value
+
+
+_POOL_WORKER: Optional[PoolWorker] = None
+
+
+def _reopen_archives_in_pool() -> None:
+    """
+    Archives a forked pool process inherits from the main process share their file offsets with it and the other
+    pool processes, so their handles are dropped and the archives are opened again when `ZipPath`s are unpickled.
+    """
+    ZIP_HANDLES.close()
+
+
+_PROGRESS_COUNTERS: Optional[MutableSequence[int]] = None
+
+
+def _init_pool_process(
+    registry: Optional[MappingRegistry],
+    token_key: Optional[bytes],
+    encoded_mappings: MappingStore,
+    mapping_index: Optional[MappingIndex],
+    progress_counters: MutableSequence[int],
+    hash_inputs: bool,
+) -> None:
+    global _POOL_WORKER, _PROGRESS_COUNTERS, _INPUT_DIGESTS
+    _reopen_archives_in_pool()
+    _INPUT_DIGESTS = {} if hash_inputs else None
+    _POOL_WORKER = PoolWorker(registry, token_key, encoded_mappings, mapping_index)
+    _PROGRESS_COUNTERS = progress_counters
+
+
+def _process_in_pool(
+    queue_item: QueueItem,
+    index: int,
+    output_name: str,
+    part_path: Path,
+    compression: int,
+    compresslevel: Optional[int],
+    profile: bool,
+) -> tuple[list[tuple[str, str]], Optional[FileProfile], Optional[str]]:
+    """Transforms a file, returns its new mappings, its profile and the digest of the input, when it's hashed."""
+    file_profile = FileProfile(queue_item) if profile else None
+    # Outputs are compressed here, the main process copies them as they are.
+    with zipfile.ZipFile(part_path, mode='w', compression=compression, compresslevel=compresslevel) as part_zipfile:
+        with open_zip_member(part_zipfile, output_name) as output_stream, FileProgress(_PROGRESS_COUNTERS, index):
+            queue_item.transform(_POOL_WORKER, output_stream, file_profile)
+    digest = _INPUT_DIGESTS.pop(str(queue_item.path), None) if _INPUT_DIGESTS is not None else None
+    return _POOL_WORKER.pop_new_mappings(), file_profile, digest
+
+
+def _process_part_in_pool(
+    queue_item: QueueItem,
+    slot: int,
+    part_path: Path,
+    profile: bool,
+) -> tuple[list[tuple[str, str]], Optional[FileProfile]]:
+    """
+    Transforms a part of a split file. Its output isn't compressed here, outputs of all parts are compressed together
+    into a single member when the main process concatenates them (see `Worker._write_parts`).
+    """
+    file_profile = FileProfile(queue_item) if profile else None
+    with open(part_path, mode='wb') as output_stream, FileProgress(_PROGRESS_COUNTERS, slot):
+        queue_item.transform(_POOL_WORKER, output_stream, file_profile)
+    return _POOL_WORKER.pop_new_mappings(), file_profile
+
+
+def _collect_in_pool(queue_item: QueueItem) -> list[Any]:
+    return queue_item.collect_values()
 
 
 class BaseConfig:
@@ -237,6 +2833,8 @@ class BaseConfig:
         self.file_mask = file_mask
         self.carrier = carrier
         self.encoding = encoding
+        # Digest of the parameters of a loaded config, outputs are reused by `--resume` only while it's the same.
+        self.identity: Optional[str] = None
 
     def __str__(self) -> str:
         return f'{self.carrier} with mask {self.file_mask}'
@@ -247,13 +2845,23 @@ class BaseConfig:
     def get_supporting_files(self, in_file: FilePath) -> list[FilePath]:
         return []
 
+    def split_file(self, in_file: FilePath, part_size: int) -> list[FilePath]:
+        """
+        Parts of about `part_size` bytes, whose outputs make that of the file when they're concatenated in order.
+        Files that can't be split that way are a single part.
+        """
+        return [in_file]
+
     def make_destination_buffer(self) -> BUFFER_TYPE:
         return io.TextIOWrapper(buffer=io.BytesIO(), encoding=self.encoding)
 
-    def make_buffer_binary(self, destination_buffer: BUFFER_TYPE) -> bytes:
-        destination_buffer.seek(0)
-        data = destination_buffer.read()
-        return data.encode(self.encoding)
+    @contextlib.contextmanager
+    def open_destination(self, stream: BinaryIO) -> Iterator[BUFFER_TYPE]:
+        # Lines are written as they are, inputs are read with universal newlines and CSV writes `\n` only.
+        destination = io.TextIOWrapper(buffer=stream, encoding=self.encoding, newline='')
+        yield destination
+        # Stream is closed by whoever opened it.
+        destination.detach()
 
     @abstractmethod
     def encode_file(self, in_file: FilePath, worker: Worker, destination: BUFFER_TYPE) -> None:
@@ -276,11 +2884,106 @@ class BaseConfig:
         }
 
 
+def user_cache_directory() -> Optional[Path]:
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return Path(base) / 'byteanalytics-anonymizer' if base else None
+
+
+class ConfigRouter:
+    """
+    Finds the configs whose file mask matches a file name. All masks are tried by a single expression,
+    and the results are kept by file name, as an archive tree can have many members that match nothing.
+    """
+    GROUP_PREFIX: ClassVar[str] = 'config_'
+    # Numbered references would point to other groups once the masks are combined.
+    BACKREFERENCE: ClassVar[re.Pattern] = re.compile(r'\\[1-9]|\(\?P=|\(\?\(')
+
+    def __init__(self, configs: list[BaseConfig]):
+        self.configs = list(configs)
+        self.patterns = [re.compile(config.file_mask) for config in self.configs]
+        self.combined: Optional[Callable[[str], Optional[re.Match]]] = None
+        if self.configs and not any(self.BACKREFERENCE.search(config.file_mask) for config in self.configs):
+            try:
+                self.combined = re.compile('|'.join(
+                    f'(?P<{self.GROUP_PREFIX}{index}>{config.file_mask})' for index, config in enumerate(self.configs)
+                )).match
+            except re.error:
+                # Masks that don't combine (e.g. same group names, inline flags) are tried one by one.
+                pass
+        self.routes: dict[str, tuple[BaseConfig, ...]] = {}
+
+    def get_configs(self, filename: str) -> tuple[BaseConfig, ...]:
+        """All matching configs, in the order of the configuration file."""
+        try:
+            return self.routes[filename]
+        except KeyError:
+            pass
+
+        if self.combined is None:
+            first = 0
+        else:
+            result = self.combined(filename)
+            # Alternatives are tried in order, so the group is the first matching config.
+            first = len(self.configs) if result is None else int(result.lastgroup[len(self.GROUP_PREFIX):])
+        configs = self.routes[filename] = tuple(
+            self.configs[index] for index in range(first, len(self.configs)) if self.patterns[index].match(filename)
+        )
+        return configs
+
+
+class RoutingReport:
+    """
+    Files found by `Worker.find_files` that matched no config, or more than one. Files that a config reads along
+    with the files it matches (e.g. the external headers of Rogers) aren't reported, wherever they are listed.
+    """
+    # Files listed by the summary of each kind, the rest are only counted.
+    LISTED_FILES: ClassVar[int] = 20
+
+    def __init__(self):
+        self.unrouted: list[str] = []
+        self.supporting: set[str] = set()
+        self.ambiguous: dict[str, tuple[BaseConfig, ...]] = {}
+
+    @property
+    def unmatched(self) -> list[str]:
+        return [path for path in self.unrouted if path not in self.supporting]
+
+    def add(self, path: str, configs: tuple[BaseConfig, ...], supporting_files: Iterable[str] = ()) -> None:
+        if not configs:
+            self.unrouted.append(path)
+        elif len(configs) > 1:
+            self.ambiguous[path] = configs
+        self.supporting.update(supporting_files)
+
+    def summary(self) -> list[str]:
+        lines = []
+        unmatched = self.unmatched
+        if unmatched:
+            lines.append(f'{len(unmatched)} files matched no configuration:')
+            lines.extend(f'  {path}' for path in unmatched[:self.LISTED_FILES])
+            if len(unmatched) > self.LISTED_FILES:
+                lines.append(f'  ... and {len(unmatched) - self.LISTED_FILES} more')
+        for path, configs in list(self.ambiguous.items())[:self.LISTED_FILES]:
+            lines.append(f'File {path} matched {len(configs)} configurations, using {configs[0]}: '
+                         + '; '.join(str(config) for config in configs[1:]))
+        if len(self.ambiguous) > self.LISTED_FILES:
+            lines.append(f'... and {len(self.ambiguous) - self.LISTED_FILES} more files matched several configurations')
+        return lines
+
+
 class ConfigFactory:
     REGISTERED: ClassVar[dict[str, Type[BaseConfig]]] = {}
     LOADED: ClassVar[list[BaseConfig]] = []
+    ROUTER: ClassVar[Optional[ConfigRouter]] = None
     COMMON_TAG: ClassVar[str] = 'common'
     DEFAULT_CONFIGURATION: ClassVar[Path] = Path(__file__).parent / Path('./config.toml')
+    # Parsed configuration is kept there between runs (see `read_configuration`), `None` turns it off.
+    CACHE_DIRECTORY: ClassVar[Optional[Path]] = user_cache_directory()
 
     @classmethod
     def register(cls, config_class: Type[ConfigType]) -> Type[ConfigType]:
@@ -289,8 +2992,13 @@ class ConfigFactory:
 
     @classmethod
     def get_config(cls, filename: str) -> Optional[BaseConfig]:
-        cls.load_configuration()
-        return next((config for config in cls.LOADED if config.matches(filename)), None)
+        return next(iter(cls.get_configs(filename)), None)
+
+    @classmethod
+    def get_configs(cls, filename: str) -> tuple[BaseConfig, ...]:
+        if cls.ROUTER is None:
+            cls.load_configuration()
+        return cls.ROUTER.get_configs(filename)
 
     @classmethod
     def get_config_descriptions(cls) -> Iterator[dict[str, str]]:
@@ -304,7 +3012,7 @@ class ConfigFactory:
             return
 
         config_path = cls.DEFAULT_CONFIGURATION
-        toml_data = toml.loads(config_path.read_text())
+        toml_data = cls.read_configuration(config_path)
 
         for namespace, values_map in toml_data.items():
             common_values = values_map.get(cls.COMMON_TAG, {})
@@ -315,13 +3023,68 @@ class ConfigFactory:
                 full_params: dict = parameters.copy()
                 full_params.update(**common_values)
 
+                parameters_digest = hashlib.sha256(json.dumps(full_params, sort_keys=True).encode()).hexdigest()
                 config_class_name = full_params.pop('config_class')
                 config_class = cls.REGISTERED[config_class_name]
                 instance = config_class(**full_params)  # noqa
+                instance.identity = f'{namespace}.{sub_namespace}:{parameters_digest}'
                 cls.LOADED.append(instance)
 
+        cls.ROUTER = ConfigRouter(cls.LOADED)
         print(f'Loaded {len(cls.LOADED)} configuration options.')
 
+    @classmethod
+    def read_configuration(cls, config_path: Path) -> dict[str, Any]:
+        """
+        Parsing TOML takes longer than the rest of the start up, so the parsed configuration is cached as JSON.
+        The cache is used while the configuration file has the same modification time and size, or the same content.
+        """
+        cache_path = None
+        if cls.CACHE_DIRECTORY is not None:
+            path_digest = hashlib.sha256(str(config_path.resolve()).encode()).hexdigest()[:16]
+            cache_path = cls.CACHE_DIRECTORY / f'config-{path_digest}.json'
+
+        cached = {}
+        if cache_path is not None:
+            try:
+                cached = json.loads(cache_path.read_text(encoding='utf-8'))
+            except (OSError, ValueError):
+                pass
+            if not isinstance(cached, dict) or not isinstance(cached.get('configuration'), dict):
+                cached = {}
+
+        stat = config_path.stat()
+        if cached and [cached.get('mtime_ns'), cached.get('size')] == [stat.st_mtime_ns, stat.st_size]:
+            return cached['configuration']
+
+        text = config_path.read_text()
+        digest = hashlib.sha256(text.encode()).hexdigest()
+        if cached and cached.get('sha256') == digest:
+            configuration = cached['configuration']
+        else:
+            import toml
+
+            configuration = toml.loads(text)
+
+        if cache_path is not None:
+            entry = {
+                'mtime_ns': stat.st_mtime_ns,
+                'size': stat.st_size,
+                'sha256': digest,
+                'configuration': configuration,
+            }
+            # Runs can start at the same time, each of them replaces the whole file.
+            temporary_path = cache_path.with_name(f'{cache_path.name}.{os.getpid()}.tmp')
+            try:
+                cache_path.parent.mkdir(parents=True, exist_ok=True)
+                temporary_path.write_text(json.dumps(entry), encoding='utf-8')
+                os.replace(temporary_path, cache_path)
+            except (OSError, TypeError):
+                # Values that JSON can't hold (e.g. dates) aren't cached.
+                with contextlib.suppress(OSError):
+                    temporary_path.unlink()
+        return configuration
+
 
 class Condition(NamedTuple):
     replace_where: str
@@ -341,6 +3104,15 @@ class Condition(NamedTuple):
                 f'Unknown operator {self.comparison_operator}, use one of {list(operators.keys())}'
             ) from ex
 
+    def compile(self) -> Callable[[str], bool]:
+        """Same as `does_match`, with the operator looked up just once."""
+        operators = {
+            '==': self.has_value.__eq__,
+            '!=': self.has_value.__ne__,
+        }
+        # Unknown operator is reported by `does_match` once there's a value to compare.
+        return operators.get(self.comparison_operator, self.does_match)
+
 
 class SingleReplacement(NamedTuple):
     value: str
@@ -351,31 +3123,141 @@ class SingleReplacement(NamedTuple):
         in_str[self.span_start: self.span_end] = list(self.value)
 
 
+def literal_prefix(expression: str) -> tuple[bool, str]:
+    """
+    Tells if the expression is anchored to the start, and which text any match of it starts with.
+
+    Only plain characters and escaped punctuation are taken, so the prefix may be shorter than it could be, or empty.
+    """
+    if '|' in expression:
+        # Alternatives don't need to share a prefix.
+        return False, ''
+
+    anchored = expression.startswith('^')
+    position = 1 if anchored else 0
+    prefix = []
+    while position < len(expression):
+        char = expression[position]
+        if char == '\\':
+            escaped = expression[position + 1: position + 2]
+            if escaped in LITERAL_ESCAPES:
+                char = LITERAL_ESCAPES[escaped]
+            elif escaped and not escaped.isalnum() and escaped != '_':
+                char = escaped
+            else:
+                break
+            width = 2
+        elif char in '.^$*+?{}[]()':
+            break
+        else:
+            width = 1
+
+        quantifier = expression[position + width: position + width + 1]
+        if quantifier and quantifier in '*?{':
+            # The character is optional.
+            break
+        prefix.append(char)
+        if quantifier == '+':
+            break
+        position += width
+    return anchored, ''.join(prefix)
+
+
 class EncodeRegex:
     def __init__(self, expression: str):
         self.expression = expression
+        self.pattern = re.compile(expression)
+        self.anchored, self.prefix = literal_prefix(expression)
 
     def encode(self, value: str, encoder: Callable[[str], str]) -> str:
-        result = re.search(self.expression, value)
-        if result is None or len(result.groupdict()) == 0:
+        if not self.pattern.groupindex:
             return value
+        result = self.pattern.search(value)
+        if result is None:
+            return value
+        return self.replace(value, result, encoder)
 
-        # We need to replace elements in this string from the back, to ensure that
-        # indices will always point to the right place in the output string.
+    def replace(self, value: str, result: re.Match, encoder: Callable[[str], str]) -> str:
         replacements = []
         for group_name, group_value in result.groupdict().items():
             span_start, span_end = result.span(group_name)
             replacement_value = encoder(group_value)
             replacements.append(SingleReplacement(replacement_value, span_start, span_end))
 
-        # Replacing non-mutable string with a list of single characters that we'll work on.
+        # Usually groups follow each other, and the output is put together from the spans.
+        replacements.sort(key=lambda elem: elem.span_start)
+        pieces = []
+        position = 0
+        for replacement in replacements:
+            if replacement.span_start < position or (pieces and replacement.span_end == position):
+                return self._splice(value, replacements)
+            pieces.append(value[position:replacement.span_start])
+            pieces.append(replacement.value)
+            position = replacement.span_end
+        pieces.append(value[position:])
+        return ''.join(pieces)
+
+    @staticmethod
+    def _splice(value: str, replacements: list[SingleReplacement]) -> str:
+        # Groups that are nested, empty next to each other, or didn't match (span -1) are replaced from the back,
+        # to ensure that indices will always point to the right place in the output string.
         out_value = list(value)
         for replacement in sorted(replacements, key=lambda elem: elem.span_end, reverse=True):
             replacement.apply(out_value)
-
         return ''.join(out_value)
 
 
+class EncodeRegexEngine:
+    """
+    Applies the expressions to a line one after another, like `EncodeRegex.encode` of each of them would.
+
+    A line is tested only against expressions that could match it: the ones anchored to a literal prefix are picked
+    by the first characters of the line, and the others are only searched when their literal prefix is in the line.
+    """
+    KEY_LENGTH: ClassVar[int] = 2
+
+    def __init__(self, regexes: list[EncodeRegex]):
+        self.regexes = regexes
+        # Expressions without named groups never change anything.
+        self.entries = [
+            (index, regex, regex.anchored, regex.prefix, regex.pattern.search)
+            for index, regex in enumerate(regexes) if regex.pattern.groupindex
+        ]
+        # Start of a line -> expressions that could match it, built on the first line with that start.
+        self.by_key: dict[str, list[tuple]] = {}
+
+    def candidates(self, line: str) -> list[tuple]:
+        key = line[:self.KEY_LENGTH]
+        try:
+            return self.by_key[key]
+        except KeyError:
+            candidates = self.by_key[key] = [
+                entry for entry in self.entries
+                if not entry[2] or entry[3].startswith(key) or key.startswith(entry[3])
+            ]
+            return candidates
+
+    def encode(self, line: str, encoder: Callable[[str], str]) -> str:
+        candidates = self.candidates(line)
+        position = 0
+        while position < len(candidates):
+            index, regex, anchored, prefix, search = candidates[position]
+            position += 1
+            if not (line.startswith(prefix) if anchored else prefix in line):
+                continue
+            result = search(line)
+            if result is None:
+                continue
+
+            encoded = regex.replace(line, result, encoder)
+            if encoded[:self.KEY_LENGTH] != line[:self.KEY_LENGTH]:
+                # Other expressions could match from now on.
+                candidates = [candidate for candidate in self.candidates(encoded) if candidate[0] > index]
+                position = 0
+            line = encoded
+        return line
+
+
 # Simplification for working with tables.
 # Note: inheriting a NamedTuple is a pain.
 class TableEncodeRegex(EncodeRegex):
@@ -384,6 +3266,10 @@ class TableEncodeRegex(EncodeRegex):
         self.replace_where = replace_where
 
 
+class _NeedsQuoting(Exception):
+    pass
+
+
 @ConfigFactory.register
 class CSVConfig(BaseConfig):
     CONFIG_TYPE = 'csv-config'
@@ -413,6 +3299,8 @@ class CSVConfig(BaseConfig):
         self.skip_initial_lines = skip_initial_lines
         self.external_header_file = external_header_file
         self.external_header_format = external_header_format
+        # The same header file is used by many data files.
+        self.fieldnames_cache: dict[tuple, list[str]] = {}
 
     def _process(
         self,
@@ -420,38 +3308,132 @@ class CSVConfig(BaseConfig):
         worker: Worker,
         destination: io.TextIOWrapper,
         mapper: Callable[[dict[str, str], Worker, dict[str, str]], dict[str, str]],
+        plan_compiler: Optional[Callable[[Sequence[str], Worker, dict[str, str]], Optional[RowPlan]]] = None,
     ) -> None:
         with self.make_csv_reader_writer(in_file, destination) as (reader, writer):
             stripped_fieldnames = {key.strip(): key for key in reader.fieldnames}
 
             # In case of some operators, they can have multiple header rows at the start of the file.
             additional_headers = []
-            while (len(additional_headers) + 1) < self.num_headers:
+            while (len(additional_headers) + 1) < self.num_headers and not self.is_continuation(in_file):
                 additional_headers.append(next(reader))
 
-            if self.external_header_file is None:
+            if self.external_header_file is None and not self.is_continuation(in_file):
                 writer.writeheader()
                 # Write additional header lines back to the anonymized file.
                 writer.writerows(additional_headers)
 
-            for row in reader:
-                mapped_row = mapper(row, worker, stripped_fieldnames)
-                writer.writerow(mapped_row)
+            reader.reader = counted_rows(reader.reader, worker)
+            plan = plan_compiler and plan_compiler(reader.fieldnames, worker, stripped_fieldnames)
+            if plan is None:
+                for row in reader:
+                    mapped_row = mapper(row, worker, stripped_fieldnames)
+                    writer.writerow(mapped_row)
+                return
+
+            # Rows are mapped as lists, straight between the underlying reader and writer.
+            # Rows that don't fit the header are left to the dicts, which fill in or collect the missing values.
+            width = len(reader.fieldnames)
+            write = writer.writer.writerow
+            for values in reader.reader:
+                if len(values) == width:
+                    write(plan(list(values)))
+                elif values != []:  # `DictReader` skips empty records.
+                    writer.writerow(mapper(self._row_dict(reader, values), worker, stripped_fieldnames))
+
+    @staticmethod
+    def _row_dict(reader: csv.DictReader, values: Sequence[Any]) -> dict[Any, Any]:
+        """Builds the row the same way `DictReader` does."""
+        fieldnames = reader.fieldnames
+        row = dict(zip(fieldnames, values))
+        if len(fieldnames) < len(values):
+            row[reader.restkey] = values[len(fieldnames):]
+        else:
+            for key in fieldnames[len(values):]:
+                row[key] = reader.restval
+        return row
 
     def encode_file(self, in_file: FilePath, worker: Worker, destination: io.TextIOWrapper) -> None:
-        self._process(in_file, worker, destination, self.mapper)
+        self._process(in_file, worker, destination, self.mapper, self.compile_row_plan)
 
     def decode_file(self, in_file: FilePath, worker: Worker, destination: io.TextIOWrapper) -> None:
-        self._process(in_file, worker, destination, self.de_mapper)
+        dialect = csv.writer(io.StringIO(), **self.make_csv_config()).dialect
+        if dialect.quoting != csv.QUOTE_MINIMAL or not dialect.doublequote or dialect.escapechar is not None:
+            self._process(in_file, worker, destination, self.de_mapper)
+            return
+
+        # Tokens never contain delimiters, quotes or line breaks, so the text is decoded without parsing it as CSV.
+        # Only records where a value needs quoting after decoding go through CSV.
+        needs_quoting = re.compile(f'[{re.escape(dialect.delimiter + dialect.quotechar)}\r\n]')
+
+        def replace(match: re.Match) -> str:
+            value = worker.encoded_replace(match)
+            if not value or needs_quoting.search(value):
+                raise _NeedsQuoting
+            return value
+
+        with open_input(in_file, mode='r', encoding=self.encoding) as source:
+            for _ in range(self.skip_initial_lines):
+                destination.write(source.readline())
+
+            for block in read_text_blocks(source, dialect.quotechar):
+                if 'enc-' not in block:
+                    destination.write(block)
+                    continue
+                try:
+                    destination.write(ENC_PATTERN.sub(replace, block))
+                except _NeedsQuoting:
+                    self._decode_records(block, worker, destination)
+
+    def _decode_records(self, block: str, worker: Worker, destination: io.TextIOWrapper) -> None:
+        config = self.make_csv_config()
+        writer = csv.writer(destination, **config)  # noqa
+        for row in csv.reader(io.StringIO(block), **config):  # noqa
+            writer.writerow([ENC_PATTERN.sub(worker.encoded_replace, field) for field in row])
 
     def get_supporting_files(self, in_file: FilePath) -> list[FilePath]:
         if self.external_header_file is None:
             return []
         return [self._get_header_file_path(in_file)]
 
+    def split_file(self, in_file: FilePath, part_size: int) -> list[FilePath]:
+        """
+        Splits the records after the initial lines into parts that start right after a record. Only plain files are
+        split, members of archives can't be read from the middle without decompressing all before. Line breaks,
+        quotes and delimiters have to be single bytes that can't be a part of other characters, as in UTF-8 or
+        Latin-1, and quotes have to be escaped by doubling them.
+        """
+        if not isinstance(in_file, Path) or part_size <= 0:
+            return [in_file]
+        size = in_file.stat().st_size
+        dialect = csv.reader(io.StringIO(), **self.make_csv_config()).dialect  # noqa
+        if (
+            size < 2 * part_size
+            or dialect.quoting == csv.QUOTE_NONE
+            or not dialect.doublequote
+            or dialect.escapechar is not None
+            or dialect.skipinitialspace
+            or '\n'.encode(self.encoding) != b'\n'
+            or len(quotechar := dialect.quotechar.encode(self.encoding)) != 1
+            or len(delimiter := dialect.delimiter.encode(self.encoding)) != 1
+        ):
+            return [in_file]
+
+        with in_file.open(mode='rb') as source:
+            for _ in range(self.skip_initial_lines):
+                source.readline()
+            boundaries = [
+                boundary for boundary in record_boundaries(source, source.tell(), part_size, quotechar, delimiter)
+                if boundary < size
+            ]
+        offsets = [0, *boundaries, size]
+        return [FileRange(in_file, start, end) for start, end in zip(offsets, offsets[1:])]
+
     def make_csv_config(self) -> dict[str, str]:
         config = {
             'dialect': self.dialect,
+            # Reading ignores it. Outputs always had `\n` only, as they went through universal newlines translation.
+            'lineterminator': '\n',
         }
         if self.delimiter:
             config['delimiter'] = self.delimiter
@@ -472,7 +3454,22 @@ class CSVConfig(BaseConfig):
         handler_fun = {
             'Rogers': self._load_rogers_fieldnames,
         }[self.external_header_format or self.carrier]
-        return handler_fun(header_file_path)
+
+        cache_key = self._header_cache_key(header_file_path)
+        try:
+            return self.fieldnames_cache[cache_key]
+        except KeyError:
+            fieldnames = self.fieldnames_cache[cache_key] = handler_fun(header_file_path)
+            return fieldnames
+
+    @staticmethod
+    def _header_cache_key(header_file: FilePath) -> tuple:
+        # Path alone isn't enough, archives under the same path can be replaced between runs of a single process.
+        if isinstance(header_file, ZipPath):
+            info = header_file.root.getinfo(header_file.at)  # noqa (at is like a private interface)
+            return str(header_file), info.file_size, info.CRC
+        stat = header_file.stat()
+        return str(header_file), stat.st_size, stat.st_mtime_ns
 
     def _load_rogers_fieldnames(self, header_file: FilePath) -> list[str]:
         """
@@ -507,18 +3504,86 @@ class CSVConfig(BaseConfig):
         destination: io.TextIOWrapper,
     ) -> tuple[csv.DictReader, csv.DictWriter]:
         fieldnames = self._load_fieldnames(in_file)
-        with in_file.open(mode='r',
-                          encoding=self.encoding) as source:  # noqa (all FilePath types support encoding on open)
+        config = self.make_csv_config()
+        if self.is_continuation(in_file):
+            # Initial lines and the header are in the first part.
+            fieldnames = fieldnames or self._read_header(in_file.path)
+        with open_input(in_file, mode='r', encoding=self.encoding) as source:
             # We can have a header that doesn't provide any data. It's rewritten "as is".
-            for _ in range(self.skip_initial_lines):
+            for _ in range(0 if self.is_continuation(in_file) else self.skip_initial_lines):
                 line = source.readline()
                 destination.writelines([line])  # noqa
 
-            config = self.make_csv_config()
             reader = csv.DictReader(f=source, fieldnames=fieldnames, **config)  # noqa
             writer = csv.DictWriter(f=destination, fieldnames=fieldnames or reader.fieldnames, **config)
             yield reader, writer
 
+    @staticmethod
+    def is_continuation(in_file: FilePath) -> bool:
+        """Whether it's a part of a split file other than the first one, see `split_file`."""
+        return isinstance(in_file, FileRange) and not in_file.is_first
+
+    def _read_header(self, in_file: Path) -> list[str]:
+        with in_file.open(mode='r', encoding=self.encoding) as source:
+            for _ in range(self.skip_initial_lines):
+                source.readline()
+            return csv.DictReader(f=source, **self.make_csv_config()).fieldnames  # noqa
+
+    def compile_row_plan(
+        self,
+        fieldnames: Sequence[str],
+        worker: Worker,
+        fieldnames_mapping: dict[str, str],
+    ) -> Optional[RowPlan]:
+        """
+        Does what `mapper` does, on a row as a list. Columns, conditions and expressions are resolved
+        once per file, instead of once per row.
+        Returns `None` when only `mapper` gives the right result.
+        """
+        if not fieldnames or len(set(fieldnames)) != len(fieldnames):
+            # Duplicate columns share a single value in the row dict.
+            return None
+
+        positions = {name: position for position, name in enumerate(fieldnames)}
+        try:
+            clear_positions = [positions[fieldnames_mapping[key]] for key in self.clear_columns]
+            encode_positions = [positions[fieldnames_mapping[key]] for key in self.encode_columns]
+            conditions = [
+                (
+                    positions[fieldnames_mapping[condition.if_column]],
+                    condition.compile(),
+                    positions[fieldnames_mapping[condition.replace_where]],
+                )
+                for condition in self.encode_conditional
+            ]
+            regexes = [
+                (positions[fieldnames_mapping[encode_regex.replace_where]], encode_regex.encode)
+                for encode_regex in self.encode_regex
+            ]
+        except KeyError:
+            # Unknown column is reported by `mapper` once there's a row.
+            return None
+
+        encode = worker.encode_value
+
+        def plan(row: list[Any]) -> list[Any]:
+            for position in clear_positions:
+                row[position] = ''
+
+            for position in encode_positions:
+                row[position] = encode(row[position] or '')
+
+            for if_position, does_match, position in conditions:
+                if does_match(row[if_position].strip()):
+                    row[position] = encode(row[position] or '')
+
+            for position, encode_regex in regexes:
+                row[position] = encode_regex(row[position].strip(), encode)
+
+            return row
+
+        return plan
+
     def mapper(
         self,
         in_data: dict[str, str],
@@ -573,9 +3638,284 @@ class CSVConfig(BaseConfig):
         )
 
 
+class NativeWorkbook:
+    """
+    Lightweight stand-in for a read-only workbook, which reads the shared strings and the active sheet by itself.
+
+    openpyxl still reads the workbook structure and the styles, but no cell objects are created for the sheet:
+    rows come straight from the XML with the same values and padding as `Worksheet.values` of a workbook loaded
+    with `read_only=True, rich_text=True`.
+    """
+    SHARED_STRING_TAG: ClassVar[str] = f'{{{SHEET_MAIN_NS}}}si'
+    TEXT_TAG: ClassVar[str] = f'{{{SHEET_MAIN_NS}}}t'
+    # Whether the installed openpyxl has the private parts this relies on, see `is_supported`.
+    SUPPORTED: ClassVar[Optional[bool]] = None
+
+    @classmethod
+    def is_supported(cls) -> bool:
+        """
+        The reader uses private parts of openpyxl (the sheet parser, and attributes of its workbook and reader),
+        which another version of openpyxl may not have. Without them, workbooks are read by openpyxl itself.
+        """
+        if cls.SUPPORTED is None:
+            try:
+                from openpyxl.reader.excel import ExcelReader
+                from openpyxl.workbook import Workbook
+                from openpyxl.worksheet._reader import WorkSheetParser
+            except ImportError:
+                cls.SUPPORTED = False
+            else:
+                workbook = Workbook()
+                cls.SUPPORTED = (
+                    hasattr(workbook, '_date_formats') and hasattr(workbook, '_active_sheet_index')
+                    and all(hasattr(ExcelReader, name) for name in ('read_manifest', 'read_workbook'))
+                    and hasattr(WorkSheetParser, 'parse_cell')
+                )
+        return cls.SUPPORTED
+
+    def __init__(self, source: BinaryIO):
+        from openpyxl.reader.excel import ExcelReader
+        from openpyxl.styles.stylesheet import apply_stylesheet
+        from openpyxl.xml.constants import SHARED_STRINGS
+
+        reader = ExcelReader(source, read_only=True, rich_text=True)
+        reader.read_manifest()
+        reader.read_workbook()
+        apply_stylesheet(reader.archive, reader.wb)
+
+        self.archive = reader.archive
+        self.epoch = reader.wb.epoch
+        self.date_formats = reader.wb._date_formats
+        # Same sheets as `ExcelReader.read_worksheets` adds, without reading the dimensions of each of them.
+        self.sheets = [
+            (sheet.name, rel.target) for sheet, rel in reader.parser.find_sheets() if rel.target in reader.valid_files
+        ]
+        self.active_index = reader.wb._active_sheet_index
+
+        strings_part = reader.package.find(SHARED_STRINGS)
+        self.shared_strings = [] if strings_part is None else self._read_shared_strings(strings_part.PartName[1:])
+
+    @property
+    def active(self) -> 'NativeWorksheet':
+        title, worksheet_path = self.sheets[self.active_index]
+        return NativeWorksheet(self, title, worksheet_path)
+
+    def close(self) -> None:
+        self.archive.close()
+
+    def _read_shared_strings(self, path: str) -> list[Any]:
+        from openpyxl.cell.rich_text import CellRichText
+        from openpyxl.xml.functions import iterparse
+
+        strings = []
+        with self.archive.open(path) as source:
+            for _event, node in iterparse(source):
+                if node.tag != self.SHARED_STRING_TAG:
+                    continue
+
+                if len(node) == 1 and node[0].tag == self.TEXT_TAG and node[0].text:
+                    text = node[0].text.replace('x005F_', '')
+                else:
+                    # Rich and phonetic runs are rare, openpyxl builds these.
+                    text = CellRichText.from_tree(node)
+                    if len(text) == 0:
+                        text = ''
+                    elif len(text) == 1 and isinstance(text[0], str):
+                        text = text[0]
+                node.clear()
+                strings.append(text)
+        return strings
+
+
+class NativeWorksheet:
+    DIMENSION_TAG: ClassVar[str] = f'{{{SHEET_MAIN_NS}}}dimension'
+    DATA_TAG: ClassVar[str] = f'{{{SHEET_MAIN_NS}}}sheetData'
+    ROW_TAG: ClassVar[str] = f'{{{SHEET_MAIN_NS}}}row'
+    VALUE_TAG: ClassVar[str] = f'{{{SHEET_MAIN_NS}}}v'
+    FORMULA_TAG: ClassVar[str] = f'{{{SHEET_MAIN_NS}}}f'
+    INLINE_STRING_TAG: ClassVar[str] = f'{{{SHEET_MAIN_NS}}}is'
+    TEXT_TAG: ClassVar[str] = f'{{{SHEET_MAIN_NS}}}t'
+    DIGITS: ClassVar[str] = '0123456789'
+
+    def __init__(self, workbook: NativeWorkbook, title: str, worksheet_path: str):
+        self.workbook = workbook
+        self.title = title
+        self.worksheet_path = worksheet_path
+        self.max_column = self.max_row = None
+
+        from openpyxl.utils.cell import range_boundaries
+        from openpyxl.xml.functions import iterparse
+
+        # Unlike `WorkSheetParser.parse_dimensions`, this stops at the start of the data instead of its end,
+        # so a sheet without the dimension isn't parsed twice.
+        with workbook.archive.open(worksheet_path) as source:
+            for _event, element in iterparse(source, events=('start',)):
+                if element.tag == self.DIMENSION_TAG:
+                    _min_column, _min_row, self.max_column, self.max_row = range_boundaries(element.get('ref'))
+                    break
+                if element.tag == self.DATA_TAG:
+                    break
+
+    @property
+    def values(self) -> Iterator[tuple]:
+        # Same as `ReadOnlyWorksheet._cells_by_row`: rows are padded to the dimension of the sheet, if there's one,
+        # and missing rows are filled in.
+        max_column, max_row = self.max_column, self.max_row
+        empty_row = [] if max_column is None else (None,) * max_column
+
+        counter = 1
+        idx = 1
+        with self.workbook.archive.open(self.worksheet_path) as source:
+            for idx, last_column, cells in self._parse_rows(source):
+                if max_row is not None and idx > max_row:
+                    break
+
+                for _ in range(counter, idx):
+                    counter += 1
+                    yield empty_row
+
+                if counter <= idx:
+                    counter += 1
+                    width = max_column or last_column
+                    if not width:
+                        yield ()
+                        continue
+
+                    row = [None] * width
+                    for column, value in cells:
+                        if column <= width:
+                            row[column - 1] = value
+                    yield tuple(row)
+
+        if max_row is not None and max_row < idx:
+            for _ in range(counter, max_row + 1):
+                yield empty_row
+
+    def _parse_rows(self, source: BinaryIO) -> Iterator[tuple[int, int, list[tuple[int, Any]]]]:
+        """
+        Yields the number of each row, the column of its last cell, and the columns and values of its non-empty cells.
+
+        Values are converted the same way as `WorkSheetParser.parse_cell` of a read-only worksheet does. Formulas,
+        rich inline strings and dates out of range are rare, these are handed over to openpyxl, which keeps the state
+        of shared formulas, too.
+        """
+        from openpyxl.utils.cell import coordinate_to_tuple
+        from openpyxl.utils.datetime import from_excel
+        from openpyxl.worksheet._reader import WorkSheetParser
+        from openpyxl.xml.functions import iterparse
+
+        shared_strings = self.workbook.shared_strings
+        epoch = self.workbook.epoch
+        date_formats = self.workbook.date_formats
+        parser = WorkSheetParser(source, shared_strings, epoch=epoch, date_formats=date_formats)
+        date_styles: dict[Optional[str], bool] = {}
+        columns: dict[str, int] = {}
+        row_tag, value_tag, formula_tag = self.ROW_TAG, self.VALUE_TAG, self.FORMULA_TAG
+        inline_string_tag, text_tag, digits = self.INLINE_STRING_TAG, self.TEXT_TAG, self.DIGITS
+
+        def column_of(coordinate: str) -> int:
+            letters = coordinate.rstrip(digits)
+            column = columns.get(letters)
+            if column is None:
+                column = columns[letters] = coordinate_to_tuple(coordinate)[1]
+            return column
+
+        row_counter = 0
+        for _event, element in iterparse(source):
+            if element.tag != row_tag:
+                continue
+
+            row_number = element.get('r')
+            if row_number is None:
+                row_counter += 1
+            else:
+                try:
+                    row_counter = int(row_number)
+                except ValueError:
+                    float_number = float(row_number)
+                    if not float_number.is_integer():
+                        raise ValueError(f'{row_number} is not a valid row number')
+                    row_counter = int(float_number)
+
+            cells = []
+            col_counter = 0
+            # Column of an empty cell is only needed for the cell after it without a reference, or for the last one.
+            pending_coordinate = None
+            for cell in element:
+                if not len(cell):
+                    # No value, formula or inline string, so the value is None for any type.
+                    coordinate = cell.get('r')
+                    if coordinate:
+                        pending_coordinate = coordinate
+                    else:
+                        if pending_coordinate:
+                            col_counter = column_of(pending_coordinate)
+                            pending_coordinate = None
+                        col_counter += 1
+                    continue
+
+                data_type = cell.get('t', 'n')
+                if len(cell) == 1 and cell[0].tag == value_tag:
+                    value = cell[0].text or None
+                    simple = data_type != 'inlineStr' and data_type != 'd'
+                elif data_type == 'inlineStr' and cell.find(formula_tag) is None:
+                    value = None
+                    simple = True
+                    inline_string = cell.find(inline_string_tag)
+                    if inline_string is not None:
+                        if len(inline_string) == 1 and inline_string[0].tag == text_tag:
+                            value = inline_string[0].text or ''
+                        else:
+                            simple = False
+                else:
+                    value = cell.findtext(value_tag) or None
+                    simple = data_type != 'inlineStr' and data_type != 'd' and cell.find(formula_tag) is None
+
+                if simple and value is not None and data_type != 'inlineStr':
+                    if data_type == 'n':
+                        value = float(value) if '.' in value or 'E' in value or 'e' in value else int(value)
+                        style_id = cell.get('s')
+                        is_date = date_styles.get(style_id)
+                        if is_date is None:
+                            is_date = date_styles[style_id] = (int(style_id) if style_id else 0) in date_formats
+                        if is_date:
+                            try:
+                                value = from_excel(value, epoch)
+                            except (OverflowError, ValueError):
+                                # openpyxl warns about it and gives an error value.
+                                simple = False
+                    elif data_type == 's':
+                        value = shared_strings[int(value)]
+                    elif data_type == 'b':
+                        value = bool(int(value))
+
+                if pending_coordinate:
+                    col_counter = column_of(pending_coordinate)
+                    pending_coordinate = None
+
+                if not simple:
+                    parser.row_counter, parser.col_counter = row_counter, col_counter
+                    parsed = parser.parse_cell(cell)
+                    col_counter = parsed['column']
+                    cells.append((col_counter, parsed['value']))
+                    continue
+
+                coordinate = cell.get('r')
+                if coordinate:
+                    col_counter = column_of(coordinate)
+                else:
+                    col_counter += 1
+                cells.append((col_counter, value))
+
+            if pending_coordinate:
+                col_counter = column_of(pending_coordinate)
+            element.clear()
+            yield row_counter, col_counter, cells
+
+
 class XlsxReader(csv.DictReader):
     class Reader:
-        def __init__(self, worksheet: Worksheet):
+        def __init__(self, worksheet: 'Worksheet'):
             self.generator = worksheet.values
             self.line_num = 0
 
@@ -586,27 +3926,29 @@ class XlsxReader(csv.DictReader):
             self.line_num += 1
             return next(self.generator)
 
-    def __init__(self, worksheet: Worksheet, *args, **kwargs):
+    def __init__(self, worksheet: 'Worksheet', *args, **kwargs):
         super().__init__(f=[], *args, **kwargs)
         self.reader = self.Reader(worksheet)
 
 
 class XlsxWriter(csv.DictWriter):
     class Writer:
-        def __init__(self, original: Worksheet):
-            self.workbook = Workbook()
-            # Workbook is automatically created with a sheet.
-            self.worksheet = self.workbook.active
-            self.worksheet.title = original.title
-            self.row_index = 1
-
-        def writerow(self, list_of_values: list[Any]) -> int:
-            # This is FAR from optimal, but it should work and was easy to write.
-            for index, value in enumerate(list_of_values, start=1):
-                cell = self.worksheet.cell(row=self.row_index, column=index)
-                cell.value = value
-
-            self.row_index += 1
+        def __init__(self, original: 'Worksheet'):
+            from openpyxl.workbook import Workbook
+
+            # Write-only workbook keeps rows in a temporary file instead of cells in memory.
+            self.workbook = Workbook(write_only=True)
+            self.worksheet = self.workbook.create_sheet(title=original.title)
+            # The dimension of a sheet is written before its rows, and readers pad the rows to its width. Rows are
+            # kept in a temporary file of their own until all of them, and so the dimension, are known.
+            self.rows = tempfile.SpooledTemporaryFile(max_size=XLSX_SPOOL_THRESHOLD)
+            self.max_row = self.max_column = 0
+
+        def writerow(self, list_of_values: Iterable[Any]) -> int:
+            row = tuple(list_of_values)
+            pickle.dump(row, self.rows, protocol=pickle.HIGHEST_PROTOCOL)
+            self.max_row += 1
+            self.max_column = max(self.max_column, len(row))
             return 0
 
         def writerows(self, list_of_list_of_values: list[list[Any]]) -> int:
@@ -614,23 +3956,35 @@ class XlsxWriter(csv.DictWriter):
                 self.writerow(list_of_values)
             return 0
 
-    def __init__(self, worksheet: Worksheet, *args, **kwargs):
+    def __init__(self, worksheet: 'Worksheet', *args, **kwargs):
         super().__init__(f=io.StringIO(), *args, **kwargs)
         self.writer = self.Writer(worksheet)
 
     def save_workbook(self, out_stream: BinaryIO) -> None:
-        # This is the official way of making a stream out of a workbook.
-        # https://openpyxl.readthedocs.io/en/stable/tutorial.html#saving-as-a-stream
-        with NamedTemporaryFile() as temp_file:
-            self.writer.workbook.save(temp_file.name)
-            temp_file.seek(0)
-            out_stream.write(temp_file.read())
+        from openpyxl.utils.cell import get_column_letter
+
+        writer = self.writer
+        if writer.max_column:
+            # Same dimension as a normal worksheet has for its cells. `WorksheetWriter.write_dimensions` takes it
+            # from the sheet, which a write-only sheet doesn't calculate.
+            dimension = f'A1:{get_column_letter(writer.max_column)}{writer.max_row}'
+            writer.worksheet.calculate_dimension = lambda: dimension
+        with writer.rows:
+            writer.rows.seek(0)
+            for _ in range(writer.max_row):
+                writer.worksheet.append(pickle.load(writer.rows))
+        # Workbook is written as a zip archive, which works on a stream that can't seek, too.
+        # Write-only workbook can be saved just once.
+        writer.workbook.save(out_stream)
 
 
 @ConfigFactory.register
 class XLSXConfig(CSVConfig):
     CONFIG_TYPE = 'xlsx-config'
     BUFFER_TYPE = io.BytesIO
+    # `native` reads the sheet XML by itself, which is faster than openpyxl for big sheets. It falls back to openpyxl
+    # when the private parts of openpyxl it uses are missing (see `NativeWorkbook.is_supported`).
+    XLSX_READERS: ClassVar[tuple[str, ...]] = ('openpyxl', 'native')
 
     def __init__(
         self,
@@ -640,8 +3994,12 @@ class XLSXConfig(CSVConfig):
         encode_regex: Optional[Iterable[list[str]]] = None,
         num_headers: int = 1,
         skip_initial_lines: int = 0,
+        xlsx_reader: str = 'openpyxl',
         **kwargs,
     ):
+        if xlsx_reader not in self.XLSX_READERS:
+            raise ValueError(f'Unknown xlsx reader {xlsx_reader!r}, expected one of: {", ".join(self.XLSX_READERS)}')
+        self.xlsx_reader = xlsx_reader
         super().__init__(
             clear_columns=clear_columns,
             encode_columns=encode_columns,
@@ -659,8 +4017,16 @@ class XLSXConfig(CSVConfig):
     def make_destination_buffer(self) -> BUFFER_TYPE:
         return io.BytesIO()
 
-    def make_buffer_binary(self, destination_buffer: BUFFER_TYPE) -> bytes:
-        return destination_buffer.getvalue()
+    def split_file(self, in_file: FilePath, part_size: int) -> list[FilePath]:
+        # Workbooks are archives, their rows can't be found by their offset in the file.
+        return [in_file]
+
+    def decode_file(self, in_file: FilePath, worker: Worker, destination: io.BytesIO) -> None:
+        self._process(in_file, worker, destination, self.de_mapper)
+
+    @contextlib.contextmanager
+    def open_destination(self, stream: BinaryIO) -> Iterator[BinaryIO]:
+        yield stream
 
     @contextlib.contextmanager
     def make_csv_reader_writer(
@@ -668,21 +4034,42 @@ class XLSXConfig(CSVConfig):
         in_file: FilePath,
         destination: io.BytesIO,
     ) -> tuple[csv.DictReader, csv.DictWriter]:
-        # When reading an Excel file, it's better to load it all up into the memory.
-        # This way we can even load files from inside a zip archive.
-        with in_file.open(mode='rb') as f:  # noqa (mode is supported)
-            workbook_data = f.read()
+        with self._open_workbook_source(in_file) as source:
+            workbook = self._load_workbook(source)
+            try:
+                worksheet = workbook.active
 
-        workbook = load_workbook(io.BytesIO(workbook_data), read_only=True,
-                                 rich_text=True)  # noqa (rich_text not in pyi)
-        worksheet = workbook.active
+                reader = XlsxReader(worksheet)
+                writer = XlsxWriter(worksheet, fieldnames=reader.fieldnames)
 
-        reader = XlsxReader(worksheet)
-        writer = XlsxWriter(worksheet, fieldnames=reader.fieldnames)
+                yield reader, writer
 
-        yield reader, writer
+                writer.save_workbook(destination)
+            finally:
+                # Read-only workbook keeps the source open until it's closed.
+                workbook.close()
 
-        writer.save_workbook(destination)
+    def _load_workbook(self, source: BinaryIO) -> Union['Workbook', NativeWorkbook]:
+        if self.xlsx_reader == 'native' and NativeWorkbook.is_supported():
+            return NativeWorkbook(source)
+        from openpyxl.reader.excel import load_workbook
+        return load_workbook(source, read_only=True, rich_text=True)  # noqa (rich_text not in pyi)
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _open_workbook_source(in_file: FilePath) -> Iterator[BinaryIO]:
+        if not isinstance(in_file, ZipPath):
+            with open_input(in_file, mode='rb') as source:
+                yield source
+            return
+
+        # Workbook is a zip archive itself and needs to seek, which a compressed archive member
+        # can only do by decompressing it again from the start.
+        with tempfile.SpooledTemporaryFile(max_size=XLSX_SPOOL_THRESHOLD) as source:
+            with open_input(in_file, mode='rb') as member:
+                shutil.copyfileobj(member, source, COPY_CHUNK_SIZE)
+            source.seek(0)
+            yield source
 
 
 @ConfigFactory.register
@@ -693,20 +4080,20 @@ class RawRegexConfig(BaseConfig):
     def __init__(self, regex_groups: list[str], **kwargs):
         super().__init__(**kwargs)
         self.regex_groups = [EncodeRegex(expression) for expression in regex_groups]
+        self.engine = EncodeRegexEngine(self.regex_groups)
 
     def encode_file(self, in_file: FilePath, worker: Worker, destination: BUFFER_TYPE) -> None:
-        with in_file.open(mode='r', encoding=self.encoding) as source:  # noqa (encoding is supported)
-            for line in source:
-                out_line = line
-                for regex in self.regex_groups:
-                    out_line = regex.encode(out_line, worker.encode_value)
-                destination.writelines([out_line])
+        with open_input(in_file, mode='r', encoding=self.encoding) as source:
+            encode = self.engine.encode
+            encode_value = worker.encode_value
+            for line in counted_rows(source, worker):
+                destination.write(encode(line, encode_value))
 
     def decode_file(self, in_file: FilePath, worker: Worker, destination: BUFFER_TYPE) -> None:
-        with in_file.open(mode='r', encoding=self.encoding) as source:  # noqa (encoding is supported)
-            content = source.read()
-            content = ENC_PATTERN.sub(worker.encoded_replace, content)
-            destination.write(content)
+        with open_input(in_file, mode='r', encoding=self.encoding) as source:
+            # Tokens never span multiple lines.
+            for block in read_text_blocks(source):
+                destination.write(ENC_PATTERN.sub(worker.encoded_replace, block) if 'enc-' in block else block)
 
     def get_description(self) -> dict[str, str]:
         return self.make_description(
@@ -715,7 +4102,14 @@ class RawRegexConfig(BaseConfig):
         )
 
 
-def add_common_arguments(parser: GooeyParser, add_mapping: bool):
+class CliParser(argparse.ArgumentParser):
+    """Accepts the arguments of `GooeyParser`, so that the CLI doesn't need to import the GUI."""
+
+    def add_argument(self, *args, widget: Optional[str] = None, gooey_options: Optional[dict] = None, **kwargs):
+        return super().add_argument(*args, **kwargs)
+
+
+def add_common_arguments(parser: argparse.ArgumentParser, add_mapping: bool):
     parser.add_argument(
         'output_directory',
         metavar='Output directory',
@@ -741,10 +4135,120 @@ def add_common_arguments(parser: GooeyParser, add_mapping: bool):
         widget='MultiFileChooser',
         help='Files or directories to be processed',
     )
+    if not add_mapping:
+        parser.add_argument(
+            '--token-key-file',
+            metavar='Token key file',
+            widget='FileChooser',
+            help='Derive tokens from the values with the secret key stored in this file, instead of random ones. '
+                 'Runs using the same key produce the same tokens.',
+        )
+        parser.add_argument(
+            '--two-pass',
+            action='store_true',
+            widget='CheckBox',
+            help='Find the values to encode in all files first and issue their tokens at once, then encode the files '
+                 'with that mapping, which lists the values in the order of the files however --jobs finish them.',
+        )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        widget='CheckBox',
+        help='Record the files completed by this run, and reuse outputs of the files completed by the previous '
+             '--resume run into the same output directory',
+    )
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        widget='CheckBox',
+        help=f'Time the stages of processing each file and write them to {RunProfile.FILE_NAME} '
+             f'in the output directory',
+    )
+    parser.add_argument(
+        '--compression',
+        metavar='Compression',
+        choices=list(COMPRESSION_METHODS),
+        default='deflated',
+        widget='Dropdown',
+        help='Compression method of the output archive',
+    )
+    parser.add_argument(
+        '--compression-level',
+        metavar='Compression level',
+        type=int,
+        widget='IntegerField',
+        help='0-9 for deflated, 1-9 for bzip2. Default level of the method by default',
+        gooey_options={
+            'min': 0,
+            'max': 9,
+        },
+    )
+    parser.add_argument(
+        '--compression-threads',
+        metavar='Compression threads',
+        type=int,
+        default=1,
+        widget='IntegerField',
+        help='Number of threads that deflate each output file. With --jobs, outputs are compressed by the jobs.',
+        gooey_options={
+            'min': 1,
+        },
+    )
+    parser.add_argument(
+        '--shard-by',
+        metavar='Shard by',
+        choices=OutputArchives.SHARD_POLICIES,
+        widget='Dropdown',
+        help='Split the output into several archives: by size (see --shard-size), by carrier, or by a hash of '
+             'the file name (see --shard-count). Decode accepts the index file written next to them.',
+    )
+    parser.add_argument(
+        '--shard-size',
+        metavar='Shard size',
+        type=parse_size,
+        default=SHARD_SIZE,
+        help='With --shard-by size, a new archive is started once the current one is that big, e.g. 500MB',
+    )
+    parser.add_argument(
+        '--shard-count',
+        metavar='Shard count',
+        type=int,
+        default=SHARD_COUNT,
+        widget='IntegerField',
+        help='With --shard-by hash, number of archives',
+        gooey_options={
+            'min': 1,
+        },
+    )
+    parser.add_argument(
+        '--events',
+        metavar='Events file',
+        widget='FileSaver',
+        help='Write progress of the run to this file as JSON lines, e.g. for a script that runs this',
+    )
+    parser.add_argument(
+        '--jobs',
+        metavar='Parallel jobs',
+        type=int,
+        default=1,
+        widget='IntegerField',
+        help='Number of files processed in parallel',
+        gooey_options={
+            'min': 1,
+        },
+    )
+    parser.add_argument(
+        '--split-size',
+        metavar='Split size',
+        type=parse_size,
+        default=SPLIT_SIZE,
+        help='With --jobs, CSV files at least twice that big are encoded in parts of about that size by separate '
+             'jobs, e.g. 256MB. 0 doesn\'t split them.',
+    )
 
 
-def main():
-    parser = GooeyParser(
+def main(parser_class: Type[argparse.ArgumentParser] = CliParser):
+    parser = parser_class(
         description='Program to anonymize data files for Byte Analytics Mobile Optimizer',
         epilog='Run without arguments to launch the GUI',
     )
@@ -763,13 +4267,37 @@ def main():
     assert args.action in (encode_tag, decode_tag)
     for_encode = args.action == encode_tag
 
-    with Worker(args.output_directory, should_save_mappings=for_encode) as worker:
+    token_key = None
+    if for_encode and args.token_key_file:
+        token_key = Path(args.token_key_file).read_bytes().strip()
+        if not token_key:
+            parser.error(f'Token key file {args.token_key_file} is empty')
+
+    compression = COMPRESSION_METHODS[args.compression]
+    if args.compression_level is not None:
+        levels = COMPRESSION_LEVELS.get(compression)
+        if levels is None:
+            parser.error(f'Compression {args.compression} has no levels')
+        if args.compression_level not in levels:
+            parser.error(f'Level of compression {args.compression} must be {levels.start}-{levels.stop - 1}')
+    if args.compression_threads < 1:
+        parser.error('Compression threads must be at least 1')
+    if args.shard_count < 1:
+        parser.error('Shard count must be at least 1')
+
+    with Worker(
+        args.output_directory, should_save_mappings=for_encode, token_key=token_key, resume=args.resume,
+        profile=args.profile, events_path=args.events, compression=compression,
+        compresslevel=args.compression_level, compression_threads=args.compression_threads, shard_by=args.shard_by,
+        shard_size=args.shard_size, shard_count=args.shard_count, split_size=args.split_size,
+        two_pass=for_encode and args.two_pass,
+    ) as worker:
         worker.find_files(args.input, for_encode=for_encode)
         if for_encode and (path := Path(args.output_directory) / Worker.MAPPING_FILE_NAME).exists():
             worker.load_mappings(path)
         elif not for_encode:
-            worker.load_mappings(args.mapping_file)
-        worker.process_files()
+            worker.open_mapping_index(args.mapping_file)
+        worker.process_files(jobs=args.jobs)
 
 
 def get_resource_path(*args):
@@ -783,6 +4311,8 @@ def get_resource_path(*args):
 
 
 if __name__ == '__main__':
+    # Required by the process pool of `--jobs` in a frozen (PyInstaller) executable.
+    freeze_support()
     if len(sys.argv) > 1:
         # CLI
         IGNORE_COMMAND = '--ignore-gooey'
@@ -813,6 +4343,8 @@ if __name__ == '__main__':
         ]
 
         # GUI
+        from gooey import Gooey, GooeyParser
+
         Gooey(
             f=main,
             language='english',
@@ -825,8 +4357,8 @@ if __name__ == '__main__':
             menu=MENU,
             image_dir=get_resource_path('images'),
             language_dir=get_resource_path('gooey', 'languages'),
-            progress_regex=r"^Progress (?P<percent>\d+)%$",
+            progress_regex=r"^Progress (?P<percent>\d+)%",
             progress_expr="percent",
             disable_progress_bar_animation=True,
             hide_progress_msg=True,
-        )()
+        )(GooeyParser)
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Generates carrier files of a configurable size for every config in `config.toml`, to measure throughput on.
+
+Each file is grown from the sample of its config in `tests/data`: preamble and header lines are kept, data rows are
+repeated in their order, with new values in the columns that get encoded. Values of the columns that conditions look
+at are kept as they are, so conditions match as often as in the sample. Rogers files are written into archives
+together with their external header, Bell XLSX files are written as workbooks.
+
+    python benchmarks/generate_data.py /tmp/benchmark-data --size 50MB
+
+The list of generated files is written to `benchmark.json` in the output directory, for `benchmarks/throughput.py`.
+"""
+import argparse
+import contextlib
+import csv
+import io
+import json
+import random
+import re
+import sys
+import tempfile
+import zipfile
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+ROOT_DIRECTORY = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIRECTORY))
+
+from anonymizer import (  # noqa: E402 (the repository isn't a package)
+    BaseConfig, ConfigFactory, CSVConfig, FilePath, RawRegexConfig, Worker, XLSXConfig, ZipPath, parse_size,
+)
+
+SAMPLE_DIRECTORY = ROOT_DIRECTORY / 'tests' / 'data'
+INDEX_FILE_NAME = 'benchmark.json'
+DIGITS = re.compile(r'\d+')
+# Digit runs in encoded values are made at least that long, so that there are enough distinct values.
+MIN_VARIED_DIGITS = 6
+
+
+class ValueVariator:
+    """Makes new values that look like the sample ones."""
+
+    def __init__(self, seed: int):
+        self.random = random.Random(seed)
+
+    def digits(self, length: int) -> str:
+        return str(self.random.randrange(10 ** length)).zfill(length)
+
+    def vary(self, value: Any, widen: bool = True) -> Any:
+        if isinstance(value, bool) or value is None:
+            return value
+        if isinstance(value, int):
+            return int(self.digits(len(str(abs(value))))) if value else value
+        if not isinstance(value, str) or not value.strip():
+            return value
+        if DIGITS.search(value) is None:
+            # Values without digits (e.g. names) only change when it doesn't change a condition.
+            return f'{value}-{self.digits(MIN_VARIED_DIGITS)}' if widen else value
+        return DIGITS.sub(
+            lambda match: self.digits(max(len(match.group()), MIN_VARIED_DIGITS) if widen else len(match.group())),
+            value,
+        )
+
+    def vary_line(self, line: str) -> str:
+        # Layout of raw reports is kept, digits are replaced one by one.
+        return DIGITS.sub(lambda match: self.digits(len(match.group())), line)
+
+
+def find_samples(worker: Worker) -> dict[str, FilePath]:
+    """The first sample file of each config, by config identity."""
+    samples = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        ConfigFactory.load_configuration()
+        files = worker._list_files([str(SAMPLE_DIRECTORY)])
+    for path in files:
+        config = ConfigFactory.get_config(path.name)
+        if config is not None:
+            samples.setdefault(config.identity, path)
+    return samples
+
+
+def varied_columns(config: CSVConfig) -> tuple[set[str], set[str]]:
+    """Columns to vary, and those of them that conditions look at."""
+    condition_columns = {condition.if_column for condition in config.encode_conditional}
+    columns = set(config.encode_columns)
+    columns.update(condition.replace_where for condition in config.encode_conditional)
+    columns.update(encode_regex.replace_where for encode_regex in config.encode_regex)
+    return columns, condition_columns
+
+
+def repeat_rows(
+    rows: list[list[Any]],
+    fieldnames: list[str],
+    config: CSVConfig,
+    variator: ValueVariator,
+) -> Iterator[list[Any]]:
+    columns, condition_columns = varied_columns(config)
+    positions = [
+        (position, name.strip() not in condition_columns)
+        for position, name in enumerate(fieldnames) if name is not None and name.strip() in columns
+    ]
+    while True:
+        for row in rows:
+            row = list(row)
+            for position, widen in positions:
+                if position < len(row):
+                    row[position] = variator.vary(row[position], widen)
+            yield row
+
+
+def generate_csv(config: CSVConfig, sample: FilePath, target: Path, size: int, variator: ValueVariator) -> int:
+    csv_config = config.make_csv_config()
+    with sample.open(mode='r', encoding=config.encoding) as source:  # noqa (encoding is supported)
+        preamble = [source.readline() for _ in range(config.skip_initial_lines)]
+        records = list(csv.reader(source, **csv_config))  # noqa
+    records = [record for record in records if record]
+
+    fieldnames = config._load_fieldnames(sample)
+    header_count = 0 if fieldnames is not None else config.num_headers
+    headers, rows = records[:header_count], records[header_count:]
+    fieldnames = fieldnames or headers[0]
+
+    row_count = 0
+    with open(target, mode='w', encoding=config.encoding, newline='') as destination:
+        destination.writelines(preamble)
+        writer = csv.writer(destination, **csv_config)  # noqa
+        writer.writerows(headers)
+        for row in repeat_rows(rows, fieldnames, config, variator):
+            writer.writerow(row)
+            row_count += 1
+            if row_count % 1000 == 0 and destination.tell() >= size:
+                break
+    return row_count
+
+
+def generate_xlsx(config: XLSXConfig, sample: FilePath, target: Path, size: int, variator: ValueVariator) -> int:
+    from openpyxl import Workbook, load_workbook
+
+    with sample.open(mode='rb') as source:  # noqa (mode is supported)
+        workbook = load_workbook(io.BytesIO(source.read()), read_only=True)
+        worksheet = workbook.active
+        records = [list(row) for row in worksheet.values]
+        title = worksheet.title
+        workbook.close()
+
+    headers, rows = records[:config.num_headers], records[config.num_headers:]
+    output = Workbook(write_only=True)
+    output_sheet = output.create_sheet(title=title)
+    for header in headers:
+        output_sheet.append(header)
+
+    # Size is counted as the text of the values, the workbook itself is compressed.
+    written = 0
+    row_count = 0
+    for row in repeat_rows(rows, headers[0], config, variator):
+        output_sheet.append(row)
+        row_count += 1
+        written += sum(len(str(value)) + 1 for value in row if value is not None)
+        if written >= size:
+            break
+    output.save(target)
+    return row_count
+
+
+def generate_raw(config: RawRegexConfig, sample: FilePath, target: Path, size: int, variator: ValueVariator) -> int:
+    with sample.open(mode='r', encoding=config.encoding) as source:  # noqa (encoding is supported)
+        lines = source.readlines()
+
+    written = 0
+    line_count = 0
+    with open(target, mode='w', encoding=config.encoding, newline='') as destination:
+        while written < size:
+            for line in lines:
+                written += destination.write(variator.vary_line(line))
+                line_count += 1
+    return line_count
+
+
+def generate_file(
+    config: BaseConfig,
+    sample: FilePath,
+    output_directory: Path,
+    size: int,
+    variator: ValueVariator,
+) -> dict[str, Any]:
+    carrier_directory = output_directory / config.carrier.replace('&', 'n').lower()
+    carrier_directory.mkdir(parents=True, exist_ok=True)
+
+    if isinstance(config, XLSXConfig):
+        generate = generate_xlsx
+    elif isinstance(config, CSVConfig):
+        generate = generate_csv
+    elif isinstance(config, RawRegexConfig):
+        generate = generate_raw
+    else:
+        raise ValueError(f'No generator for {type(config).__name__}')
+
+    archive: Optional[Path] = None
+    target = carrier_directory / sample.name
+    if isinstance(sample, ZipPath):
+        # Sample came from an archive with its supporting files, the generated file goes to a copy of it.
+        archive = carrier_directory / Path(sample.root.filename).name
+        target = carrier_directory / f'.{sample.name}.tmp'
+
+    rows = generate(config, sample, target, size, variator)
+    data_size = target.stat().st_size
+
+    path = target
+    if archive is not None:
+        with zipfile.ZipFile(archive, mode='w', compression=zipfile.ZIP_DEFLATED) as archive_zip:
+            archive_zip.write(target, sample.name)
+            for supporting_file in config.get_supporting_files(sample):
+                archive_zip.writestr(supporting_file.name, supporting_file.read_bytes())
+        target.unlink()
+        path = archive
+
+    return {
+        'config': config.identity.split(':')[0],
+        'path': str(path.relative_to(output_directory)),
+        'name': sample.name,
+        'rows': rows,
+        'bytes': data_size,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('output_directory', type=Path)
+    parser.add_argument('--size', type=parse_size, default=parse_size('10MB'), help='Size of each file, e.g. 50MB')
+    parser.add_argument('--configs', nargs='*', default=None,
+                        help='Only configs whose name (e.g. `Telus.AirtimeDetail`) starts with one of these')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    args.output_directory.mkdir(parents=True, exist_ok=True)
+    variator = ValueVariator(args.seed)
+    files = []
+    with tempfile.TemporaryDirectory() as directory, Worker(directory, should_save_mappings=False) as worker:
+        samples = find_samples(worker)
+    for config in ConfigFactory.LOADED:
+        name = config.identity.split(':')[0]
+        if args.configs is not None and not any(name.startswith(prefix) for prefix in args.configs):
+            continue
+        sample = samples.get(config.identity)
+        if sample is None:
+            print(f'No sample for {name}, skipping')
+            continue
+        entry = generate_file(config, sample, args.output_directory, args.size, variator)
+        print(f'{name}: {entry["path"]}, {entry["rows"]} rows, {entry["bytes"] / 1024 ** 2:.1f} MB')
+        files.append(entry)
+
+    index = {'size': args.size, 'seed': args.seed, 'files': files}
+    (args.output_directory / INDEX_FILE_NAME).write_text(json.dumps(index, indent=2))
+
+
+if __name__ == '__main__':
+    main()
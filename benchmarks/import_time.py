@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Measures the cold start of the CLI: a run that encodes a tiny CSV file, which is mostly interpreter start up,
+imports and loading of the configuration.
+
+From source:
+
+    python benchmarks/import_time.py
+
+PyInstaller build (`pyinstaller build.spec`):
+
+    python benchmarks/import_time.py --executable dist/byteanalytics-encoder
+
+With `--imports`, the slowest imports of the source run are listed as well (`python -X importtime`).
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT_DIRECTORY = Path(__file__).resolve().parent.parent
+SAMPLE_FILE = ROOT_DIRECTORY / 'tests' / 'data' / 'at&t' / 'rawdataoutput_test.csv'
+
+
+def make_command(executable: str, output_directory: str) -> list[str]:
+    arguments = ['Encode', output_directory, str(SAMPLE_FILE)]
+    if executable:
+        return [executable, *arguments]
+    return [sys.executable, str(ROOT_DIRECTORY / 'anonymizer.py'), *arguments]
+
+
+def run_once(command: list[str], env: dict[str, str]) -> float:
+    start = time.perf_counter()
+    subprocess.run(command, env=env, stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+
+def slowest_imports(output_directory: str, env: dict[str, str], count: int) -> list[tuple[int, str]]:
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', *make_command('', output_directory)[1:]],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True,
+    )
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _self_time, cumulative, name = line[len('import time:'):].split('|')
+        # Only top level packages, nested ones are part of their cumulative time.
+        if not name.startswith('  '):
+            imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--executable', default='', help='Built executable, the source is run by default')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--imports', action='store_true', help='List the slowest imports of the source run')
+    parser.add_argument('--no-cache', action='store_true', help='Start each run without the configuration cache')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ)
+        times = []
+        for index in range(args.runs + 1):
+            if args.no_cache or index == 0:
+                env['XDG_CACHE_HOME'] = env['LOCALAPPDATA'] = os.path.join(directory, f'cache-{index}')
+            duration = run_once(make_command(args.executable, os.path.join(directory, f'out-{index}')), env)
+            # The first run fills the configuration cache and the OS file cache.
+            if index > 0:
+                times.append(duration)
+
+        print(f'{args.executable or "source"}: {len(times)} runs, '
+              f'min {min(times) * 1000:.0f} ms, median {statistics.median(times) * 1000:.0f} ms')
+
+        if args.imports:
+            for cumulative, name in slowest_imports(os.path.join(directory, 'imports'), env, 15):
+                print(f'{cumulative / 1000:8.1f} ms  {name}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Measures Encode and Decode throughput on the files made by `benchmarks/generate_data.py`.
+
+Each file is encoded and then decoded by a `Worker` in a fresh process, like a run of the CLI on that file alone, so
+that peak memory of one run doesn't hide that of the next one. For each file, the time, throughput, peak RSS and the
+size of the mapping are recorded; with `--runs`, those of the fastest run.
+
+    python benchmarks/generate_data.py /tmp/benchmark-data --size 50MB
+    python benchmarks/throughput.py /tmp/benchmark-data --save-baseline benchmarks/baseline.json
+    ... changes ...
+    python benchmarks/throughput.py /tmp/benchmark-data --baseline benchmarks/baseline.json
+
+With `--baseline`, the results are compared to the stored ones and the exit status is 1 when throughput of any run
+dropped, or its peak RSS grew, by more than `--threshold`. Baselines are only comparable between runs on the same
+machine, with the same data size.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+ROOT_DIRECTORY = Path(__file__).resolve().parent.parent
+INDEX_FILE_NAME = 'benchmark.json'
+OPERATIONS = ('Encode', 'Decode')
+# Token key is fixed so that runs issue the same tokens and mapping sizes can be compared.
+TOKEN_KEY = b'benchmark'
+
+
+def peak_rss() -> Optional[int]:
+    """Peak resident memory of this process and its finished children (pool workers), in bytes."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    # Linux reports kilobytes, macOS bytes.
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return scale * max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+
+
+def run_one(operation: str, input_path: str, output_directory: str, mapping_path: str, jobs: int) -> dict[str, Any]:
+    """Runs in the child process, like `main` would."""
+    import contextlib
+    import io
+
+    sys.path.insert(0, str(ROOT_DIRECTORY))
+    from anonymizer import ConfigFactory, Worker
+
+    for_encode = operation == 'Encode'
+    with contextlib.redirect_stdout(io.StringIO()):
+        # Configuration is loaded before the clock starts, it's measured by `import_time.py`.
+        ConfigFactory.load_configuration()
+        start = time.perf_counter()
+        with Worker(output_directory, should_save_mappings=for_encode, token_key=TOKEN_KEY) as worker:
+            worker.find_files([input_path], for_encode=for_encode)
+            if not for_encode:
+                worker.open_mapping_index(mapping_path)
+            worker.process_files(jobs=jobs)
+        seconds = time.perf_counter() - start
+
+    return {
+        'seconds': seconds,
+        'files': worker.processed_count,
+        'mapping_entries': len(worker.encoded_mappings) or len(worker.decoded_mappings),
+        'peak_rss': peak_rss(),
+    }
+
+
+def measure(operation: str, input_path: Path, output_directory: Path, mapping_path: Path, jobs: int) -> dict[str, Any]:
+    result = subprocess.run(
+        [
+            sys.executable, __file__, '--run-one', operation,
+            str(input_path), str(output_directory), str(mapping_path), str(jobs),
+        ],
+        stdout=subprocess.PIPE, text=True, check=True,
+    )
+    return json.loads(result.stdout)
+
+
+def benchmark_file(
+    entry: dict[str, Any],
+    data_directory: Path,
+    work_directory: Path,
+    jobs: int,
+    runs: int,
+) -> dict[str, Any]:
+    # Output of the last Encode run is the one that's decoded.
+    encoded_directory = work_directory / 'encoded' / str(runs - 1)
+    mapping_path = encoded_directory / 'mapping.tsv'
+    results = {}
+    for operation in OPERATIONS:
+        if operation == 'Encode':
+            input_path, output_directory = data_directory / entry['path'], work_directory / 'encoded'
+        else:
+            input_path, output_directory = encoded_directory / 'output.zip', work_directory / 'decoded'
+        result = None
+        for run in range(runs):
+            measured = measure(operation, input_path, output_directory / str(run), mapping_path, jobs)
+            if measured['files'] != 1:
+                raise RuntimeError(f'{operation} of {entry["path"]} processed {measured["files"]} files instead of 1')
+            if result is None or measured['seconds'] < result['seconds']:
+                result = measured
+        result['mb_per_second'] = entry['bytes'] / 1024 ** 2 / result['seconds']
+        result['rows_per_second'] = entry['rows'] / result['seconds']
+        result['mapping_bytes'] = mapping_path.stat().st_size
+        results[operation] = result
+    return results
+
+
+def compare(results: dict[str, Any], baseline: dict[str, Any], threshold: float) -> list[str]:
+    """Regressions of the results against the baseline, as lines of the report."""
+    if (results['size'], results['jobs']) != (baseline['size'], baseline['jobs']):
+        print(f'Baseline was measured with size {baseline["size"]} and {baseline["jobs"]} jobs, '
+              f'the results aren\'t comparable')
+    regressions = []
+    for name, operations in results['files'].items():
+        for operation, result in operations.items():
+            previous = baseline['files'].get(name, {}).get(operation)
+            if previous is None:
+                continue
+            ratio = result['mb_per_second'] / previous['mb_per_second']
+            line = f'{name} {operation}: {previous["mb_per_second"]:.2f} -> {result["mb_per_second"]:.2f} MB/s'
+            if result['peak_rss'] and previous['peak_rss']:
+                rss_ratio = result['peak_rss'] / previous['peak_rss']
+                line += f', peak RSS {previous["peak_rss"] / 1024 ** 2:.0f} -> {result["peak_rss"] / 1024 ** 2:.0f} MB'
+            else:
+                rss_ratio = 1.0
+            print(line)
+            if ratio < 1 - threshold:
+                regressions.append(f'{name} {operation}: throughput dropped by {1 - ratio:.0%}')
+            if rss_ratio > 1 + threshold:
+                regressions.append(f'{name} {operation}: peak RSS grew by {rss_ratio - 1:.0%}')
+    return regressions
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--run-one':
+        operation, input_path, output_directory, mapping_path, jobs = sys.argv[2:]
+        print(json.dumps(run_one(operation, input_path, output_directory, mapping_path, int(jobs))))
+        return
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('data_directory', type=Path, help='Output directory of `generate_data.py`')
+    parser.add_argument('--configs', nargs='*', default=None,
+                        help='Only configs whose name (e.g. `Telus.AirtimeDetail`) starts with one of these')
+    parser.add_argument('--jobs', type=int, default=1)
+    parser.add_argument('--runs', type=int, default=1, help='Runs of each file, the fastest one is recorded')
+    parser.add_argument('--output', type=Path, help='Write the results to this file')
+    parser.add_argument('--save-baseline', type=Path, help='Write the results as the new baseline')
+    parser.add_argument('--baseline', type=Path, help='Compare the results with this baseline')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Relative change that counts as a regression (default 0.1)')
+    args = parser.parse_args()
+
+    index = json.loads((args.data_directory / INDEX_FILE_NAME).read_text())
+    results = {
+        'size': index['size'],
+        'jobs': args.jobs,
+        'runs': args.runs,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'files': {},
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for number, entry in enumerate(index['files']):
+            name = entry['config']
+            if args.configs is not None and not any(name.startswith(prefix) for prefix in args.configs):
+                continue
+            operations = benchmark_file(entry, args.data_directory, Path(directory) / str(number), args.jobs, args.runs)
+            results['files'][name] = operations
+            encode, decode = operations['Encode'], operations['Decode']
+            print(f'{name}: {entry["bytes"] / 1024 ** 2:.1f} MB, '
+                  f'encode {encode["mb_per_second"]:.2f} MB/s, decode {decode["mb_per_second"]:.2f} MB/s, '
+                  f'{encode["mapping_entries"]} mappings ({encode["mapping_bytes"] / 1024 ** 2:.1f} MB)')
+
+    for path in (args.output, args.save_baseline):
+        if path is not None:
+            path.write_text(json.dumps(results, indent=2))
+
+    if args.baseline is not None:
+        regressions = compare(results, json.loads(args.baseline.read_text()), args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
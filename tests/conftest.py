@@ -2,9 +2,17 @@ import pathlib
 
 import pytest
 
+from anonymizer import ConfigFactory
+
 
 @pytest.fixture
 def fake_fs(fs):
     fs.add_real_directory(pathlib.Path(__file__).parent / 'data')
     fs.add_real_file(pathlib.Path(__file__).parent.parent / 'config.toml', read_only=True)
     yield fs
+
+
+@pytest.fixture(autouse=True)
+def no_config_cache(monkeypatch):
+    # Tests don't leave the parsed configuration in the user's cache.
+    monkeypatch.setattr(ConfigFactory, 'CACHE_DIRECTORY', None)
@@ -0,0 +1,29 @@
+import json
+import pathlib
+import subprocess
+import sys
+
+from anonymizer import ConfigFactory, Worker
+
+ROOT_DIRECTORY = pathlib.Path(__file__).parent.parent
+
+
+def test_generated_files_are_routed_and_encoded(tmp_path) -> None:
+    data_directory = tmp_path / 'data'
+    subprocess.run(
+        [sys.executable, str(ROOT_DIRECTORY / 'benchmarks/generate_data.py'), str(data_directory), '--size', '20KB',
+         '--configs', 'Telus.AirtimeDetail', 'Rogers.Voice_RM', 'Bell.HardwareReport'],
+        capture_output=True, check=True,
+    )
+    files = json.loads((data_directory / 'benchmark.json').read_text())['files']
+    assert [entry['config'] for entry in files] == ['Bell.HardwareReport', 'Rogers.Voice_RM', 'Telus.AirtimeDetail']
+
+    ConfigFactory.load_configuration()
+    for entry in files:
+        assert entry['bytes'] >= 20 * 1024 or entry['path'].endswith('.xlsx')
+        with Worker(output_directory=str(tmp_path / entry['config'])) as worker:
+            worker.find_files([str(data_directory / entry['path'])], for_encode=True)
+            assert [ConfigFactory.get_config(item.path.name).identity.split(':')[0] for item in worker.queue] \
+                == [entry['config']]
+            worker.process_files()
+        assert worker.processed_count == 1 and worker.encoded_mappings
@@ -0,0 +1,75 @@
+import concurrent.futures
+import pathlib
+import random
+import sys
+import zipfile
+
+import pytest
+
+import anonymizer
+from anonymizer import DEFLATE_BLOCK_SIZE, ParallelDeflateMember, Worker
+
+DATA_DIRECTORY = pathlib.Path(__file__).parent / 'data'
+
+
+def encode(output_directory: pathlib.Path, jobs: int = 1, **kwargs) -> dict[str, bytes]:
+    with Worker(output_directory=str(output_directory), token_key=b'key', **kwargs) as worker:
+        worker.find_files([str(DATA_DIRECTORY / 'telus'), str(DATA_DIRECTORY / 'rogers')], for_encode=True)
+        worker.process_files(jobs=jobs)
+    with zipfile.ZipFile(output_directory / 'output.zip') as output_zip:
+        assert output_zip.testzip() is None
+        assert {info.compress_type for info in output_zip.infolist()} == {worker.outputs.compression}
+        return {name: output_zip.read(name) for name in output_zip.namelist()}
+
+
+@pytest.mark.parametrize('compression, compresslevel, jobs', [
+    (zipfile.ZIP_STORED, None, 1),
+    (zipfile.ZIP_DEFLATED, 1, 1),
+    (zipfile.ZIP_DEFLATED, 9, 2),
+    (zipfile.ZIP_BZIP2, 5, 1),
+    (zipfile.ZIP_LZMA, None, 2),
+])
+def test_output_compression(tmp_path, compression, compresslevel, jobs) -> None:
+    expected = encode(tmp_path / 'default')
+    outputs = encode(tmp_path / 'compressed', jobs, compression=compression, compresslevel=compresslevel)
+    # Supporting files with the same name get their suffixes in the order in which jobs finish them.
+    assert outputs.keys() == expected.keys() and sorted(outputs.values()) == sorted(expected.values())
+
+
+def test_compression_threads(tmp_path) -> None:
+    expected = encode(tmp_path / 'default')
+    assert encode(tmp_path / 'threads', compression_threads=3) == expected
+
+
+@pytest.mark.parametrize('size', [0, 1000, 3 * DEFLATE_BLOCK_SIZE + 17])
+def test_parallel_deflate_member(tmp_path, size) -> None:
+    generator = random.Random(size)
+    # Compressible, but with matches that cross the boundaries of blocks.
+    data = b''.join(generator.choice([b'12345,', b'abc;', b'"Rogers"\n']) for _ in range(size // 4))[:size]
+    with zipfile.ZipFile(tmp_path / 'output.zip', mode='w', compression=zipfile.ZIP_DEFLATED) as output_zip, \
+            concurrent.futures.ThreadPoolExecutor(2) as executor:
+        output_zip.writestr('before.txt', 'before')
+        with ParallelDeflateMember(output_zip, 'data.csv', executor, level=6, max_pending=2) as member:
+            for start in range(0, size, 100_000):
+                member.write(data[start:start + 100_000])
+        output_zip.writestr('after.txt', 'after')
+
+    with zipfile.ZipFile(tmp_path / 'output.zip') as output_zip:
+        assert output_zip.testzip() is None
+        assert output_zip.namelist() == ['before.txt', 'data.csv', 'after.txt']
+        assert output_zip.read('data.csv') == data
+        if size:
+            assert output_zip.getinfo('data.csv').compress_size < size / 2
+
+
+@pytest.mark.parametrize('options', [
+    ['--compression', 'lzma', '--compression-level', '5'],
+    ['--compression', 'bzip2', '--compression-level', '0'],
+    ['--compression-level', '10'],
+    ['--compression-threads', '0'],
+])
+def test_invalid_compression_options(tmp_path, monkeypatch, options) -> None:
+    monkeypatch.setattr(sys, 'argv', ['anonymizer.py', 'Encode', str(tmp_path), str(DATA_DIRECTORY), *options])
+    with pytest.raises(SystemExit):
+        anonymizer.main()
+    assert not (tmp_path / 'output.zip').exists()
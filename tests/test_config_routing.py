@@ -0,0 +1,84 @@
+import pathlib
+
+import pytest
+
+from anonymizer import ConfigFactory, ConfigRouter, CSVConfig, RoutingReport, Worker
+
+DATA_DIRECTORY = pathlib.Path(__file__).parent / 'data'
+
+
+def make_config(file_mask: str) -> CSVConfig:
+    return CSVConfig(clear_columns=[], encode_columns=[], file_mask=file_mask, carrier=file_mask)
+
+
+def linear_configs(configs: list[CSVConfig], filename: str) -> tuple[CSVConfig, ...]:
+    return tuple(config for config in configs if config.matches(filename))
+
+
+def test_router_matches_linear_scan(tmp_path) -> None:
+    ConfigFactory.load_configuration()
+    router = ConfigRouter(ConfigFactory.LOADED)
+    assert router.combined is not None
+    with Worker(output_directory=str(tmp_path), should_save_mappings=False) as worker:
+        filenames = [path.name for path in worker._list_files([str(DATA_DIRECTORY)])]
+    filenames += ['nothing.csv', 'x-Cost overview.xlsx', 'Detail.csv', 'Big Detail Mar.csv']
+    for filename in filenames:
+        assert router.get_configs(filename) == linear_configs(ConfigFactory.LOADED, filename)
+        assert ConfigFactory.get_config(filename) is next(iter(router.get_configs(filename)), None)
+
+
+@pytest.mark.parametrize('masks', [
+    ['a(b|c)', r'(x)\1', 'a', 'ab'],
+    ['(?P<name>a)', '(?P<name>ab)', 'a'],
+])
+def test_masks_that_dont_combine(masks) -> None:
+    configs = [make_config(mask) for mask in masks]
+    router = ConfigRouter(configs)
+    assert router.combined is None
+    for filename in ['ab', 'xx', 'a', 'b']:
+        assert router.get_configs(filename) == linear_configs(configs, filename)
+
+
+def test_report_lists_unmatched_and_ambiguous() -> None:
+    configs = [make_config('data_'), make_config('data_extra'), make_config('other')]
+    router = ConfigRouter(configs)
+    report = RoutingReport()
+    for filename in ['data_extra.csv', 'data_1.csv', 'readme.txt', 'other.csv']:
+        report.add(filename, router.get_configs(filename))
+
+    assert report.unmatched == ['readme.txt']
+    assert report.ambiguous == {'data_extra.csv': (configs[0], configs[1])}
+    assert report.summary()[:2] == ['1 files matched no configuration:', '  readme.txt']
+    assert router.routes['readme.txt'] == ()
+
+
+def test_report_leaves_out_supporting_files() -> None:
+    report = RoutingReport()
+    report.add('archive.zip/Header-GPRS.txt', ())
+    report.add('archive.zip/readme.txt', ())
+    report.add('archive.zip/ALL_CALLS-GPRS.txt', (make_config('ALL_CALLS'),), ['archive.zip/Header-GPRS.txt'])
+
+    assert report.unmatched == ['archive.zip/readme.txt']
+    assert report.summary() == ['1 files matched no configuration:', '  archive.zip/readme.txt']
+
+
+def test_report_is_capped() -> None:
+    report = RoutingReport()
+    for number in range(RoutingReport.LISTED_FILES + 3):
+        report.add(f'readme-{number}.txt', ())
+    summary = report.summary()
+    assert summary[0] == f'{RoutingReport.LISTED_FILES + 3} files matched no configuration:'
+    assert summary[1:-1] == [f'  readme-{number}.txt' for number in range(RoutingReport.LISTED_FILES)]
+    assert summary[-1] == '  ... and 3 more'
+
+
+def test_find_files_fills_report(tmp_path) -> None:
+    with Worker(output_directory=str(tmp_path), should_save_mappings=False) as worker:
+        worker.find_files([str(DATA_DIRECTORY / 'rogers')], for_encode=True)
+        listed = worker._list_files([str(DATA_DIRECTORY / 'rogers')])
+    assert worker.queue
+    # Every file that isn't encoded is the external header of one that is.
+    assert worker.routing_report.unmatched == []
+    assert worker.routing_report.unrouted
+    assert set(worker.routing_report.unrouted) <= worker.routing_report.supporting
+    assert len(worker.routing_report.unrouted) + len(worker.queue) == len(listed)
@@ -0,0 +1,56 @@
+import io
+
+import pytest
+
+import anonymizer
+from anonymizer import CSVConfig, Worker, read_text_blocks
+
+MAPPINGS = {
+    'plain': 'enc-0000000000000001',
+    'with, comma': 'enc-0000000000000002',
+    'with "quotes"': 'enc-0000000000000003',
+    'two\nlines': 'enc-0000000000000004',
+    '': 'enc-0000000000000005',
+}
+
+ENCODED = (
+    'name,value,comment\n'
+    'enc-0000000000000001,1,no tokens in here\n'
+    'enc-0000000000000002,2,"quoted, enc-0000000000000001"\n'
+    'enc-0000000000000003,3,"multi\nline enc-0000000000000001"\n'
+    'a,4,enc-0000000000000004\n'
+    'enc-0000000000000005,5,\n'
+    'b,6,x enc-0000000000000001 y\n'
+)
+
+
+def decode(tmp_path, method: str) -> str:
+    config = CSVConfig(clear_columns=[], encode_columns=[], file_mask='.*', carrier='test', dialect='excel')
+    in_file = tmp_path / 'encoded.csv'
+    in_file.write_text(ENCODED, encoding='utf-8')
+    destination = io.StringIO()
+    with Worker(output_directory=str(tmp_path), should_save_mappings=False) as worker:
+        worker.add_mappings(MAPPINGS.items())
+        if method == 'fast':
+            config.decode_file(in_file, worker, destination)
+        else:
+            config._process(in_file, worker, destination, config.de_mapper)
+    return destination.getvalue()
+
+
+@pytest.mark.parametrize('block_size', [10, 1024 * 1024])
+def test_fast_decode_matches_csv(tmp_path, monkeypatch, block_size) -> None:
+    monkeypatch.setattr(anonymizer, 'DECODE_BLOCK_SIZE', block_size)
+    decoded = decode(tmp_path, 'fast')
+    assert decoded == decode(tmp_path, 'csv')
+    assert '"with, comma",2,"quoted, plain"\n' in decoded
+    assert 'a,4,"two\nlines"\n' in decoded
+
+
+@pytest.mark.parametrize('block_size', [1, 7, 1000])
+def test_blocks_hold_whole_records(monkeypatch, block_size) -> None:
+    monkeypatch.setattr(anonymizer, 'DECODE_BLOCK_SIZE', block_size)
+    text = 'a,"b\nc"\n' * 100
+    blocks = list(read_text_blocks(io.StringIO(text), '"'))
+    assert ''.join(blocks) == text
+    assert all(block.endswith('"\n') and block.count('"') % 2 == 0 for block in blocks)
@@ -1,6 +1,9 @@
+import pathlib
+import re
+
 import pytest
 
-from anonymizer import EncodeRegex, TableEncodeRegex
+from anonymizer import ConfigFactory, EncodeRegex, SingleReplacement, TableEncodeRegex, literal_prefix
 
 
 @pytest.mark.parametrize(
@@ -33,3 +36,68 @@ def test_encode_regex_reverse(expression: str, input_str: str, expected: str) ->
 def test_encode_regex_replacement(expression: str, replacement: dict[str, str], input_str: str, expected: str) -> None:
     output = TableEncodeRegex(expression, 'dummy-column').encode(input_str, replacement.get)
     assert output == expected
+
+
+@pytest.mark.parametrize(
+    ','.join(['expression', 'anchored', 'prefix']),
+    [
+        ('^"Account Number (?P<account_number>[0-9]{8})"', True, '"Account Number '),
+        ('Client No:\\t"(?P<client_number>[0-9]+)"', False, 'Client No:\t"'),
+        ('^Department = (?P<department>.*)$', True, 'Department = '),
+        ('^(?P<sublevel_1>[^\\t]*)\\t', True, ''),
+        ('^ab?c(?P<t>.)', True, 'a'),
+        ('^ab+c(?P<t>.)', True, 'ab'),
+        ('^a\\.b\\d(?P<t>.)', True, 'a.b'),
+        ('^abc|(?P<t>def)', False, ''),
+    ]
+)
+def test_literal_prefix(expression: str, anchored: bool, prefix: str) -> None:
+    assert literal_prefix(expression) == (anchored, prefix)
+
+
+@pytest.mark.parametrize(
+    ','.join(['expression', 'input_str']),
+    [
+        # Nested groups are replaced from the back, like they always were.
+        ('^(?P<t1>a(?P<t2>b))c', 'abc'),
+        ('(?P<t1>x*)(?P<t2>y*)', 'zzz'),
+        ('(?P<t1>q)?z', 'az'),
+    ]
+)
+def test_encode_regex_overlapping_groups(expression: str, input_str: str) -> None:
+    def splice(value: str, encoder) -> str:
+        result = re.search(expression, value)
+        out_value = list(value)
+        replacements = [
+            SingleReplacement(encoder(group_value), *result.span(group_name))
+            for group_name, group_value in result.groupdict().items()
+        ]
+        for replacement in sorted(replacements, key=lambda elem: elem.span_end, reverse=True):
+            replacement.apply(out_value)
+        return ''.join(out_value)
+
+    def encoder(in_str) -> str:
+        return f'<{in_str}>'
+
+    assert EncodeRegex(expression).encode(input_str, encoder) == splice(input_str, encoder)
+
+
+def test_engine_matches_expressions_in_order() -> None:
+    config = ConfigFactory.get_config('Airtime_Detail_test.txt')
+    encoded_values = []
+
+    def encoder(in_str: str) -> str:
+        encoded_values.append(in_str)
+        return f'<{in_str}>'
+
+    for data_file in (pathlib.Path(__file__).parent / 'data/telus').glob('*.txt'):
+        for line in data_file.read_text(encoding=config.encoding).splitlines(keepends=True):
+            expected = line
+            for regex in config.regex_groups:
+                expected = regex.encode(expected, encoder)
+            expected_values = encoded_values[:]
+            encoded_values.clear()
+
+            assert config.engine.encode(line, encoder) == expected
+            assert encoded_values == expected_values
+            encoded_values.clear()
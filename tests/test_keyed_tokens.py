@@ -0,0 +1,46 @@
+import pathlib
+
+from anonymizer import ENC_PATTERN, ConfigFactory, Operation, QueueItem, Worker, keyed_token
+
+
+def test_keyed_token_is_reproducible() -> None:
+    token = keyed_token(b'secret', 'value', set())
+    assert ENC_PATTERN.fullmatch(token)
+    assert keyed_token(b'secret', 'value', set()) == token
+    assert keyed_token(b'other-secret', 'value', set()) != token
+
+
+def test_keyed_token_collision() -> None:
+    token = keyed_token(b'secret', 'value', set())
+    # Token is taken by some other value, the next attempt is used instead.
+    collided = keyed_token(b'secret', 'value', {int(token[4:])})
+    assert collided != token
+    assert keyed_token(b'secret', 'value', {int(token[4:])}) == collided
+
+
+def test_workers_share_tokens_without_mapping(fake_fs) -> None:
+    in_file = pathlib.Path(__file__).parent / 'data/verizon/AccountSummary_test.txt'
+    config = ConfigFactory.get_config(in_file.name)
+
+    mappings = []
+    for output_directory in ('first', 'second'):
+        with Worker(output_directory=output_directory, token_key=b'secret') as worker:
+            QueueItem(path=in_file, config=config, operation=Operation.ENCODE).process(worker)
+            mappings.append(dict(worker.encoded_mappings))
+
+    assert mappings[0] == mappings[1]
+    assert (pathlib.Path('first') / Worker.MAPPING_FILE_NAME).read_text() == \
+        (pathlib.Path('second') / Worker.MAPPING_FILE_NAME).read_text()
+
+
+def test_keyed_tokens_in_parallel(tmp_path) -> None:
+    data_path = pathlib.Path(__file__).parent / 'data/telus'
+
+    mappings = []
+    for jobs in (1, 3):
+        with Worker(output_directory=str(tmp_path / str(jobs)), token_key=b'secret') as worker:
+            worker.find_files([data_path], for_encode=True)
+            worker.process_files(jobs=jobs)
+            mappings.append(dict(worker.encoded_mappings))
+
+    assert mappings[0] == mappings[1]
@@ -0,0 +1,84 @@
+import csv
+import os
+import pathlib
+import pickle
+import zipfile
+
+import pytest
+
+from anonymizer import MappingIndex, Worker
+
+DATA_DIRECTORY = pathlib.Path(__file__).parent / 'data'
+DATA_PATHS = [str(DATA_DIRECTORY / 'telus'), str(DATA_DIRECTORY / 'rogers')]
+ENTRIES = [
+    ('555-0100', 'enc-0000000000000042'),
+    ('1122', 'enc-9227816233264160'),
+    ('Smith\n"Jr"', 'enc-1000000000000000'),
+]
+
+
+def write_mappings(path: pathlib.Path, entries: list[tuple[str, str]]) -> None:
+    with path.open(mode='w', encoding='utf-8') as f:
+        csv.writer(f, dialect='excel-tab').writerows(entries)
+
+
+def test_index_lookups(tmp_path) -> None:
+    mapping_path = tmp_path / Worker.MAPPING_FILE_NAME
+    write_mappings(mapping_path, ENTRIES)
+    index = MappingIndex.open(mapping_path)
+    assert MappingIndex.path_for(mapping_path).exists()
+    assert dict(index) == {encoded: value for value, encoded in ENTRIES}
+    assert len(index) == 3 and index.last_token() == 'enc-1000000000000000'
+    assert 'enc-0000000000000043' not in index and 'Smith' not in index
+    with pytest.raises(KeyError):
+        index['enc-0000000000000043']  # noqa (the statement has an effect)
+    # Pool processes map the file again.
+    other = pickle.loads(pickle.dumps(index))
+    assert other['enc-9227816233264160'] == '1122'
+    other.close()
+    index.close()
+
+
+def test_stale_index_is_built_again(tmp_path) -> None:
+    mapping_path = tmp_path / Worker.MAPPING_FILE_NAME
+    write_mappings(mapping_path, ENTRIES[:2])
+    MappingIndex.open(mapping_path).close()
+    with mapping_path.open(mode='a', encoding='utf-8') as f:
+        f.write('Jones\tenc-0000000000000007\n')
+    index = MappingIndex.open(mapping_path)
+    assert len(index) == 3 and index['enc-0000000000000007'] == 'Jones'
+    index.close()
+
+    # An index that's up to date isn't written again.
+    index_path = MappingIndex.path_for(mapping_path)
+    modified = index_path.stat().st_mtime_ns
+    os.utime(index_path, ns=(modified - 10 ** 9, modified - 10 ** 9))
+    MappingIndex.open(mapping_path).close()
+    assert index_path.stat().st_mtime_ns == modified - 10 ** 9
+
+
+def decode(output_directory: pathlib.Path, encoded_directory: pathlib.Path, jobs: int, use_index: bool) -> dict:
+    mapping_path = encoded_directory / Worker.MAPPING_FILE_NAME
+    with Worker(output_directory=str(output_directory), should_save_mappings=False) as worker:
+        worker.find_files([str(encoded_directory / 'output.zip')], for_encode=False)
+        if use_index:
+            worker.open_mapping_index(mapping_path)
+        else:
+            worker.load_mappings(mapping_path)
+        worker.process_files(jobs=jobs)
+    with zipfile.ZipFile(output_directory / 'output.zip') as output_zip:
+        return {name: output_zip.read(name) for name in output_zip.namelist()}
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_decode_with_index(tmp_path, jobs) -> None:
+    with Worker(output_directory=str(tmp_path / 'encoded')) as worker:
+        worker.find_files(DATA_PATHS, for_encode=True)
+        worker.process_files()
+    expected = decode(tmp_path / 'loaded', tmp_path / 'encoded', jobs=1, use_index=False)
+    outputs = decode(tmp_path / 'indexed', tmp_path / 'encoded', jobs=jobs, use_index=True)
+    if jobs == 1:
+        assert outputs == expected
+    else:
+        # Supporting files with the same name get their suffixes in the order in which jobs finish them.
+        assert outputs.keys() == expected.keys() and sorted(outputs.values()) == sorted(expected.values())
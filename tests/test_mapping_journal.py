@@ -0,0 +1,61 @@
+import pathlib
+
+import anonymizer
+from anonymizer import ConfigFactory, Operation, QueueItem, Worker
+
+
+def encode(worker: Worker, name: str) -> None:
+    in_file = pathlib.Path(__file__).parent / 'data/telus' / name
+    QueueItem(path=in_file, config=ConfigFactory.get_config(in_file.name), operation=Operation.ENCODE).process(worker)
+
+
+def load_mapping(path: pathlib.Path) -> dict[str, str]:
+    with Worker(output_directory=str(path.parent / 'unused'), should_save_mappings=False) as worker:
+        worker.load_mappings(path)
+        return worker.encoded_mappings
+
+
+def test_mappings_appended(tmp_path) -> None:
+    with Worker(output_directory=str(tmp_path)) as worker:
+        encode(worker, 'Individual_Detail_test.txt')
+        first_mapping = dict(worker.encoded_mappings)
+    mapping_path = tmp_path / Worker.MAPPING_FILE_NAME
+    first_content = mapping_path.read_bytes()
+
+    with Worker(output_directory=str(tmp_path), output_zipname='second.zip') as worker:
+        worker.load_mappings(mapping_path)
+        encode(worker, 'Group_Summary_Report_test.txt')
+        second_mapping = dict(worker.encoded_mappings)
+
+    assert second_mapping.items() > first_mapping.items()
+    # Entries of the first run are kept as they are, the new ones are added after them.
+    assert mapping_path.read_bytes().startswith(first_content)
+    assert load_mapping(mapping_path) == second_mapping
+
+
+def test_mappings_saved_while_processing(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(anonymizer, 'MAPPING_FLUSH_SIZE', 1)
+    with Worker(output_directory=str(tmp_path)) as worker:
+        encode(worker, 'Individual_Detail_test.txt')
+        # Every token is already in the file before the worker is done.
+        assert load_mapping(tmp_path / Worker.MAPPING_FILE_NAME) == worker.encoded_mappings
+
+
+def test_torn_entry_compacted(tmp_path) -> None:
+    with Worker(output_directory=str(tmp_path)) as worker:
+        encode(worker, 'Individual_Detail_test.txt')
+        mapping = dict(worker.encoded_mappings)
+    mapping_path = tmp_path / Worker.MAPPING_FILE_NAME
+    with mapping_path.open(mode='a', encoding='utf-8') as f:
+        f.write('torn value\tenc-123')
+
+    with Worker(output_directory=str(tmp_path), output_zipname='second.zip') as worker:
+        worker.load_mappings(mapping_path)
+        assert worker.encoded_mappings == mapping
+        assert not worker.mapping_file_synced
+
+    content = mapping_path.read_text(encoding='utf-8')
+    assert 'torn value' not in content
+    assert content.endswith('\n')
+    assert load_mapping(mapping_path) == mapping
+    assert not list(tmp_path.glob('.*.tmp'))
@@ -0,0 +1,82 @@
+import os
+import pathlib
+import pickle
+import subprocess
+import sys
+import tracemalloc
+
+import pytest
+
+from anonymizer import MappingStore, Worker
+
+ENTRIES = [('555-0100', 'enc-0000000000000042'), (1122, 'enc-9227816233264160'), ('Smith', 'enc-1000000000000000')]
+
+
+def test_store_works_like_a_dict() -> None:
+    store = MappingStore(ENTRIES)
+    assert store == dict(ENTRIES)
+    assert list(store.items()) == ENTRIES and list(store) == [value for value, _ in ENTRIES]
+    assert store['555-0100'] == 'enc-0000000000000042' and store.get(1122) == 'enc-9227816233264160'
+    assert 'Smith' in store and 'Jones' not in store and store.get('Jones') is None
+    with pytest.raises(KeyError):
+        store['Jones']  # noqa (the statement has an effect)
+    assert store.last_token() == 'enc-1000000000000000' and MappingStore().last_token() is None
+
+
+def test_inverse() -> None:
+    store = MappingStore(ENTRIES[:2])
+    assert store.inverse['enc-9227816233264160'] == 1122
+    # Index of the tokens keeps up with values added after it's built.
+    store.add('Smith', 'enc-1000000000000000')
+    assert store.inverse['enc-1000000000000000'] == 'Smith'
+    assert 'enc-1000000000000001' not in store.inverse
+    assert dict(store.inverse) == {encoded: value for value, encoded in ENTRIES}
+
+
+def test_copy_and_pickle() -> None:
+    store = MappingStore(ENTRIES[:2])
+    assert 'enc-0000000000000042' in store.inverse
+    for other in (store.copy(), pickle.loads(pickle.dumps(store))):
+        other.add('Smith', 'enc-1000000000000000')
+        assert list(other.items()) == ENTRIES and other.inverse['enc-1000000000000000'] == 'Smith'
+    assert len(store) == 2 and 'enc-1000000000000000' not in store.inverse
+
+
+def test_loaded_duplicates_keep_the_last_token(tmp_path) -> None:
+    mapping_path = tmp_path / Worker.MAPPING_FILE_NAME
+    mapping_path.write_text('a\tenc-0000000000000001\nb\tenc-0000000000000002\na\tenc-0000000000000003\n')
+    with Worker(output_directory=str(tmp_path), should_save_mappings=False) as worker:
+        worker.load_mappings(mapping_path)
+        assert list(worker.encoded_mappings.items()) == [('a', 'enc-0000000000000003'), ('b', 'enc-0000000000000002')]
+        assert worker.decoded_mappings['enc-0000000000000003'] == 'a'
+        assert not worker.mapping_file_synced
+
+
+def test_memory_per_entry() -> None:
+    count = 30_000
+    values = [f'555{number:07}' for number in range(count)]
+    tracemalloc.start()
+    try:
+        store = MappingStore((value, f'enc-{number * 7919:016}') for number, value in enumerate(values))
+        assert 'enc-0000000000000000' in store.inverse
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # Besides the values themselves, with the tables of both values and tokens. Dicts of them took about 120 bytes.
+    assert size / count < 40
+
+
+def test_pickle_in_process_with_other_hashes(tmp_path) -> None:
+    store = MappingStore(ENTRIES)
+    (tmp_path / 'store.pickle').write_bytes(pickle.dumps(store))
+    # Hashes of the strings are different there, the table of values is built again.
+    script = (
+        'import pickle, sys\n'
+        f'store = pickle.loads(open({str(tmp_path / "store.pickle")!r}, "rb").read())\n'
+        'assert store["555-0100"] == "enc-0000000000000042" and store["Smith"] == "enc-1000000000000000"\n'
+        'assert "Jones" not in store and store.inverse["enc-9227816233264160"] == 1122\n'
+    )
+    subprocess.run(
+        [sys.executable, '-c', script], check=True, cwd=pathlib.Path(__file__).parent.parent,
+        env={**os.environ, 'PYTHONHASHSEED': '1'},
+    )
@@ -0,0 +1,46 @@
+import pathlib
+import zipfile
+
+from anonymizer import ENC_PATTERN, Worker
+
+
+def encode_data(output_directory: pathlib.Path, jobs: int) -> dict[str, str]:
+    data_paths = [pathlib.Path(__file__).parent / 'data' / carrier for carrier in ('verizon', 'at&t', 'telus')]
+    with Worker(output_directory=str(output_directory)) as worker:
+        worker.find_files(data_paths, for_encode=True)
+        worker.process_files(jobs=jobs)
+        mappings = dict(worker.encoded_mappings)
+
+    # Tokens are random, so outputs are compared with the tokens replaced back by the original values.
+    decoded_mappings = {encoded: value for value, encoded in mappings.items()}
+    with zipfile.ZipFile(output_directory / 'output.zip') as output_zip:
+        return {
+            name: ENC_PATTERN.sub(
+                lambda match: decoded_mappings[match.group()], output_zip.read(name).decode('latin-1')
+            )
+            for name in output_zip.namelist()
+        }
+
+
+def test_parallel_matches_sequential(tmp_path) -> None:
+    sequential_output = encode_data(tmp_path / 'sequential', jobs=1)
+    parallel_output = encode_data(tmp_path / 'parallel', jobs=3)
+    assert parallel_output == sequential_output
+
+
+def test_parallel_mapping_is_consistent(tmp_path) -> None:
+    output_directory = tmp_path / 'parallel'
+    encode_data(output_directory, jobs=3)
+
+    with Worker(output_directory=str(tmp_path / 'unused'), should_save_mappings=False) as worker:
+        worker.load_mappings(output_directory / Worker.MAPPING_FILE_NAME)
+        mapping = worker.encoded_mappings
+
+    # Each value has a single token, and tokens are not reused.
+    assert len(set(mapping.values())) == len(mapping)
+
+    with zipfile.ZipFile(output_directory / 'output.zip') as output_zip:
+        tokens = set()
+        for name in output_zip.namelist():
+            tokens.update(ENC_PATTERN.findall(output_zip.read(name).decode('latin-1')))
+    assert tokens <= set(mapping.values())
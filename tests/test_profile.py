@@ -0,0 +1,67 @@
+import json
+import pathlib
+import zipfile
+
+import pytest
+
+from anonymizer import RunProfile, Worker
+
+DATA_DIRECTORY = pathlib.Path(__file__).parent / 'data'
+
+
+def run(output_directory: pathlib.Path, for_encode: bool, profile: bool, jobs: int = 1, paths=None) -> Worker:
+    with Worker(
+        output_directory=str(output_directory), should_save_mappings=for_encode, token_key=b'key', profile=profile,
+    ) as worker:
+        worker.find_files(paths or [str(DATA_DIRECTORY)], for_encode=for_encode)
+        if not for_encode:
+            worker.load_mappings(output_directory.parent / 'plain' / Worker.MAPPING_FILE_NAME)
+        worker.process_files(jobs=jobs)
+    return worker
+
+
+def read_outputs(output_directory: pathlib.Path) -> dict[str, bytes]:
+    with zipfile.ZipFile(output_directory / 'output.zip') as output_zip:
+        return {name: output_zip.read(name) for name in output_zip.namelist()}
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_profile_report(tmp_path, jobs) -> None:
+    plain = run(tmp_path / 'plain', for_encode=True, profile=False)
+    assert not (tmp_path / 'plain' / RunProfile.FILE_NAME).exists()
+
+    worker = run(tmp_path / 'profiled', for_encode=True, profile=True, jobs=jobs)
+    assert read_outputs(tmp_path / 'profiled').keys() == read_outputs(tmp_path / 'plain').keys()
+    report = json.loads((tmp_path / 'profiled' / RunProfile.FILE_NAME).read_text())
+
+    assert report['jobs'] == jobs
+    assert {'list', 'route', 'reuse', 'process', 'close'} <= report['stages'].keys()
+    total = report['total']
+    assert total['files'] == len(report['files']) == worker.processed_count
+    assert sum(report['configs'][name]['files'] for name in report['configs']) == total['files']
+    # Workbooks are read in parts, some of them more than once.
+    assert total['bytes_in'] >= sum(plain.filesizes)
+    assert total['values_encoded'] >= total['new_mappings'] > 0
+    assert total['values_decoded'] == 0
+    if jobs == 1:
+        assert total['new_mappings'] == len(worker.encoded_mappings)
+        assert total['stages']['copy'] == 0
+    else:
+        assert total['stages']['copy'] > 0
+
+    by_path = {entry['path']: entry for entry in report['files']}
+    telus = by_path[str(DATA_DIRECTORY / 'telus/Account_Detail_test.txt')]
+    assert telus['config'] == 'Telus.AccountDetail' and telus['operation'] == 'ENCODE'
+    # Raw reports are processed line by line.
+    assert telus['rows'] == len((DATA_DIRECTORY / 'telus/Account_Detail_test.txt').read_text().splitlines())
+    assert telus['bytes_in'] == (DATA_DIRECTORY / 'telus/Account_Detail_test.txt').stat().st_size
+    assert telus['bytes_out'] > telus['compressed_bytes_out'] > 0
+    assert telus['seconds'] == pytest.approx(sum(telus['stages'].values()), abs=1e-5)
+
+
+def test_profile_of_decode(tmp_path) -> None:
+    run(tmp_path / 'plain', for_encode=True, profile=False)
+    run(tmp_path / 'decoded', for_encode=False, profile=True, paths=[str(tmp_path / 'plain' / 'output.zip')])
+    total = json.loads((tmp_path / 'decoded' / RunProfile.FILE_NAME).read_text())['total']
+    assert total['values_decoded'] > 0
+    assert total['values_encoded'] == total['new_mappings'] == 0 and total['cache_hit_ratio'] is None
@@ -0,0 +1,53 @@
+import json
+import pathlib
+import re
+
+import pytest
+
+import anonymizer
+from anonymizer import Worker
+
+DATA_DIRECTORY = pathlib.Path(__file__).parent / 'data'
+PATHS = [str(DATA_DIRECTORY / 'telus'), str(DATA_DIRECTORY / 'at&t')]
+
+
+def read_events(path: pathlib.Path) -> list[dict]:
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_progress_events(tmp_path, monkeypatch, capsys, jobs) -> None:
+    # Every read of the input is reported.
+    monkeypatch.setattr(anonymizer, 'PROGRESS_INTERVAL', 0)
+    monkeypatch.setattr(anonymizer, 'INPUT_BUFFER_SIZE', 1024)
+    events_path = tmp_path / 'events.jsonl'
+    with Worker(output_directory=str(tmp_path / 'output'), events_path=str(events_path)) as worker:
+        worker.find_files(PATHS, for_encode=True)
+        worker.process_files(jobs=jobs)
+
+    events = read_events(events_path)
+    assert events[0]['event'] == 'start' and events[0]['files'] == len(worker.filesizes)
+    assert events[-1] == {'event': 'finish', 'time': events[-1]['time'], 'files': len(worker.filesizes)}
+    file_events = [event for event in events if event['event'] == 'file']
+    assert sorted(event['bytes'] for event in file_events) == sorted(worker.filesizes)
+
+    progress = [event for event in events if event['event'] == 'progress']
+    assert progress[-1]['percent'] == 100 and progress[-1]['bytes'] == sum(worker.filesizes)
+    assert progress[-1]['rows'] > 0
+    assert all(first['bytes'] <= second['bytes'] for first, second in zip(progress, progress[1:]))
+    if jobs == 1:
+        # Progress moves while a file is read, not only once it's finished.
+        assert any(event['files'] == 0 and event['bytes'] > 0 for event in progress)
+
+    lines = [line for line in capsys.readouterr().out.splitlines() if line.startswith('Progress')]
+    assert lines and all(re.match(r'^Progress (?P<percent>\d+)%', line) for line in lines)
+
+
+def test_error_event(tmp_path) -> None:
+    events_path = tmp_path / 'events.jsonl'
+    with pytest.raises(RuntimeError):
+        with Worker(output_directory=str(tmp_path / 'output'), events_path=str(events_path)):
+            raise RuntimeError('stopped')
+    assert read_events(events_path) == [
+        {'event': 'error', 'time': read_events(events_path)[0]['time'], 'message': 'RuntimeError: stopped'},
+    ]
@@ -0,0 +1,131 @@
+import json
+import pathlib
+import subprocess
+import sys
+import zipfile
+
+import pytest
+
+import anonymizer
+from anonymizer import ENC_PATTERN, RunManifest, Worker, file_digest
+
+ROOT_DIRECTORY = pathlib.Path(__file__).parent.parent
+DATA_PATHS = [ROOT_DIRECTORY / 'tests/data/telus', ROOT_DIRECTORY / 'tests/data/rogers']
+
+CRASHING_RUN = '''
+import os, sys
+sys.path.insert(0, sys.argv[1])
+import anonymizer
+
+process = anonymizer.QueueItem.process
+processed = []
+
+def process_then_crash(self, worker, *args):
+    if len(processed) == 3:
+        os._exit(1)
+    processed.append(self)
+    return process(self, worker, *args)
+
+anonymizer.QueueItem.process = process_then_crash
+with anonymizer.Worker(sys.argv[2], resume=True) as worker:
+    worker.find_files(sys.argv[3:], for_encode=True)
+    worker.process_files()
+'''
+
+
+def encode(output_directory: pathlib.Path, paths=DATA_PATHS, resume=True, jobs=1) -> int:
+    """Runs like the CLI does, returns the number of files that were actually processed."""
+    with Worker(output_directory=str(output_directory), resume=resume) as worker:
+        worker.find_files(paths, for_encode=True)
+        if (mapping_path := output_directory / Worker.MAPPING_FILE_NAME).exists():
+            worker.load_mappings(mapping_path)
+        worker.process_files(jobs=jobs)
+    return worker.processed_count
+
+
+def decoded_outputs(output_directory: pathlib.Path) -> dict[str, str]:
+    with Worker(output_directory=str(output_directory / 'unused'), should_save_mappings=False) as worker:
+        worker.load_mappings(output_directory / Worker.MAPPING_FILE_NAME)
+        decoded_mappings = worker.decoded_mappings
+    with zipfile.ZipFile(output_directory / 'output.zip') as output_zip:
+        return {
+            name: ENC_PATTERN.sub(
+                lambda match: decoded_mappings[match.group()], output_zip.read(name).decode('latin-1')
+            )
+            for name in output_zip.namelist()
+        }
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_resume_after_crash(tmp_path, jobs) -> None:
+    total = encode(tmp_path / 'complete', resume=False)
+
+    output_directory = tmp_path / 'resumed'
+    result = subprocess.run(
+        [sys.executable, '-c', CRASHING_RUN, str(ROOT_DIRECTORY), str(output_directory), *map(str, DATA_PATHS)],
+        capture_output=True,
+    )
+    assert result.returncode == 1
+    with pytest.raises(zipfile.BadZipFile):
+        zipfile.ZipFile(output_directory / 'output.zip')
+    assert len((output_directory / RunManifest.FILE_NAME).read_text().splitlines()) == 3
+
+    assert encode(output_directory, jobs=jobs) == total - 3
+    outputs, complete_outputs = decoded_outputs(output_directory), decoded_outputs(tmp_path / 'complete')
+    if jobs == 1:
+        assert outputs == complete_outputs
+    else:
+        # Supporting files with the same name get their suffixes in the order in which files are finished.
+        assert sorted(outputs.values()) == sorted(complete_outputs.values())
+    assert not (output_directory / '.output.zip.previous').exists()
+
+
+def test_rerun_processes_only_new_files(tmp_path) -> None:
+    output_directory = tmp_path / 'output'
+    encode(output_directory, paths=DATA_PATHS[:1])
+    first_outputs = decoded_outputs(output_directory)
+
+    assert encode(output_directory, paths=DATA_PATHS[:1]) == 0
+    assert decoded_outputs(output_directory) == first_outputs
+
+    rogers_total = encode(tmp_path / 'rogers', paths=DATA_PATHS[1:], resume=False)
+    assert encode(output_directory) == rogers_total
+    outputs = decoded_outputs(output_directory)
+    assert {name: outputs[name] for name in first_outputs} == first_outputs
+    assert outputs.keys() - first_outputs.keys() == decoded_outputs(tmp_path / 'rogers').keys()
+
+
+def test_other_mappings_are_not_reused(tmp_path) -> None:
+    output_directory = tmp_path / 'output'
+    total = encode(output_directory, paths=DATA_PATHS[:1])
+    (output_directory / Worker.MAPPING_FILE_NAME).unlink()
+    assert encode(output_directory, paths=DATA_PATHS[:1]) == total
+
+
+def test_without_resume_everything_is_processed(tmp_path) -> None:
+    output_directory = tmp_path / 'output'
+    total = encode(output_directory, paths=DATA_PATHS[:1])
+    # Without `resume`, the manifest of the previous run is dropped and none is kept.
+    assert encode(output_directory, paths=DATA_PATHS[:1], resume=False) == total
+    assert not (output_directory / RunManifest.FILE_NAME).exists()
+    assert encode(output_directory, paths=DATA_PATHS[:1]) == total
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_inputs_are_hashed_while_read(tmp_path, monkeypatch, jobs) -> None:
+    hashed = []
+
+    def counted_file_digest(path):
+        hashed.append(str(path))
+        return file_digest(path)
+
+    monkeypatch.setattr(anonymizer, 'file_digest', counted_file_digest)
+    output_directory = tmp_path / 'output'
+    encode(output_directory, jobs=jobs)
+    entries = [json.loads(line) for line in (output_directory / RunManifest.FILE_NAME).read_text().splitlines()]
+    assert entries
+    # Data files are hashed while they're encoded, none of them is read again for the manifest.
+    assert not {entry['path'] for entry in entries}.intersection(hashed)
+    for entry in entries:
+        if pathlib.Path(entry['path']).is_file():
+            assert entry['digest'] == file_digest(pathlib.Path(entry['path']))
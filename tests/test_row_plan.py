@@ -0,0 +1,66 @@
+import io
+
+import pytest
+
+from anonymizer import CSVConfig, Worker
+
+SOURCE = (
+    'id, name ,kind,note,extra\n'
+    '1,Alice,User Name,x,keep\n'
+    '2,Bob,Other,y,keep\n'
+    '\n'
+    '3,Carol,Other\n'
+    '4, Dave ,User Name,"a, b",keep\n'
+    '5,,User Name,,\n'
+)
+
+
+def make_config(**kwargs) -> CSVConfig:
+    options = dict(
+        clear_columns=['extra'],
+        encode_columns=['name'],
+        encode_conditional=[['note', 'kind', '==', 'User Name']],
+        encode_regex=[[r'^(?P<prefix>\w)', 'id']],
+        file_mask='.*',
+        carrier='test',
+        dialect='excel',
+    )
+    options.update(kwargs)
+    return CSVConfig(**options)
+
+
+def encode(tmp_path, config: CSVConfig, source: str, use_plan: bool) -> str:
+    in_file = tmp_path / 'source.csv'
+    in_file.write_text(source, encoding='utf-8')
+    destination = io.StringIO()
+    with Worker(output_directory=str(tmp_path), should_save_mappings=False, token_key=b'key') as worker:
+        config._process(in_file, worker, destination, config.mapper, config.compile_row_plan if use_plan else None)
+    return destination.getvalue()
+
+
+def test_plan_matches_mapper(tmp_path) -> None:
+    config = make_config()
+    encoded = encode(tmp_path, config, SOURCE, use_plan=True)
+    assert encoded == encode(tmp_path, config, SOURCE, use_plan=False)
+    # Short row is still filled in by the dict path.
+    assert encoded.splitlines()[3].endswith(',Other,,')
+
+
+def test_duplicate_columns_use_mapper(tmp_path) -> None:
+    config = make_config()
+    source = 'id,name,name,kind,note,extra\n1,a,b,User Name,c,d\n'
+    assert config.compile_row_plan(['id', 'name', 'name', 'kind', 'note', 'extra'], None, {}) is None
+    assert encode(tmp_path, config, source, use_plan=True) == encode(tmp_path, config, source, use_plan=False)
+
+
+def test_unknown_operator_fails_on_first_row(tmp_path) -> None:
+    config = make_config(encode_conditional=[['note', 'kind', '<>', 'User Name']])
+    with pytest.raises(ValueError, match='Unknown operator'):
+        encode(tmp_path, config, SOURCE, use_plan=True)
+
+
+def test_unknown_column_fails_on_first_row(tmp_path) -> None:
+    config = make_config(encode_columns=['missing'])
+    assert encode(tmp_path, config, 'id,name,kind,note,extra\n', use_plan=True) == 'id,name,kind,note,extra\n'
+    with pytest.raises(KeyError):
+        encode(tmp_path, config, SOURCE, use_plan=True)
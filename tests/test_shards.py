@@ -0,0 +1,98 @@
+import json
+import pathlib
+import zipfile
+
+import pytest
+
+from anonymizer import OutputArchives, Worker
+
+DATA_DIRECTORY = pathlib.Path(__file__).parent / 'data'
+DATA_PATHS = [str(DATA_DIRECTORY / 'telus'), str(DATA_DIRECTORY / 'rogers'), str(DATA_DIRECTORY / 'at&t')]
+INDEX_NAME = f'output{OutputArchives.INDEX_SUFFIX}'
+
+
+def run(output_directory: pathlib.Path, paths: list[str], for_encode: bool = True, jobs: int = 1, **kwargs) -> Worker:
+    with Worker(
+        output_directory=str(output_directory), should_save_mappings=for_encode, token_key=b'key', **kwargs,
+    ) as worker:
+        worker.find_files(paths, for_encode=for_encode)
+        if for_encode and (mapping_path := output_directory / Worker.MAPPING_FILE_NAME).exists():
+            worker.load_mappings(mapping_path)
+        elif not for_encode:
+            worker.load_mappings(output_directory.parent / 'encoded' / Worker.MAPPING_FILE_NAME)
+        worker.process_files(jobs=jobs)
+    return worker
+
+
+def read_shards(output_directory: pathlib.Path) -> dict[str, dict[str, bytes]]:
+    shards = {}
+    for path in sorted(output_directory.glob('*.zip')):
+        with zipfile.ZipFile(path) as output_zip:
+            shards[path.name] = {name: output_zip.read(name) for name in output_zip.namelist()}
+    return shards
+
+
+def data_outputs(worker: Worker) -> dict[str, bytes]:
+    """Outputs of the data files, from whichever shard holds each one."""
+    shards = read_shards(worker.output_directory)
+    return {name: shards[shard.name][name] for name, shard in worker.outputs.members.items()}
+
+
+@pytest.mark.parametrize('options, jobs', [
+    ({'shard_by': 'size', 'shard_size': 10000}, 1),
+    ({'shard_by': 'size', 'shard_size': 10000}, 2),
+    ({'shard_by': 'carrier'}, 1),
+    ({'shard_by': 'hash', 'shard_count': 3}, 2),
+])
+def test_sharded_output(tmp_path, options, jobs) -> None:
+    single = run(tmp_path / 'single', DATA_PATHS)
+    assert not (tmp_path / 'single' / INDEX_NAME).exists()
+    (single_members,) = read_shards(tmp_path / 'single').values()
+
+    sharded = run(tmp_path / 'encoded', DATA_PATHS, jobs=jobs, **options)
+    shards = read_shards(tmp_path / 'encoded')
+    assert len(shards) > 1
+    if options['shard_by'] == 'carrier':
+        assert list(shards) == ['output-AT_T.zip', 'output-Rogers.zip', 'output-Telus.zip']
+    index = json.loads((tmp_path / 'encoded' / INDEX_NAME).read_text())
+    assert sorted(index['shards']) == list(shards)
+    assert index['members'] == {
+        name: [shard for shard in index['shards'] if name in shards[shard]]
+        for name in {name for members in shards.values() for name in members}
+    }
+    assert data_outputs(sharded) == data_outputs(single)
+    assert {content for members in shards.values() for content in members.values()} == set(single_members.values())
+
+    # Decode finds the shards in the index, and the supporting files of each data file in its shard.
+    decoded = run(tmp_path / 'decoded', [str(tmp_path / 'encoded' / INDEX_NAME)], for_encode=False)
+    assert data_outputs(decoded) == data_outputs(
+        run(tmp_path / 'decoded-single', [str(tmp_path / 'single' / 'output.zip')], for_encode=False)
+    )
+
+
+def test_sharded_output_is_resumed(tmp_path) -> None:
+    output_directory = tmp_path / 'encoded'
+    total = run(output_directory, DATA_PATHS, resume=True, shard_by='hash', shard_count=3).processed_count
+    shards = read_shards(output_directory)
+
+    assert run(output_directory, DATA_PATHS, resume=True, shard_by='hash', shard_count=3).processed_count == 0
+    assert read_shards(output_directory) == shards
+    # Outputs in other shards are processed again.
+    assert run(output_directory, DATA_PATHS, resume=True, shard_by='hash', shard_count=2).processed_count < total
+
+
+def test_previous_shards_are_removed(tmp_path) -> None:
+    output_directory = tmp_path / 'encoded'
+    run(output_directory, DATA_PATHS, shard_by='carrier')
+    run(output_directory, DATA_PATHS[:1])
+    assert sorted(path.name for path in output_directory.glob('*.zip')) == ['output.zip']
+    assert not (output_directory / INDEX_NAME).exists()
+
+
+def test_output_directory_is_decoded(tmp_path) -> None:
+    encoded = run(tmp_path / 'encoded', DATA_PATHS, shard_by='size', shard_size=10000)
+    assert len(read_shards(tmp_path / 'encoded')) > 1
+    # Directory holds both the index and the shards it lists, each member is decoded once.
+    decoded = run(tmp_path / 'decoded', [str(tmp_path / 'encoded')], for_encode=False)
+    assert decoded.processed_count == encoded.processed_count
+    assert sorted(decoded.outputs.members) == sorted(encoded.outputs.members)
@@ -0,0 +1,106 @@
+import copy
+import csv
+import io
+import pathlib
+import zipfile
+
+import pytest
+
+from anonymizer import ConfigFactory, FileRange, Worker, record_boundaries
+
+DATA_DIRECTORY = pathlib.Path(__file__).parent / 'data'
+
+
+def write_big_file(directory: pathlib.Path, rows: int) -> pathlib.Path:
+    """Bell detail file with its two header rows, and values with quotes and line breaks in them."""
+    with (DATA_DIRECTORY / 'bell' / 'double_header_DTL.csv').open(encoding='iso-8859-1', newline='') as sample:
+        headers = list(csv.reader(sample))[:2]
+    directory.mkdir()
+    path = directory / 'big_DTL.csv'
+    with path.open(mode='w', encoding='iso-8859-1', newline='') as destination:
+        writer = csv.writer(destination, lineterminator='\r\n')
+        writer.writerows(headers)
+        for number in range(rows):
+            row = [f'acct-{number % 97}', '2021-03-01', f'555{number:07}'] + [''] * (len(headers[0]) - 3)
+            row[10] = f'called "{number % 13}"\nnext line' if number % 5 == 0 else f'{number % 31}'
+            row[26] = 'quoted, "desc"' if number % 3 == 0 else 'desc'
+            writer.writerow(row)
+    return path
+
+
+def encode(output_directory: pathlib.Path, path: pathlib.Path, jobs: int, split_size: int) -> Worker:
+    with Worker(output_directory=str(output_directory), token_key=b'key', split_size=split_size) as worker:
+        worker.find_files([str(path)], for_encode=True)
+        worker.process_files(jobs=jobs)
+    return worker
+
+
+def read_output(output_directory: pathlib.Path) -> bytes:
+    with zipfile.ZipFile(output_directory / 'output.zip') as output_zip:
+        (name,) = output_zip.namelist()
+        return output_zip.read(name)
+
+
+def test_split_file_matches_sequential(tmp_path) -> None:
+    path = write_big_file(tmp_path / 'data', rows=3000)
+    ConfigFactory.load_configuration()
+    config = ConfigFactory.get_config(path.name)
+    parts = config.split_file(path, 20_000)
+    assert len(parts) > 5
+    assert parts[0].start == 0 and parts[-1].end == path.stat().st_size
+    assert all(part.end == next_part.start for part, next_part in zip(parts, parts[1:]))
+
+    sequential = encode(tmp_path / 'sequential', path, jobs=1, split_size=20_000)
+    split = encode(tmp_path / 'split', path, jobs=2, split_size=20_000)
+    assert split.processed_count == 1
+    assert read_output(tmp_path / 'split') == read_output(tmp_path / 'sequential')
+    # Parts are added in order, so the mappings are in the order in which a single job finds the values.
+    assert list(split.encoded_mappings.items()) == list(sequential.encoded_mappings.items())
+    assert not list((tmp_path / 'split').glob('.parts-*'))
+
+
+def test_split_file_with_stray_quote(tmp_path) -> None:
+    path = write_big_file(tmp_path / 'data', rows=3000)
+    # Quote in a field that isn't quoted is a part of the value, the quoted line breaks after it are still quoted.
+    data = path.read_bytes().replace(b',desc,', b',12" screen,', 1)
+    path.write_bytes(data)
+    width = len(next(csv.reader(io.StringIO(data.decode('iso-8859-1')))))
+    ConfigFactory.load_configuration()
+    parts = ConfigFactory.get_config(path.name).split_file(path, 20_000)
+    assert len(parts) > 5
+    for part in parts[1:]:
+        records = csv.reader(io.StringIO(data[part.start:part.end].decode('iso-8859-1'), newline=''))
+        assert {len(record) for record in records} == {width}
+
+    encode(tmp_path / 'sequential', path, jobs=1, split_size=20_000)
+    encode(tmp_path / 'split', path, jobs=2, split_size=20_000)
+    assert read_output(tmp_path / 'split') == read_output(tmp_path / 'sequential')
+
+
+@pytest.mark.parametrize('encoding, split_size', [('iso-8859-1', 0), ('iso-8859-1', 10 ** 9), ('utf-16', 20_000)])
+def test_file_is_not_split(tmp_path, encoding, split_size) -> None:
+    path = write_big_file(tmp_path / 'data', rows=300)
+    ConfigFactory.load_configuration()
+    config = copy.copy(ConfigFactory.get_config(path.name))
+    # Line breaks of UTF-16 are two bytes.
+    config.encoding = encoding
+    assert config.split_file(path, split_size) == [path]
+
+
+def test_record_boundaries() -> None:
+    data = b'a,b\n"1\n2",3\n4,""""\n"5\n",6\n7,8\n'
+    assert record_boundaries(io.BytesIO(data), 0, 1, b'"', b',') == [4, 12, 19, 26, 30]
+    assert record_boundaries(io.BytesIO(data), 4, 10, b'"', b',') == [19, 30]
+    assert record_boundaries(io.BytesIO(data), 0, 100, b'"', b',') == []
+    # Only a quote at the start of a field starts quotes.
+    data = b'a,1"\n"2\n",b"c\nd\n'
+    assert record_boundaries(io.BytesIO(data), 0, 1, b'"', b',') == [5, 14, 16]
+
+
+def test_file_range(tmp_path) -> None:
+    path = tmp_path / 'data.csv'
+    path.write_bytes(b'header\nfirst\nsecond\n')
+    part = FileRange(path, 7, 13)
+    assert part.stat().st_size == 6 and not part.is_first
+    with part.open(encoding='utf-8') as source:
+        assert source.read() == 'first\n'
@@ -0,0 +1,54 @@
+import json
+import os
+import pathlib
+import subprocess
+import sys
+
+from anonymizer import ConfigFactory
+
+ROOT_DIRECTORY = pathlib.Path(__file__).parent.parent
+
+RUN_CLI = '''
+import runpy, sys
+sys.argv = ['anonymizer.py'] + sys.argv[1:]
+try:
+    runpy.run_path('anonymizer.py', run_name='__main__')
+finally:
+    print(sorted({name.split('.')[0] for name in sys.modules} & {'gooey', 'openpyxl', 'toml', 'wx'}))
+'''
+
+
+def run_cli(tmp_path, *args: str) -> list[str]:
+    env = dict(os.environ, XDG_CACHE_HOME=str(tmp_path / 'cache'))
+    result = subprocess.run(
+        [sys.executable, '-c', RUN_CLI, *args], cwd=ROOT_DIRECTORY, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1].replace("'", '"'))
+
+
+def test_csv_cli_imports_no_gui_or_xlsx(tmp_path) -> None:
+    input_directory = ROOT_DIRECTORY / 'tests/data/at&t'
+    assert run_cli(tmp_path, 'Encode', str(tmp_path / 'out'), str(input_directory / 'rawdataoutput_test.csv')) \
+        == ['toml']
+    # The parsed configuration comes from the cache on the next run.
+    assert run_cli(tmp_path, 'Encode', str(tmp_path / 'out2'), str(input_directory / 'rawdataoutput_test.csv')) == []
+
+
+def test_configuration_cache(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(ConfigFactory, 'CACHE_DIRECTORY', tmp_path / 'cache')
+    config_path = tmp_path / 'config.toml'
+    config_path.write_text("[a]\n[a.b]\nfile_mask = 'x'\n")
+    assert ConfigFactory.read_configuration(config_path) == {'a': {'b': {'file_mask': 'x'}}}
+    cache_path, = (tmp_path / 'cache').iterdir()
+
+    # Same content with a new modification time.
+    os.utime(config_path, ns=(0, 0))
+    cache_path.write_text(cache_path.read_text().replace('"file_mask": "x"', '"file_mask": "from cache"'))
+    assert ConfigFactory.read_configuration(config_path) == {'a': {'b': {'file_mask': 'from cache'}}}
+    assert json.loads(cache_path.read_text())['mtime_ns'] == 0
+
+    config_path.write_text("[a]\n[a.b]\nfile_mask = 'y'\n")
+    assert ConfigFactory.read_configuration(config_path) == {'a': {'b': {'file_mask': 'y'}}}
+
+    cache_path.write_text('{broken')
+    assert ConfigFactory.read_configuration(config_path) == {'a': {'b': {'file_mask': 'y'}}}
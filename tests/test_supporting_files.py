@@ -0,0 +1,37 @@
+import pathlib
+import zipfile
+
+from anonymizer import ConfigFactory, CSVConfig, Operation, QueueItem, Worker, ZipPath
+
+
+def rogers_path(archive: str, name: str) -> ZipPath:
+    return ZipPath(pathlib.Path(__file__).parent / 'data/rogers' / archive, name)
+
+
+def test_supporting_files_saved_once(fake_fs) -> None:
+    in_files = [
+        rogers_path('test_GPRS.zip', 'ALL_CALLS-GPRS.txt'),
+        rogers_path('test_GPRS.zip', 'ALL_CALLS-GPRS.txt'),
+        # Header with the same name, but a different content.
+        rogers_path('test_GPRS_RM.zip', 'ALL_CALLS-GPRS-Rm.txt'),
+    ]
+    with Worker(output_directory='out') as worker:
+        for in_file in in_files:
+            QueueItem(in_file, ConfigFactory.get_config(in_file.name), Operation.ENCODE).process(worker)
+
+    with zipfile.ZipFile('out/output.zip') as output_zip:
+        names = output_zip.namelist()
+        assert names.count('Header-GPRS.txt') == 1
+        assert names.count('Header-GPRS.txt.2') == 1
+        assert output_zip.read('Header-GPRS.txt') == rogers_path('test_GPRS.zip', 'Header-GPRS.txt').read_bytes()
+        assert output_zip.read('Header-GPRS.txt.2') == \
+            rogers_path('test_GPRS_RM.zip', 'Header-GPRS.txt').read_bytes()
+
+
+def test_fieldnames_cached(fake_fs) -> None:
+    config = ConfigFactory.get_config('ALL_CALLS-GPRS.txt')
+    assert isinstance(config, CSVConfig)
+
+    fieldnames = config._load_fieldnames(rogers_path('test_GPRS.zip', 'ALL_CALLS-GPRS.txt'))
+    assert 'User Number' in fieldnames
+    assert config._load_fieldnames(rogers_path('test_GPRS.zip', 'ALL_CALLS-GPRS.txt')) is fieldnames
@@ -0,0 +1,63 @@
+import pathlib
+import pickle
+
+import pytest
+
+from anonymizer import ENCODED_DIGITS, ENC_PATTERN, TokenAllocator, Worker
+
+DATA_PATHS = [str(pathlib.Path(__file__).parent / 'data' / carrier) for carrier in ('telus', 'rogers')]
+
+
+def test_tokens_are_a_permutation() -> None:
+    allocator = TokenAllocator(b'key')
+    tokens = allocator.new_tokens(1000, set()) + [allocator.new_token(set())]
+    assert len(set(tokens)) == 1001 and allocator.count == 1001
+    assert all(ENC_PATTERN.fullmatch(encoded) for encoded in tokens)
+    assert [allocator.count_of(encoded) for encoded in tokens] == list(range(1001))
+    # The same key and count go on with the same tokens, also in another process.
+    assert TokenAllocator(b'key', 500).new_tokens(3, set()) == tokens[500:503]
+    assert pickle.loads(pickle.dumps(allocator)).new_token(set()) == allocator.new_token(set())
+    assert TokenAllocator(b'other-key').new_tokens(3, set()) != tokens[:3]
+    assert allocator.permute(10 ** ENCODED_DIGITS - 1) < 10 ** ENCODED_DIGITS
+
+
+def test_taken_tokens_are_checked_only_when_needed() -> None:
+    taken = set(TokenAllocator(b'key').new_tokens(5, set()))
+    issued_tokens = {int(encoded[4:]) for encoded in taken}
+    assert set(TokenAllocator(b'key').new_tokens(5, issued_tokens)) == taken
+    tokens = TokenAllocator(b'key', check_taken=True).new_tokens(10, issued_tokens)
+    assert len(set(tokens)) == 10 and not taken.intersection(tokens)
+
+
+def encode(output_directory: pathlib.Path, paths: list[str], jobs: int = 1) -> Worker:
+    with Worker(output_directory=str(output_directory)) as worker:
+        worker.find_files(paths, for_encode=True)
+        if (mapping_path := output_directory / Worker.MAPPING_FILE_NAME).exists():
+            worker.load_mappings(mapping_path)
+        worker.process_files(jobs=jobs)
+    return worker
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_count_is_saved_with_the_mappings(tmp_path, jobs) -> None:
+    first = encode(tmp_path, DATA_PATHS[:1], jobs)
+    assert first.token_allocator.count == len(first.encoded_mappings)
+    second = encode(tmp_path, DATA_PATHS[1:], jobs)
+    allocator = second.token_allocator
+    assert allocator.key == first.token_allocator.key and not allocator.check_taken
+    assert allocator.count == len(second.encoded_mappings) > len(first.encoded_mappings)
+    assert sorted(map(allocator.count_of, second.encoded_mappings.values())) == list(range(allocator.count))
+
+
+def test_other_tokens_are_checked(tmp_path) -> None:
+    mapping_path = tmp_path / Worker.MAPPING_FILE_NAME
+    mapping_path.write_text('a\tenc-0000000000000001\n')
+    with Worker(output_directory=str(tmp_path)) as worker:
+        worker.load_mappings(mapping_path)
+        assert worker.token_allocator.check_taken
+
+    # Mappings appended by something else than the allocator since its count was saved.
+    encode(tmp_path / 'encoded', DATA_PATHS[:1])
+    with (tmp_path / 'encoded' / Worker.MAPPING_FILE_NAME).open(mode='a', encoding='utf-8') as f:
+        f.write('b\tenc-0000000000000002\n')
+    assert encode(tmp_path / 'encoded', DATA_PATHS[1:]).token_allocator.check_taken
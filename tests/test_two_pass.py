@@ -0,0 +1,61 @@
+import pathlib
+import secrets
+import zipfile
+
+import pytest
+
+from anonymizer import Worker
+
+DATA_PATHS = [str(pathlib.Path(__file__).parent / 'data' / carrier) for carrier in ('verizon', 'at&t', 'telus', 'bell')]
+
+
+def encode(output_directory: pathlib.Path, jobs: int = 1, **kwargs) -> tuple[Worker, dict[str, bytes]]:
+    with Worker(output_directory=str(output_directory), **kwargs) as worker:
+        worker.find_files(DATA_PATHS, for_encode=True)
+        worker.process_files(jobs=jobs)
+    with zipfile.ZipFile(output_directory / 'output.zip') as output_zip:
+        outputs = {name: output_zip.read(name) for name in output_zip.namelist() if not name.endswith('.xlsx')}
+    return worker, outputs
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_two_pass_matches_single_pass(tmp_path, jobs) -> None:
+    single, single_outputs = encode(tmp_path / 'single', token_key=b'key')
+    two_pass, outputs = encode(tmp_path / 'two-pass', jobs, token_key=b'key', two_pass=True)
+    assert outputs == single_outputs
+    # Values are collected in the order of the files, same as a single pass over them finds them.
+    assert list(two_pass.encoded_mappings.items()) == list(single.encoded_mappings.items())
+    assert (tmp_path / 'two-pass' / Worker.MAPPING_FILE_NAME).read_bytes() == \
+        (tmp_path / 'single' / Worker.MAPPING_FILE_NAME).read_bytes()
+
+
+def test_random_tokens_do_not_depend_on_jobs(tmp_path, monkeypatch) -> None:
+    # Same key of the token allocator for both runs.
+    monkeypatch.setattr(secrets, 'token_bytes', lambda size: b'k' * size)
+    mappings = []
+    for jobs in (1, 3):
+        worker, _ = encode(tmp_path / str(jobs), jobs, two_pass=True)
+        mappings.append(list(worker.encoded_mappings.items()))
+    assert mappings[0] == mappings[1]
+    assert len({encoded for _, encoded in mappings[0]}) == len(mappings[0])
+
+
+
+def test_two_pass_over_archive_members(tmp_path) -> None:
+    # Members big enough that jobs of the first pass read them at the same time.
+    lines = (pathlib.Path(__file__).parent / 'data/bell/double_header_DTL.csv').read_bytes().splitlines(keepends=True)
+    content = b''.join(lines[:2] + lines[2:] * 3000)
+    archive_path = tmp_path / 'reports.zip'
+    with zipfile.ZipFile(archive_path, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for number in range(8):
+            archive.writestr(f'{number}/double_header_DTL.csv', content)
+
+    outputs = []
+    for jobs in (1, 4):
+        output_directory = tmp_path / f'output-{jobs}'
+        with Worker(output_directory=str(output_directory), token_key=b'key', two_pass=True) as worker:
+            worker.find_files([str(archive_path)], for_encode=True)
+            worker.process_files(jobs=jobs)
+        with zipfile.ZipFile(output_directory / 'output.zip') as output_zip:
+            outputs.append(sorted(output_zip.read(name) for name in output_zip.namelist()))
+    assert len(outputs[0]) == 8 and outputs[0] == outputs[1]
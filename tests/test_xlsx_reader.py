@@ -1,11 +1,15 @@
+import copy
+import datetime
 import io
 import pathlib
+import zipfile
 
 import pytest
 from openpyxl.reader.excel import load_workbook
 from openpyxl.workbook import Workbook
 
-from anonymizer import XlsxReader
+import anonymizer
+from anonymizer import ConfigFactory, NativeWorkbook, XlsxReader, ZipPath
 
 
 @pytest.fixture
@@ -46,3 +50,124 @@ def test_read_xlsx_from_bytes(xlsx_file) -> None:
     buffer = io.BytesIO(file_data)
     workbook = load_workbook(buffer, read_only=True, rich_text=True)  # noqa: rich_text missing from pyi
     assert_valid_workbook(workbook)
+
+
+@pytest.mark.parametrize('spool_threshold', [1, 1024 * 1024])
+def test_read_xlsx_from_zip(xlsx_file, monkeypatch, tmp_path, spool_threshold) -> None:
+    zip_file = tmp_path / 'bell.zip'
+    with zipfile.ZipFile(zip_file, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.write(xlsx_file, arcname=xlsx_file.name)
+
+    # Tiny threshold makes the workbook go to a temporary file.
+    monkeypatch.setattr(anonymizer, 'XLSX_SPOOL_THRESHOLD', spool_threshold)
+    config = ConfigFactory.get_config(xlsx_file.name)
+    with config.make_csv_reader_writer(ZipPath(zip_file, xlsx_file.name), config.make_destination_buffer()) as (
+        reader, _writer,
+    ):
+        lines = list(reader)
+
+    assert [line['Mobile number'] for line in lines] == [f'test-mobile-{idx}' for idx in range(1, 4)]
+
+
+def read_values(xlsx_source, xlsx_reader: str) -> list[tuple]:
+    config = ConfigFactory.get_config('test-Hardware report.xlsx')
+    monkeypatch = pytest.MonkeyPatch()
+    monkeypatch.setattr(config, 'xlsx_reader', xlsx_reader)
+    try:
+        workbook = config._load_workbook(xlsx_source)
+    finally:
+        monkeypatch.undo()
+    try:
+        return list(workbook.active.values)
+    finally:
+        workbook.close()
+
+
+def assert_same_values(xlsx_file) -> None:
+    expected = read_values(xlsx_file, 'openpyxl')
+    actual = read_values(xlsx_file, 'native')
+    assert actual == expected
+    # Types matter, too: `1 == 1.0 == True`.
+    assert [[type(value) for value in row] for row in actual] == [[type(value) for value in row] for row in expected]
+    assert [type(row) for row in actual] == [type(row) for row in expected]
+
+
+@pytest.mark.parametrize('xlsx_file', sorted((pathlib.Path(__file__).parent / 'data/bell').glob('*.xlsx')))
+def test_native_reader_matches_openpyxl(xlsx_file) -> None:
+    assert_same_values(xlsx_file)
+
+
+@pytest.mark.parametrize('write_only', [False, True])
+def test_native_reader_cell_types(tmp_path, write_only) -> None:
+    # Write-only workbook has no dimension and uses inline strings.
+    workbook = Workbook(write_only=write_only)
+    worksheet = workbook.create_sheet('Data') if write_only else workbook.active
+    worksheet.append(['text', 1, 2.5, 1e20, True, False, None, ' spaced ', 'x005F_x'])
+    worksheet.append([datetime.datetime(2023, 5, 25, 16, 35), datetime.date(2023, 5, 25), datetime.time(12, 30)])
+    worksheet.append(['=SUM(B1:C1)', '=B1', '', 0, -3])
+    worksheet.append([])
+    worksheet.append([None, None, 'last'])
+    if not write_only:
+        worksheet['E10'] = 'after a gap'
+        worksheet['B10'].number_format = 'yyyy-mm-dd'
+        worksheet['B10'] = 45000
+    xlsx_file = tmp_path / 'types.xlsx'
+    workbook.save(xlsx_file)
+
+    assert_same_values(xlsx_file)
+
+
+def test_native_reader_shared_strings(xlsx_file, tmp_path) -> None:
+    # Last strings of the document are used by the cells of the last row.
+    replacements = [
+        '<si><t xml:space="preserve"> spaced </t></si>',
+        '<si><r><t>plain </t></r><r><rPr><b/></rPr><t>bold</t></r></si>',
+        '<si><t/></si>',
+        '<si><t>x005F_x</t><rPh sb="0" eb="1"><t>ph</t></rPh></si>',
+    ]
+    changed_file = tmp_path / xlsx_file.name
+    with zipfile.ZipFile(xlsx_file) as source, zipfile.ZipFile(changed_file, mode='w') as target:
+        for info in source.infolist():
+            content = source.read(info)
+            if info.filename == 'xl/sharedStrings.xml':
+                head, *strings = content.decode().split('<si>')
+                strings[-len(replacements):] = [replacement[len('<si>'):] for replacement in replacements]
+                content = ('<si>'.join([head, *strings]) + '</sst>').encode()
+            target.writestr(info, content)
+
+    assert_same_values(changed_file)
+
+
+def test_native_reader_from_zip(xlsx_file, tmp_path) -> None:
+    zip_file = tmp_path / 'bell.zip'
+    with zipfile.ZipFile(zip_file, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.write(xlsx_file, arcname=xlsx_file.name)
+
+    config = copy.copy(ConfigFactory.get_config(xlsx_file.name))
+    assert config.xlsx_reader == 'openpyxl'
+    config.xlsx_reader = 'native'
+    with config.make_csv_reader_writer(ZipPath(zip_file, xlsx_file.name), config.make_destination_buffer()) as (
+        reader, _writer,
+    ):
+        lines = list(reader)
+
+    assert [line['Mobile number'] for line in lines] == [f'test-mobile-{idx}' for idx in range(1, 4)]
+
+
+def load_native(xlsx_file: pathlib.Path):
+    config = copy.copy(ConfigFactory.get_config(xlsx_file.name))
+    config.xlsx_reader = 'native'
+    return config._load_workbook(xlsx_file)
+
+
+def test_native_reader_falls_back_to_openpyxl(xlsx_file, monkeypatch) -> None:
+    assert NativeWorkbook.is_supported()
+    workbook = load_native(xlsx_file)
+    assert isinstance(workbook, NativeWorkbook)
+    workbook.close()
+
+    # As if openpyxl didn't have the private parts the native reader uses.
+    monkeypatch.setattr(NativeWorkbook, 'SUPPORTED', False)
+    workbook = load_native(xlsx_file)
+    assert isinstance(workbook, Workbook)
+    workbook.close()
@@ -1,10 +1,13 @@
 import io
 import pathlib
+import zipfile
 
 from openpyxl.reader.excel import load_workbook
 from openpyxl.workbook import Workbook
 
-from anonymizer import XlsxReader, XlsxWriter
+from anonymizer import ENC_PATTERN, Worker, XlsxReader, XlsxWriter
+
+BELL_FILE = pathlib.Path(__file__).parent / 'data' / 'bell' / 'test-Cost overview.xlsx'
 
 
 def test_xlsx_writer(fake_fs):
@@ -43,6 +46,28 @@ def test_xlsx_writer(fake_fs):
     assert_workbook(file_workbook)
 
     # Also check loading only from a binary representation of the file.
-    buffer = pathlib.Path(output_file).read_bytes()
-    binary_workbook = load_workbook(io.BytesIO(buffer), read_only=True, rich_text=True)  # noqa: rich_text missing from pyi
+    buffer = io.BytesIO(pathlib.Path(output_file).read_bytes())
+    binary_workbook = load_workbook(buffer, read_only=True, rich_text=True)  # noqa: rich_text missing from pyi
     assert_workbook(binary_workbook)
+
+
+def test_encoded_workbook(tmp_path) -> None:
+    with Worker(output_directory=str(tmp_path), token_key=b'key') as worker:
+        worker.find_files([str(BELL_FILE)], for_encode=True)
+        worker.process_files()
+    with zipfile.ZipFile(tmp_path / 'output.zip') as output_zip:
+        output_workbook = load_workbook(io.BytesIO(output_zip.read(BELL_FILE.name)), read_only=True)
+    input_workbook = load_workbook(BELL_FILE, read_only=True)
+    assert output_workbook.sheetnames == input_workbook.sheetnames
+    input_rows, output_rows = list(input_workbook.active.values), list(output_workbook.active.values)
+    assert len(output_rows) == len(input_rows) and output_rows[0] == input_rows[0]
+
+    # Rows are padded to the width of the sheet, including their trailing empty cells.
+    assert [len(row) for row in output_rows] == [len(row) for row in input_rows] == [84] * 10
+    header = input_rows[0]
+    for input_row, output_row in zip(input_rows[1:], output_rows[1:]):
+        row = dict(zip(header, output_row))
+        assert ENC_PATTERN.fullmatch(row['Mobile number']) and ENC_PATTERN.fullmatch(row['User last name'])
+        for input_value, output_value in zip(input_row, output_row):
+            assert output_value in (input_value, None) or ENC_PATTERN.fullmatch(output_value)
+    assert [row[header.index('Total invoice')] for row in output_rows[1:4]] == [58.76, 53.11, 53.11]
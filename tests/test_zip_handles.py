@@ -0,0 +1,108 @@
+import io
+import pathlib
+import pickle
+import zipfile
+
+import pytest
+
+from anonymizer import ZIP_HANDLES, Worker, ZipPath
+
+TELUS_FILE = pathlib.Path(__file__).parent / 'data/telus/Account_Detail_test.txt'
+
+
+def make_nested_archive(path: pathlib.Path, compression: int) -> None:
+    inner = io.BytesIO()
+    with zipfile.ZipFile(inner, mode='w', compression=zipfile.ZIP_DEFLATED) as inner_zip:
+        inner_zip.write(TELUS_FILE, f'reports/{TELUS_FILE.name}')
+        inner_zip.writestr('notes.txt', 'nothing to see')
+    with zipfile.ZipFile(path, mode='w', compression=compression) as outer_zip:
+        outer_zip.writestr('readme.txt', 'outer')
+        outer_zip.writestr('nested/inner.zip', inner.getvalue())
+
+
+@pytest.fixture
+def worker(tmp_path):
+    with Worker(output_directory=str(tmp_path / 'output')) as worker:
+        yield worker
+
+
+@pytest.mark.parametrize('compression', [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED])
+def test_nested_archive_members(tmp_path, worker, compression) -> None:
+    outer_path = tmp_path / 'outer.zip'
+    make_nested_archive(outer_path, compression)
+
+    files = worker._list_files([str(outer_path)])
+    assert [str(path) for path in files] == [
+        f'{outer_path}/readme.txt',
+        f'{outer_path}/nested/inner.zip/notes.txt',
+        f'{outer_path}/nested/inner.zip/reports/{TELUS_FILE.name}',
+    ]
+
+    member = files[-1]
+    assert member.archive_chain == (str(outer_path), 'nested/inner.zip')
+    assert member.stat().st_size == TELUS_FILE.stat().st_size
+    with member.open(mode='rb') as f:
+        assert f.read() == TELUS_FILE.read_bytes()
+
+    # Pool processes reopen the archives by their chain.
+    restored = pickle.loads(pickle.dumps(member))
+    assert str(restored) == str(member) and restored.read_bytes() == TELUS_FILE.read_bytes()
+
+
+def test_members_share_a_handle(tmp_path, worker) -> None:
+    outer_path = tmp_path / 'outer.zip'
+    make_nested_archive(outer_path, zipfile.ZIP_STORED)
+
+    first, second = ZipPath(outer_path, 'readme.txt'), ZipPath(str(outer_path), 'nested/inner.zip')
+    assert first.root is second.root is ZIP_HANDLES.get((str(outer_path),))
+    assert second.open_archive().root is ZIP_HANDLES.get((str(outer_path), 'nested/inner.zip'))
+
+    ZIP_HANDLES.close()
+    assert ZipPath(outer_path).root is not first.root
+
+
+def test_nested_archive_is_processed(tmp_path) -> None:
+    outer_path = tmp_path / 'outer.zip'
+    make_nested_archive(outer_path, zipfile.ZIP_DEFLATED)
+
+    outputs = []
+    for jobs in (1, 2):
+        output_directory = tmp_path / f'output-{jobs}'
+        with Worker(output_directory=str(output_directory), token_key=b'secret') as worker:
+            worker.find_files([str(outer_path)], for_encode=True)
+            worker.process_files(jobs=jobs)
+        with zipfile.ZipFile(output_directory / 'output.zip') as output_zip:
+            outputs.append({name: output_zip.read(name) for name in output_zip.namelist()})
+
+    assert list(outputs[0]) == [TELUS_FILE.name]
+    assert outputs[0] == outputs[1]
+
+
+def test_archive_members_are_read_by_many_jobs(tmp_path) -> None:
+    # Members big enough that jobs read them at the same time.
+    lines = (pathlib.Path(__file__).parent / 'data/bell/double_header_DTL.csv').read_bytes().splitlines(keepends=True)
+    content = b''.join(lines[:2] + lines[2:] * 2000)
+    archive_path = tmp_path / 'reports.zip'
+    with zipfile.ZipFile(archive_path, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for number in range(8):
+            archive.writestr(f'{number}/double_header_DTL.csv', content)
+
+    outputs = []
+    for jobs in (1, 4):
+        output_directory = tmp_path / f'output-{jobs}'
+        with Worker(output_directory=str(output_directory), token_key=b'secret') as worker:
+            worker.find_files([str(archive_path)], for_encode=True)
+            worker.process_files(jobs=jobs)
+        with zipfile.ZipFile(output_directory / 'output.zip') as output_zip:
+            outputs.append(sorted(output_zip.read(name) for name in output_zip.namelist()))
+    assert len(outputs[0]) == 8 and outputs[0] == outputs[1]
+
+
+def test_members_can_be_read_after_the_worker_exits(tmp_path) -> None:
+    outer_path = tmp_path / 'outer.zip'
+    make_nested_archive(outer_path, zipfile.ZIP_DEFLATED)
+    with Worker(output_directory=str(tmp_path / 'output')) as worker:
+        files = worker._list_files([str(outer_path)])
+    assert files[-1].read_bytes() == TELUS_FILE.read_bytes()
+    # Archives are opened again for whatever comes next.
+    assert ZipPath(outer_path).root is not files[0].root
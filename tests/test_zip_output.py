@@ -0,0 +1,72 @@
+import itertools
+import pathlib
+import zipfile
+
+import pytest
+
+from anonymizer import Worker, copy_zip_member, open_zip_member
+
+DATA_DIRECTORY = pathlib.Path(__file__).parent / 'data'
+
+
+def test_streamed_member(fake_fs) -> None:
+    with zipfile.ZipFile('output.zip', mode='w', compression=zipfile.ZIP_DEFLATED) as output_zip:
+        with open_zip_member(output_zip, 'member.txt') as stream:
+            for idx in range(1000):
+                stream.write(f'line {idx}\n'.encode())
+
+    with zipfile.ZipFile('output.zip') as output_zip:
+        assert output_zip.testzip() is None
+        lines = output_zip.read('member.txt').decode().splitlines()
+    assert lines == [f'line {idx}' for idx in range(1000)]
+
+
+def test_copy_zip_member(fake_fs) -> None:
+    content = b'some content\n' * 1000
+    with zipfile.ZipFile('source.zip', mode='w', compression=zipfile.ZIP_DEFLATED) as source_zip:
+        source_zip.writestr('first.txt', content)
+        source_zip.writestr('second.txt', content[::-1])
+
+    with zipfile.ZipFile('source.zip') as source_zip, \
+            zipfile.ZipFile('target.zip', mode='w', compression=zipfile.ZIP_STORED) as target_zip:
+        target_zip.writestr('existing.txt', b'existing')
+        for info in source_zip.infolist():
+            copy_zip_member(source_zip, info, target_zip)
+        target_zip.writestr('last.txt', b'last')
+
+    with zipfile.ZipFile('target.zip') as target_zip:
+        assert target_zip.testzip() is None
+        assert target_zip.namelist() == ['existing.txt', 'first.txt', 'second.txt', 'last.txt']
+        # Copied members keep the original compression.
+        assert target_zip.getinfo('first.txt').compress_type == zipfile.ZIP_DEFLATED
+        assert target_zip.read('first.txt') == content
+        assert target_zip.read('second.txt') == content[::-1]
+        assert target_zip.read('last.txt') == b'last'
+
+
+@pytest.mark.parametrize('compression_threads', [1, 2])
+def test_failed_output_is_left_out(tmp_path, monkeypatch, compression_threads) -> None:
+    lines = (DATA_DIRECTORY / 'bell' / 'double_header_DTL.csv').read_bytes().splitlines(keepends=True)
+    input_path = tmp_path / 'input' / 'double_header_DTL.csv'
+    input_path.parent.mkdir()
+    input_path.write_bytes(b''.join(lines[:2] + lines[2:] * 2000))
+    encode_value = Worker.encode_value
+    calls = itertools.count()
+
+    def failing_encode_value(worker: Worker, value: str) -> str:
+        if next(calls) == 5000:
+            raise RuntimeError('failed halfway')
+        return encode_value(worker, value)
+
+    monkeypatch.setattr(Worker, 'encode_value', failing_encode_value)
+    output_directory = tmp_path / 'output'
+    with pytest.raises(RuntimeError, match='failed halfway'):
+        with Worker(str(output_directory), token_key=b'key', compression_threads=compression_threads) as worker:
+            worker.find_files([str(input_path)], for_encode=True)
+            worker.process_files()
+
+    with zipfile.ZipFile(output_directory / 'output.zip') as output_zip:
+        assert output_zip.testzip() is None
+        assert output_zip.namelist() == []
+    # What was written of the member is cut off, too.
+    assert (output_directory / 'output.zip').stat().st_size < 1024